@@ -10,6 +10,7 @@ from datetime import datetime, timedelta
 import requests
 from io import BytesIO
 from PIL import Image
+from http_client import get_client
 
 # Initialize Flask app
 app = Flask(__name__)
@@ -337,7 +338,7 @@ def predict_image():
         
         # Forward to predict service
         files = {'image': (file.filename, file.stream, file.content_type)}
-        response = requests.post(f'{PREDICT_SERVICE_URL}/predict', files=files, timeout=30)
+        response = get_client().post(f'{PREDICT_SERVICE_URL}/predict', files=files, timeout=30)
         
         if response.status_code == 200:
             return jsonify(response.json()), 200
@@ -366,7 +367,7 @@ def health():
 def status():
     """Get API and services status"""
     try:
-        predict_health = requests.get(f'{PREDICT_SERVICE_URL}/health', timeout=5).json()
+        predict_health = get_client().get(f'{PREDICT_SERVICE_URL}/health', timeout=5, retries=0).json()
     except:
         predict_health = {"status": "unavailable"}
 
@@ -374,6 +375,7 @@ def status():
         "api": {"status": "ok"},
         "predict_service": predict_health,
         "database": "ok",
+        "outbound_http": get_client().stats(),
         "timestamp": datetime.utcnow().isoformat()
     }), 200
 
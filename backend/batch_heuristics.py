@@ -0,0 +1,91 @@
+"""
+Marine DB Batch Heuristics
+Water detection and the color heuristic for a whole (N, H, W, 3) image stack at once
+"""
+
+import numpy as np
+
+WATER_REASONS = (
+    "",
+    "Blue dominant (ocean/sea water)",
+    "Blue-green water (tropical/pool)",
+    "Dark blue water",
+    "Light blue/cyan water",
+)
+
+LABELS = np.array(['plastic', 'oil_spill', 'undetected'])
+
+
+class BatchHeuristics:
+    """
+    Per-image statistics, water flags and heuristic scores for a stack.
+
+    Mirrors predict_service.analyze_water and heuristic_prediction. Channel
+    means come from exact integer sums over the uint8 stack (summing whole
+    pixel rows first keeps the reduction contiguous), so they can differ from
+    the scalar float32 means in the 7th significant digit; every decision
+    then runs in float64 on the same formulas. Parity with the scalar code
+    is checked by benchmarks/check_batch_heuristics_parity.py.
+
+    Attributes are length-N arrays: mean_brightness, r_mean, g_mean, b_mean,
+    red_ratio, green_ratio, blue_ratio, is_water_like, water_code (index
+    into WATER_REASONS), darkness, redness, p_plastic, p_oil, label.
+    """
+
+    def __init__(self, stack, plastic_threshold, oil_threshold, none_threshold):
+        stack = np.asarray(stack)
+        if stack.ndim != 4 or stack.shape[-1] != 3 or stack.dtype != np.uint8:
+            raise ValueError(f"Expected an (N, H, W, 3) uint8 stack, got {stack.dtype} {stack.shape}")
+        n, h, w, _ = stack.shape
+        # (N, H, W*3) -> sum over rows -> (N, W, 3) -> sum over columns; uint32 holds H*W*255
+        sums = stack.reshape(n, h, w * 3).sum(axis=1, dtype=np.uint32).reshape(n, w, 3).sum(axis=1)
+        means = sums / (h * w * 255.0)
+        r = self.r_mean = means[:, 0]
+        g = self.g_mean = means[:, 1]
+        b = self.b_mean = means[:, 2]
+        bright = self.mean_brightness = sums.sum(axis=1) / (h * w * 3 * 255.0)
+
+        total = r + g + b + 1e-6
+        self.blue_ratio = b / total
+        self.green_ratio = g / total
+        self.red_ratio = r / total
+
+        # same conditions, same order as analyze_water (first match wins)
+        conditions = [
+            (b > r) & (b > g * 0.9) & (r < 0.35),
+            (b > 0.25) & (g > 0.25) & (r < 0.3) & ((b + g) > r * 2),
+            (b > r * 1.3) & (b > g) & (bright < 0.5) & (r < 0.25),
+            (self.blue_ratio > 0.38) & (self.red_ratio < 0.28) & (bright > 0.4),
+        ]
+        self.water_code = np.select(conditions, [1, 2, 3, 4], 0)
+        self.is_water_like = self.water_code > 0
+
+        # heuristic_prediction
+        self.darkness = 1.0 - bright
+        self.redness = np.maximum(0.0, r - np.maximum(g, b)) * 3
+        self.p_plastic = np.clip(self.redness * 0.8 + bright * 0.2, 0.0, 1.0)
+        self.p_oil = np.clip(self.darkness * 0.7 + (1 - self.blue_ratio) * 0.3, 0.0, 1.0)
+        p, o = self.p_plastic, self.p_oil
+        plastic = (p >= plastic_threshold) & (p > o)
+        oil = ~plastic & (o >= oil_threshold)
+        none = ~plastic & ~oil & (np.maximum(p, o) < none_threshold)
+        fallback = np.where(p >= o, 0, 1)
+        self.label = LABELS[np.select([plastic, oil, none], [0, 1, 2], fallback)]
+
+    def __len__(self):
+        return len(self.water_code)
+
+    def water_reason(self, i):
+        return WATER_REASONS[int(self.water_code[i])]
+
+    def stats(self, i):
+        """Row i as the dict analyze_water returns."""
+        return {
+            "mean_brightness": float(self.mean_brightness[i]),
+            "r_mean": float(self.r_mean[i]),
+            "g_mean": float(self.g_mean[i]),
+            "b_mean": float(self.b_mean[i]),
+            "blue_ratio": float(self.blue_ratio[i]),
+            "is_water_like": bool(self.is_water_like[i]),
+            "water_reason": self.water_reason(i),
+        }
@@ -0,0 +1,250 @@
+"""
+Marine DB Batch Jobs
+Asynchronous, restart-safe batch prediction jobs for large URL sets
+"""
+
+import json
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+import uuid
+from datetime import datetime
+
+ACTIVE_STATES = ('queued', 'running')
+FINAL_STATES = ('completed', 'failed', 'cancelled')
+
+
+class JobManager:
+    """
+    In-process worker pool for batch prediction jobs.
+
+    Each job lives in <jobs_dir>/<job_id>/:
+      urls.txt        input URLs, one per line (never loaded whole into memory)
+      state.json      progress, rewritten atomically after every chunk
+      results.ndjson  one JSON line per URL, appended as chunks complete
+
+    Workers read chunk_size URLs at a time, call process_chunk(urls) -> list of
+    result dicts (same order), append them and then advance the cursor in
+    state.json. Memory per job is bounded by chunk_size. Jobs that were queued
+    or running when the process stopped are resumed from their cursor on start,
+    after truncating results.ndjson back to the last committed offset.
+    """
+
+    def __init__(self, jobs_dir, process_chunk, workers=2, chunk_size=20):
+        self.jobs_dir = jobs_dir
+        self.process_chunk = process_chunk
+        self.chunk_size = max(1, int(chunk_size))
+
+        self._lock = threading.Lock()
+        self._states = {}  # job_id -> state dict (small, no URLs/results)
+        self._queue = queue.Queue()
+
+        os.makedirs(jobs_dir, exist_ok=True)
+        self._recover()
+
+        self._workers = []
+        for i in range(max(1, int(workers))):
+            t = threading.Thread(target=self._run, name=f"batch-job-worker-{i}", daemon=True)
+            t.start()
+            self._workers.append(t)
+
+    # ---------- public API ----------
+
+    def submit(self, urls):
+        """
+        Create a job for an iterable of URLs and queue it; returns the state dict.
+        Raises ValueError, leaving nothing behind, if urls is empty.
+        """
+        job_id = uuid.uuid4().hex
+        job_dir = self._job_dir(job_id)
+        os.makedirs(job_dir)
+        total = 0
+        try:
+            with open(os.path.join(job_dir, 'urls.txt'), 'w', encoding='utf-8') as f:
+                for url in urls:
+                    f.write(str(url).replace('\n', ' ').strip() + '\n')
+                    total += 1
+        except BaseException:
+            shutil.rmtree(job_dir, ignore_errors=True)
+            raise
+        if total == 0:
+            shutil.rmtree(job_dir, ignore_errors=True)
+            raise ValueError("A batch job needs at least one URL")
+        open(os.path.join(job_dir, 'results.ndjson'), 'wb').close()
+
+        now = datetime.utcnow().isoformat()
+        state = {
+            "job_id": job_id,
+            "status": "queued",
+            "total": total,
+            "completed": 0,
+            "succeeded": 0,
+            "failed": 0,
+            "cursor_bytes": 0,    # offset into urls.txt of the next unprocessed URL
+            "results_bytes": 0,   # committed length of results.ndjson
+            "created": now,
+            "updated": now,
+            "error": None
+        }
+        with self._lock:
+            self._states[job_id] = state
+            self._save(state)
+        self._queue.put(job_id)
+        logging.info("Batch job %s queued (%d URLs)", job_id, total)
+        return dict(state)
+
+    def get(self, job_id):
+        with self._lock:
+            state = self._states.get(job_id)
+            return dict(state) if state else None
+
+    def list(self):
+        with self._lock:
+            return sorted((dict(s) for s in self._states.values()), key=lambda s: s["created"], reverse=True)
+
+    def cancel(self, job_id):
+        with self._lock:
+            state = self._states.get(job_id)
+            if state is None:
+                return None
+            if state["status"] in ACTIVE_STATES:
+                self._update(state, status='cancelled')
+            return dict(state)
+
+    def iter_results(self, job_id, poll_interval=0.5, offset=0):
+        """
+        Yield result lines (str, without newline) from byte offset on,
+        following the file until the job reaches a final state.
+        """
+        path = os.path.join(self._job_dir(job_id), 'results.ndjson')
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            while True:
+                with self._lock:
+                    state = self._states.get(job_id)
+                    committed = state["results_bytes"] if state else 0
+                    finished = state is None or state["status"] in FINAL_STATES
+                # only read what a worker has committed to state.json
+                while f.tell() < committed:
+                    line = f.readline()
+                    if not line:
+                        break
+                    yield line.decode('utf-8').rstrip('\n')
+                if finished and f.tell() >= committed:
+                    return
+                time.sleep(poll_interval)
+
+    # ---------- worker ----------
+
+    def _run(self):
+        while True:
+            job_id = self._queue.get()
+            try:
+                self._process(job_id)
+            except Exception as e:
+                logging.exception("Batch job %s failed", job_id)
+                with self._lock:
+                    state = self._states.get(job_id)
+                    if state is not None:
+                        self._update(state, status='failed', error=str(e))
+
+    def _process(self, job_id):
+        with self._lock:
+            state = self._states.get(job_id)
+            if state is None or state["status"] not in ACTIVE_STATES:
+                return
+            self._update(state, status='running')
+            cursor = state["cursor_bytes"]
+            index = state["completed"]
+
+        job_dir = self._job_dir(job_id)
+        with open(os.path.join(job_dir, 'urls.txt'), 'rb') as urls_file, \
+                open(os.path.join(job_dir, 'results.ndjson'), 'ab') as results_file:
+            urls_file.seek(cursor)
+            while True:
+                with self._lock:
+                    if state["status"] == 'cancelled':
+                        logging.info("Batch job %s cancelled at %d/%d", job_id, state["completed"], state["total"])
+                        return
+
+                chunk = []
+                for _ in range(self.chunk_size):
+                    line = urls_file.readline()
+                    if not line:
+                        break
+                    chunk.append(line.decode('utf-8').rstrip('\n'))
+                if not chunk:
+                    break
+
+                results = self.process_chunk(chunk)
+                data = b''.join(
+                    (json.dumps(dict(r, index=index + i)) + '\n').encode('utf-8')
+                    for i, r in enumerate(results))
+                results_file.write(data)
+                results_file.flush()
+                os.fsync(results_file.fileno())
+
+                ok = sum(1 for r in results if r.get('success'))
+                index += len(chunk)
+                with self._lock:
+                    self._update(state,
+                                 completed=index,
+                                 succeeded=state["succeeded"] + ok,
+                                 failed=state["failed"] + len(chunk) - ok,
+                                 cursor_bytes=urls_file.tell(),
+                                 results_bytes=state["results_bytes"] + len(data))
+
+        with self._lock:
+            if state["status"] == 'running':
+                self._update(state, status='completed')
+        logging.info("Batch job %s completed (%d ok, %d failed)", job_id, state["succeeded"], state["failed"])
+
+    # ---------- persistence (lock held) ----------
+
+    def _job_dir(self, job_id):
+        # job ids are uuid4 hex; reject anything else to keep paths inside jobs_dir
+        if not job_id or not all(c in '0123456789abcdef' for c in job_id):
+            raise ValueError(f"Invalid job id: {job_id!r}")
+        return os.path.join(self.jobs_dir, job_id)
+
+    def _update(self, state, **changes):
+        state.update(changes)
+        state["updated"] = datetime.utcnow().isoformat()
+        self._save(state)
+
+    def _save(self, state):
+        path = os.path.join(self._job_dir(state["job_id"]), 'state.json')
+        tmp = path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp, path)
+
+    def _recover(self):
+        """Load job states from disk and re-queue unfinished jobs."""
+        resumed = []
+        for job_id in os.listdir(self.jobs_dir):
+            path = os.path.join(self.jobs_dir, job_id, 'state.json')
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    state = json.load(f)
+            except (OSError, ValueError):
+                continue
+            self._states[state["job_id"]] = state
+            if state["status"] in ACTIVE_STATES:
+                # drop results written after the last committed state update
+                results_path = os.path.join(self.jobs_dir, job_id, 'results.ndjson')
+                try:
+                    with open(results_path, 'ab') as rf:
+                        rf.truncate(state["results_bytes"])
+                except OSError:
+                    logging.exception("Could not truncate results for job %s", job_id)
+                state["status"] = 'queued'
+                self._save(state)
+                resumed.append((state["created"], state["job_id"]))
+        for _, job_id in sorted(resumed):
+            self._queue.put(job_id)
+        if resumed:
+            logging.info("Resuming %d unfinished batch job(s)", len(resumed))
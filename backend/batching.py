@@ -0,0 +1,157 @@
+"""
+Marine DB Micro-Batching
+Merges concurrent single-image model calls into one stacked batch per model
+"""
+
+import logging
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import Future
+from contextlib import nullcontext
+
+import numpy as np
+
+
+class MicroBatcher:
+    """
+    Background micro-batcher around a batch predict function.
+
+    Callers submit arrays with a leading batch dimension (usually 1) and block
+    until their rows of the output are ready. predict_fn may return a single
+    array or a list/tuple of arrays (multi-output models); callers then get a
+    tuple with their rows of each output. A worker thread waits for the
+    first pending request, then keeps collecting until either max_batch_size
+    samples are queued or max_wait_ms has elapsed, runs predict_fn once on the
+    stacked tensor and fans the rows back out to each waiting request.
+
+    pack, if given, builds the batch from the list of submitted arrays instead
+    of np.concatenate: a context manager factory such as
+    model_input.InputPacker.pack, whose pooled buffer is held while
+    predict_fn runs and returned afterwards.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=16, max_wait_ms=10.0, name='model', pack=None):
+        self.predict_fn = predict_fn
+        self.pack = pack
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.name = name
+
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+
+        self._stats_lock = threading.Lock()
+        self._batch_sizes = Counter()
+        self._batches = 0
+        self._samples = 0
+        self._max_queue_depth = 0
+
+        self._thread = threading.Thread(target=self._run, name=f"batcher-{name}", daemon=True)
+        self._thread.start()
+
+    def submit(self, x, timeout=None):
+        """Queue x (shape (n, ...)) and block until its n output rows are ready."""
+        return self.submit_async(x).result(timeout=timeout)
+
+    def submit_async(self, x):
+        """Queue x (shape (n, ...)) and return a Future for its n output rows."""
+        x = np.asarray(x)
+        if x.ndim == 0:
+            raise ValueError("MicroBatcher.submit expects an array with a batch dimension")
+        fut = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError(f"Batcher '{self.name}' is closed")
+            self._queue.append((x, fut))
+            depth = len(self._queue)
+            self._cond.notify()
+        with self._stats_lock:
+            self._max_queue_depth = max(self._max_queue_depth, depth)
+        return fut
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout=5)
+
+    def _collect(self):
+        """Wait for work and return the list of (x, future) pairs for one batch."""
+        with self._cond:
+            while not self._queue and not self._closed:
+                self._cond.wait()
+            if not self._queue:
+                return []
+
+            deadline = time.monotonic() + self.max_wait
+            while True:
+                queued = sum(len(x) for x, _ in self._queue)
+                remaining = deadline - time.monotonic()
+                if queued >= self.max_batch_size or remaining <= 0 or self._closed:
+                    break
+                self._cond.wait(remaining)
+
+            items = [self._queue.popleft()]
+            total = len(items[0][0])
+            while self._queue and total + len(self._queue[0][0]) <= self.max_batch_size:
+                x, fut = self._queue.popleft()
+                items.append((x, fut))
+                total += len(x)
+            return items
+
+    def _run(self):
+        while True:
+            items = self._collect()
+            if not items:
+                return
+
+            sizes = [len(x) for x, _ in items]
+            try:
+                if self.pack is not None:
+                    packed = self.pack([x for x, _ in items])
+                elif len(items) == 1:
+                    packed = nullcontext(items[0][0])
+                else:
+                    packed = nullcontext(np.concatenate([x for x, _ in items], axis=0))
+                with packed as batch:
+                    out = self.predict_fn(batch)
+                    multi = isinstance(out, (list, tuple))
+                    outputs = [np.asarray(o) for o in out] if multi else [np.asarray(out)]
+                for o in outputs:
+                    if len(o) != sum(sizes):
+                        raise RuntimeError(f"{self.name}: expected {sum(sizes)} outputs, got {len(o)}")
+            except Exception as e:
+                logging.exception("Batched inference failed for %s (batch=%d)", self.name, sum(sizes))
+                for _, fut in items:
+                    fut.set_exception(e)
+                continue
+
+            offset = 0
+            for (_, fut), n in zip(items, sizes):
+                rows = tuple(o[offset:offset + n] for o in outputs)
+                fut.set_result(rows if multi else rows[0])
+                offset += n
+
+            with self._stats_lock:
+                self._batch_sizes[offset] += 1
+                self._batches += 1
+                self._samples += offset
+
+    def stats(self):
+        """Queue depth and batch-size histogram for monitoring."""
+        with self._cond:
+            depth = len(self._queue)
+        with self._stats_lock:
+            return {
+                "name": self.name,
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000.0,
+                "queue_depth": depth,
+                "max_queue_depth": self._max_queue_depth,
+                "batches": self._batches,
+                "samples": self._samples,
+                "mean_batch_size": round(self._samples / self._batches, 3) if self._batches else 0.0,
+                "batch_size_histogram": {str(k): v for k, v in sorted(self._batch_sizes.items())},
+            }
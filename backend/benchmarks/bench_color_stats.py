@@ -0,0 +1,65 @@
+"""
+Micro-benchmark: per-pixel colorsys saturation loop vs color_stats.mean_saturation.
+
+Usage: python benchmarks/bench_color_stats.py [--repeat N] [--min-speedup X]
+Exits non-zero if results differ or the speedup is below --min-speedup (default 50x).
+"""
+
+import argparse
+import colorsys
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from color_stats import mean_saturation  # noqa: E402
+
+
+def loop_mean_saturation(arr):
+    """The original is_pure_water_only implementation."""
+    sats = []
+    for pix in arr.reshape(-1, 3):
+        hsv = colorsys.rgb_to_hsv(float(pix[0]), float(pix[1]), float(pix[2]))
+        sats.append(hsv[1])
+    return float(np.mean(sats)) if sats else 0.0
+
+
+def best_of(fn, arr, repeat):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn(arr)
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--min-speedup', type=float, default=50.0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    ok = True
+    for side in (128, 1024):
+        arr = rng.integers(0, 256, size=(side, side, 3), dtype=np.uint8).astype(np.float32) / 255.0
+        # include some grey pixels so the zero-chroma branch is exercised
+        arr[::7, ::7] = arr[::7, ::7, :1]
+
+        loop_t, loop_v = best_of(loop_mean_saturation, arr, 1 if side > 256 else args.repeat)
+        vec_t, vec_v = best_of(mean_saturation, arr, args.repeat * 10)
+        speedup = loop_t / vec_t if vec_t > 0 else float('inf')
+        same = loop_v == vec_v
+        print(f"{side}x{side}: loop={loop_t * 1e3:9.2f} ms  vectorized={vec_t * 1e3:7.3f} ms  "
+              f"speedup={speedup:8.1f}x  identical={same}")
+        if not same or speedup < args.min_speedup:
+            ok = False
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+Full-resolution decode + resize vs image_decode's reduced-size decode.
+
+Usage: python benchmarks/bench_decode.py [--size 4032x3024] [--images 10] [--repeat 3]
+Generates photo-like JPEGs (one with EXIF orientation 6) and a PNG, then
+decodes each to the 224x224 model input and the 128x128 water thumbnail the
+old way (Image.open().convert('RGB').resize()) and with
+image_decode.decode_array(). Prints images/s and the mean absolute pixel
+difference between the two paths.
+
+Then times one prediction request's image work (water check, purity check and
+model tensor) as separate convert/resize calls on a full decode, against one
+ImagePipeline that derives each representation once.
+"""
+
+import argparse
+import io
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from image_decode import decode_array  # noqa: E402
+from image_pipeline import ImagePipeline  # noqa: E402
+
+
+def photo(seed, size, fmt='JPEG', orientation=None):
+    rng = np.random.default_rng(seed)
+    w, h = size
+    small = rng.integers(0, 255, (h // 40, w // 40, 3), dtype=np.uint8)
+    arr = np.asarray(Image.fromarray(small).resize((w, h), Image.BICUBIC), dtype=np.float32)
+    arr = np.clip(arr + rng.normal(0, 12, arr.shape), 0, 255).astype(np.uint8)
+    img = Image.fromarray(arr)
+    buf = io.BytesIO()
+    if orientation:
+        exif = img.getexif()
+        exif[0x0112] = orientation
+        img.save(buf, fmt, quality=90, exif=exif)
+    else:
+        img.save(buf, fmt, **({'quality': 90} if fmt == 'JPEG' else {}))
+    return buf.getvalue()
+
+
+def baseline(content, size):
+    return np.asarray(Image.open(io.BytesIO(content)).convert('RGB').resize(size))
+
+
+def request_separate(content, _):
+    img = Image.open(io.BytesIO(content)).convert('RGB')
+    for size in ((128, 128), (224, 224), (128, 128)):  # analyze_water, model input, is_pure_water_only
+        np.array(img.convert('RGB').resize(size), dtype=np.float32) / 255.0
+
+
+def request_pipeline(content, _):
+    img = ImagePipeline.decode(content, min_size=(224, 224))
+    for size in ((128, 128), (224, 224), (128, 128)):
+        img.float_array(size)
+    img.model_input((224, 224))
+
+
+def bench(fn, images, size, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for content in images:
+            fn(content, size)
+        best = min(best, time.perf_counter() - t0)
+    return len(images) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size', default='4032x3024')
+    parser.add_argument('--images', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    size = tuple(int(v) for v in args.size.lower().split('x'))
+
+    print(f"Generating {args.images} {size[0]}x{size[1]} JPEGs and one PNG...")
+    sets = {
+        'jpeg': [photo(i, size) for i in range(args.images)],
+        'jpeg exif=6': [photo(100, size, orientation=6)],
+        'png': [photo(200, size, 'PNG')],
+    }
+    print(f"\n{'input':12s} {'target':>8s} {'full img/s':>11s} {'fast img/s':>11s} {'speedup':>8s} {'mean |diff|':>12s}")
+    for name, images in sets.items():
+        for target in ((224, 224), (128, 128)):
+            full = bench(baseline, images, target, args.repeat)
+            fast = bench(lambda c, s: decode_array(c, s), images, target, args.repeat)
+            ref = baseline(images[0], target).astype(np.int16)
+            out = decode_array(images[0], target, exif_transpose=False).astype(np.int16)
+            diff = float(np.abs(ref - out).mean())
+            print(f"{name:12s} {f'{target[0]}x{target[1]}':>8s} {full:11.1f} {fast:11.1f} "
+                  f"{fast / full:7.1f}x {diff:12.2f}")
+
+    print(f"\n{'per request':12s} {'separate':>11s} {'pipeline':>11s} {'speedup':>8s}")
+    for name, images in sets.items():
+        old = bench(request_separate, images, None, args.repeat)
+        new = bench(request_pipeline, images, None, args.repeat)
+        print(f"{name:12s} {old:9.1f}/s {new:9.1f}/s {new / old:7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+"""
+Sequential vs hedged gateway fetch against local stand-in IPFS gateways.
+
+Usage: python benchmarks/bench_gateway_fetch.py [--timeout 5] [--repeat 5]
+Each stand-in gateway is a local HTTP server with an injected behaviour
+(delay, status code, non-image body or a hang). Every scenario is fetched with
+gateway_fetch.sequential_fetch (the old strategy), then with HedgedFetcher
+and an empty GatewayRegistry ("cold"), then with a registry shared by all
+scenarios after a warm-up pass ("warm", as the service runs). The warm
+registry's routing table is printed at the end.
+"""
+
+import argparse
+import http.server
+import io
+import os
+import socketserver
+import sys
+import threading
+import time
+
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from gateway_fetch import HedgedFetcher, candidate_urls, sequential_fetch  # noqa: E402
+from gateway_registry import GatewayRegistry  # noqa: E402
+
+CID = 'Qm' + 'a' * 44
+
+
+def _jpeg():
+    buf = io.BytesIO()
+    Image.new('RGB', (640, 480), (20, 60, 200)).save(buf, 'JPEG')
+    return buf.getvalue()
+
+
+IMAGE = _jpeg()
+
+
+class _Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+def stand_in_gateway(delay_ms=0, status=200, body=None, hang=False):
+    """Start a gateway on a free port; returns its base URL ('http://127.0.0.1:<port>/ipfs/')."""
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            time.sleep(3600 if hang else delay_ms / 1000.0)
+            payload = IMAGE if body is None else body
+            try:
+                self.send_response(status)
+                self.send_header('Content-Type', 'image/jpeg')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+    server = _Server(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}/ipfs/"
+
+
+def scenarios():
+    fast = stand_in_gateway(delay_ms=30)
+    slow = stand_in_gateway(delay_ms=800)
+    medium = stand_in_gateway(delay_ms=150)
+    dead = stand_in_gateway(hang=True)
+    limited = stand_in_gateway(status=429, body=b'rate limited')
+    junk = stand_in_gateway(body=b'<html>gateway error page</html>')
+    missing = stand_in_gateway(status=504, body=b'timeout')
+    return [
+        ("healthy primary", [fast, slow, medium]),
+        ("hung primary", [dead, medium, fast]),
+        ("429, junk, slow, fast", [limited, junk, slow, fast]),
+        ("slow primary", [slow, medium, fast]),
+        ("all failing", [limited, junk, missing]),
+    ]
+
+
+def run(label, fn):
+    t0 = time.perf_counter()
+    try:
+        _, _, url = fn()
+        winner = url.split('/ipfs/')[0]
+    except Exception as e:
+        winner = f"FAILED ({type(e).__name__})"
+    return label, time.perf_counter() - t0, winner
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--timeout', type=float, default=5.0, help="per-request timeout (s)")
+    parser.add_argument('--repeat', type=int, default=5, help="hedged fetches per scenario")
+    parser.add_argument('--parallel', type=int, default=3)
+    parser.add_argument('--hedge-delay-ms', type=float, default=300.0)
+    parser.add_argument('--skip-sequential', action='store_true')
+    args = parser.parse_args()
+
+    def hedged(registry):
+        return HedgedFetcher(max_parallel=args.parallel, hedge_delay_ms=args.hedge_delay_ms,
+                             timeout=args.timeout, registry=registry)
+
+    cases = [(name, candidate_urls(f"{gateways[0]}{CID}", gateways)) for name, gateways in scenarios()]
+
+    print(f"{'scenario':24s} {'mode':14s} {'time s':>8s}  winner")
+    for name, urls in cases:
+        if not args.skip_sequential:
+            _, elapsed, winner = run('sequential', lambda: sequential_fetch(urls, timeout=args.timeout))
+            print(f"{name:24s} {'sequential':14s} {elapsed:8.3f}  {winner}")
+        cold = GatewayRegistry([])
+        _, elapsed, winner = run('cold', lambda: hedged(cold).fetch(cold.order_urls(urls)))
+        print(f"{name:24s} {'hedged cold':14s} {elapsed:8.3f}  {winner}")
+
+    registry = GatewayRegistry([], failure_threshold=2, open_seconds=60)
+    fetcher = hedged(registry)
+    for _, urls in cases:
+        run('warm-up', lambda: fetcher.fetch(registry.order_urls(urls)))
+    time.sleep(args.timeout + 0.5)  # let hung requests time out and be recorded
+    for name, urls in cases:
+        for i in range(args.repeat):
+            _, elapsed, winner = run('warm', lambda: fetcher.fetch(registry.order_urls(urls)))
+            print(f"{name:24s} {f'hedged warm #{i + 1}':14s} {elapsed:8.3f}  {winner}")
+
+    stats = fetcher.stats()
+    print(f"\nhedged: {stats['successes']} ok / {stats['failures']} failed, {stats['attempts']} requests, "
+          f"{stats['hedges']} hedges, {stats['cancelled']} losers cancelled, wins by rank {stats['wins_by_rank']}")
+    print(f"\n{'gateway':24s} {'state':9s} {'ttfb ms':>8s} {'success':>8s} {'req':>5s} {'429':>4s} {'cooldown s':>10s}")
+    for row in registry.table():
+        print(f"{row['gateway']:24s} {row['state']:9s} {row['expected_ttfb_ms']:8.1f} {row['success_rate']:8.3f} "
+              f"{row['requests']:5d} {row['rate_limited']:4d} {row['cooldown_remaining_s']:10.1f}")
+
+
+if __name__ == '__main__':
+    main()
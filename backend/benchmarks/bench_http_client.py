@@ -0,0 +1,89 @@
+"""
+Bare requests.get vs the pooled HttpClient against a local keep-alive server.
+
+Usage: python benchmarks/bench_http_client.py [--requests 500] [--concurrency 1,8,32] [--url URL]
+Without --url a local HTTP/1.1 server returning a small JPEG is started. Pass
+an https:// URL to include TLS handshakes, which is where pooling saves most.
+"""
+
+import argparse
+import http.server
+import io
+import os
+import socketserver
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from http_client import HttpClient  # noqa: E402
+
+
+def local_server():
+    buf = io.BytesIO()
+    Image.new('RGB', (320, 240), (20, 60, 200)).save(buf, 'JPEG')
+    body = buf.getvalue()
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # keep-alive
+        disable_nagle_algorithm = True  # avoid delayed-ACK stalls on reused connections
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/jpeg')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    class Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+        daemon_threads = True
+
+    server = Server(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}/ipfs/bench.jpg"
+
+
+def run(get, url, n, concurrency):
+    def one(_):
+        t0 = time.perf_counter()
+        get(url).content
+        return (time.perf_counter() - t0) * 1000.0
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        lat = list(pool.map(one, range(n)))
+    return n / (time.perf_counter() - t0), float(np.percentile(lat, 50)), float(np.percentile(lat, 99))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--concurrency', default='1,8,32')
+    parser.add_argument('--url', default=None)
+    args = parser.parse_args()
+
+    url = args.url or local_server()
+    print(f"{args.requests} GETs of {url}\n")
+    print(f"{'client':8s} {'conc':>5s} {'req/s':>9s} {'p50 ms':>8s} {'p99 ms':>8s} {'new conns':>10s}")
+    for concurrency in (int(c) for c in args.concurrency.split(',')):
+        rps, p50, p99 = run(lambda u: requests.get(u, timeout=15), url, args.requests, concurrency)
+        print(f"{'bare':8s} {concurrency:5d} {rps:9.1f} {p50:8.2f} {p99:8.2f} {args.requests:>10d}")
+
+        client = HttpClient(pool_maxsize=max(16, concurrency), per_host_limit=max(16, concurrency))
+        rps, p50, p99 = run(lambda u: client.get(u, timeout=15), url, args.requests, concurrency)
+        host = next(iter(client.stats()["hosts"].values()))
+        print(f"{'pooled':8s} {concurrency:5d} {rps:9.1f} {p50:8.2f} {p99:8.2f} "
+              f"{host.get('pool_new_connections', '?'):>10}")
+        client.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""
+Dashboard page load through /api/reports/<id>/image: full images vs thumbnails.
+
+Usage: python benchmarks/bench_image_variants.py [--reports 50] [--size 4000x3000] [--thumb w=320&fmt=webp]
+A local stand-in IPFS gateway serves one distinct photo-sized JPEG per report.
+The page is loaded like a browser would (6 parallel requests), first with
+full-resolution images and then with the thumbnail variant, each cold and then
+warm (served from the image cache). The cold full pass includes the gateway
+fetch; the cold thumbnail pass renders from the originals it cached. Prints
+bytes transferred and p50/p95 per-image latency.
+"""
+
+import argparse
+import http.server
+import io
+import os
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, BACKEND)
+
+
+def photo(seed, size):
+    """Noisy gradient JPEG, compressing roughly like a phone photo."""
+    rng = np.random.default_rng(seed)
+    w, h = size
+    small = rng.integers(0, 255, (h // 40, w // 40, 3), dtype=np.uint8)
+    img = Image.fromarray(small).resize((w, h), Image.BICUBIC)
+    noise = rng.normal(0, 12, (h, w, 3))
+    arr = np.clip(np.asarray(img, dtype=np.float32) + noise, 0, 255).astype(np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(arr).save(buf, 'JPEG', quality=90)
+    return buf.getvalue()
+
+
+def gateway(images):
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            body = images.get(self.path.rsplit('/', 1)[-1])
+            if body is None:
+                self.send_response(404)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/jpeg')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    class Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+        daemon_threads = True
+
+    server = Server(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def load_page(client, cids, query, concurrency=6):
+    def one(i):
+        t0 = time.perf_counter()
+        resp = client.get(f"/api/reports/{i}/image?cid={cids[i]}{'&' + query if query else ''}")
+        body = resp.data
+        assert resp.status_code == 200, (resp.status_code, body[:200])
+        return len(body), (time.perf_counter() - t0) * 1000.0
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(len(cids))))
+    wall = time.perf_counter() - t0
+    lat = [ms for _, ms in results]
+    return sum(n for n, _ in results), wall, float(np.percentile(lat, 50)), float(np.percentile(lat, 95))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--reports', type=int, default=50)
+    parser.add_argument('--size', default='4000x3000')
+    parser.add_argument('--thumb', default='w=320&fmt=webp')
+    args = parser.parse_args()
+    size = tuple(int(v) for v in args.size.lower().split('x'))
+
+    print(f"Generating {args.reports} {size[0]}x{size[1]} JPEGs...")
+    cids = [f"Qm{i:044d}" for i in range(args.reports)]
+    images = {cid: photo(i, size) for i, cid in enumerate(cids)}
+    print(f"  average {sum(map(len, images.values())) / len(images) / 1024:.0f} KiB\n")
+
+    workdir = tempfile.mkdtemp(prefix='bench_variants_')
+    os.environ['PRED_IPFS_GATEWAYS'] = gateway(images)
+    os.environ['PRED_IMAGE_CACHE_DIR'] = os.path.join(workdir, 'cache_images')
+    os.environ['PRED_GATEWAY_STATE_FILE'] = ''
+    os.environ.setdefault('PRED_STORE_PATH', os.path.join(workdir, 'predictions.db'))
+    import predict_service  # noqa: E402  (reads the environment above at import)
+    client = predict_service.app.test_client()
+
+    print(f"{'page':24s} {'pass':5s} {'bytes':>12s} {'wall s':>8s} {'p50 ms':>8s} {'p95 ms':>8s}")
+    for label, query in (('full resolution', ''), (f'thumbnail {args.thumb}', args.thumb)):
+        for phase in ('cold', 'warm'):
+            total, wall, p50, p95 = load_page(client, cids, query)
+            print(f"{label:24s} {phase:5s} {total:12,d} {wall:8.2f} {p50:8.1f} {p95:8.1f}")
+    print(f"\nimage cache: {predict_service.image_cache.stats()}")
+    print(f"work dir (safe to delete): {workdir}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""
+Benchmark: model.predict vs compiled tf.function inference (inference.CompiledModel).
+
+Usage: python benchmarks/bench_inference.py [--model PATH] [--runs N] [--batch N]
+Defaults to models/plastic_detection_model.h5. Prints p50/p99 latency per path.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from inference import CompiledModel, KerasPredictModel  # noqa: E402
+
+DEFAULT_MODEL = os.path.join(os.path.dirname(__file__), '..', 'models', 'plastic_detection_model.h5')
+
+
+def measure(runner, x, runs):
+    runner.infer(x)  # warm up / trace
+    samples = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        runner.infer(x)
+        samples.append((time.perf_counter() - t0) * 1000.0)
+    return np.percentile(samples, 50), np.percentile(samples, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--model', default=DEFAULT_MODEL)
+    parser.add_argument('--runs', type=int, default=200)
+    parser.add_argument('--batch', type=int, default=1)
+    args = parser.parse_args()
+
+    import tensorflow as tf
+    model = tf.keras.models.load_model(args.model)
+    x = np.random.default_rng(0).random((args.batch,) + tuple(model.input_shape[1:]), dtype=np.float32)
+
+    predict_runner = KerasPredictModel(model)
+    compiled_runner = CompiledModel(model)
+    diff = float(np.max(np.abs(np.asarray(predict_runner.infer(x)) - np.asarray(compiled_runner.infer(x)))))
+
+    print(f"model={os.path.basename(args.model)} batch={args.batch} runs={args.runs} max_abs_diff={diff:.2e}")
+    results = {}
+    for label, runner in (("model.predict", predict_runner), ("tf.function", compiled_runner)):
+        p50, p99 = measure(runner, x, args.runs)
+        results[label] = p50
+        print(f"  {label:14s} p50={p50:8.2f} ms  p99={p99:8.2f} ms")
+    print(f"  p50 speedup: {results['model.predict'] / results['tf.function']:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""
+Throughput vs number of inference worker processes (inference_pool.InferencePool).
+
+Usage: python benchmarks/bench_inference_pool.py [--workers 1,2,4,8] [--clients 32] [--images 2000]
+Loads the models once in this process behind a micro-batcher (the
+single-process baseline, as PRED_INFERENCE_WORKERS=0 runs them) and then in a
+pool of N workers for each --workers value. --clients threads each send single 224x224 uint8 images, as
+concurrent /predict requests do, until --images have been classified. Prints
+images/s, p50/p99 latency and the speedup over the baseline, and checks that
+pool outputs match the in-process ones.
+"""
+
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, BACKEND)
+from batching import MicroBatcher  # noqa: E402
+from inference_pool import InferencePool, available_cores, load_runners  # noqa: E402
+from model_input import InputPacker  # noqa: E402
+
+MODELS = os.path.join(BACKEND, 'models')
+
+
+def drive(infer, images, clients, total):
+    """Run `total` single-image calls from `clients` threads; (images/s, p50 ms, p99 ms)."""
+    latencies = []
+    lock = threading.Lock()
+    counter = iter(range(total))
+
+    def client():
+        mine = []
+        for i in counter:
+            t0 = time.perf_counter()
+            infer(images[i % len(images)])
+            mine.append((time.perf_counter() - t0) * 1000.0)
+        with lock:
+            latencies.extend(mine)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    return total / elapsed, float(np.percentile(latencies, 50)), float(np.percentile(latencies, 99))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    cores = available_cores()
+    default_workers = sorted({1, 2, 4, 8, len(cores)} & set(range(1, len(cores) + 1))) or [1]
+    parser.add_argument('--workers', default=','.join(map(str, default_workers)))
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--images', type=int, default=2000)
+    parser.add_argument('--backend', default='keras', choices=('keras', 'tflite'))
+    parser.add_argument('--tflite-variant', default='fp16')
+    parser.add_argument('--max-batch', type=int, default=16)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    spec = {
+        "backend": args.backend,
+        "plastic_path": os.path.join(MODELS, 'plastic_detection_model.h5'),
+        "oil_path": os.path.join(MODELS, 'oil_spill_detection_model.h5'),
+        "tflite_variant": args.tflite_variant,
+        "mode": 'fused',
+        "compiled": True,
+        "normalize_input": True,
+        "input_shape": (224, 224, 3),
+        "max_batch": args.max_batch,
+    }
+    rng = np.random.default_rng(0)
+    images = [rng.integers(0, 256, (1, 224, 224, 3), dtype=np.uint8) for _ in range(64)]
+
+    print(f"{len(cores)} cores available, {args.clients} clients, {args.images} images, backend {args.backend}")
+    # baseline: the in-process path, models behind one micro-batcher
+    infer_local, info = load_runners(spec)
+    packer = InputPacker(spec['input_shape'], capacity=args.max_batch, normalize=not info['normalizes_input'])
+    batcher = MicroBatcher(infer_local, args.max_batch, 10.0, name='local', pack=packer.pack)
+    reference = np.concatenate([np.asarray(batcher.submit(x)[0]).reshape(1, -1)[:, :1] for x in images[:8]])
+    base, p50, p99 = drive(batcher.submit, images, args.clients, args.images)
+    batcher.close()
+    print(f"\n{'workers':>8s} {'images/s':>10s} {'p50 ms':>9s} {'p99 ms':>9s} {'speedup':>8s} {'max |diff|':>11s}")
+    print(f"{'0 (in)':>8s} {base:10.1f} {p50:9.2f} {p99:9.2f} {1.0:7.2f}x {'-':>11s}")
+
+    failures = 0
+    for n in (int(w) for w in args.workers.split(',')):
+        pool = InferencePool(spec, n, name=f'bench{n}')
+        try:
+            if not pool.wait_ready(600):
+                print(f"{n:8d} workers never became ready")
+                failures += 1
+                continue
+            while pool.stats()["ready_workers"] < n:  # measure with every worker loaded
+                time.sleep(0.2)
+            got = np.concatenate([pool.infer(x)[0] for x in images[:8]])
+            diff = float(np.abs(got - reference).max())
+            failures += diff > 1e-5
+            rate, p50, p99 = drive(lambda x: pool.infer(x, timeout=120), images, args.clients, args.images)
+            print(f"{n:8d} {rate:10.1f} {p50:9.2f} {p99:9.2f} {rate / base:7.2f}x {diff:11.2e}")
+        finally:
+            pool.close()
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
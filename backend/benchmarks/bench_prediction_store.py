@@ -0,0 +1,85 @@
+"""
+Prediction store benchmark: SQLite (WAL) vs legacy whole-file JSON.
+
+Usage: python benchmarks/bench_prediction_store.py [--sizes 10000,100000,1000000] [--ops 1000]
+For each size the store is pre-filled, then single-entry upserts and gets are
+timed (p50/p99). The JSON store rewrites the whole file on every write, so only
+--json-ops writes are timed for it.
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from prediction_store import JsonFileStore, SQLiteStore  # noqa: E402
+
+LABELS = ['plastic', 'oil_spill', 'undetected']
+
+
+def entry(i):
+    return {"predicted_label": LABELS[i % 3], "saved_by": "predict_service", "forced": False}
+
+
+def timed(fn, ids):
+    lat = []
+    for i in ids:
+        t0 = time.perf_counter()
+        fn(i)
+        lat.append((time.perf_counter() - t0) * 1000.0)
+    return float(np.percentile(lat, 50)), float(np.percentile(lat, 99))
+
+
+def bench_sqlite(tmp, n, ops):
+    store = SQLiteStore(os.path.join(tmp, f'bench_{n}.db'))
+    t0 = time.perf_counter()
+    store.upsert_many((str(i), entry(i)) for i in range(n))
+    fill_s = time.perf_counter() - t0
+    ids = [random.randrange(n) for _ in range(ops)]
+    up = timed(lambda i: store.upsert(str(i), entry(i + 1)), ids)
+    get = timed(lambda i: store.get(str(i)), ids)
+    store.close()
+    return fill_s, up, get
+
+
+def bench_json(tmp, n, ops):
+    path = os.path.join(tmp, f'bench_{n}.json')
+    store = JsonFileStore(path)
+    t0 = time.perf_counter()
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({str(i): entry(i) for i in range(n)}, f, indent=2)
+    fill_s = time.perf_counter() - t0
+    ids = [random.randrange(n) for _ in range(ops)]
+    up = timed(lambda i: store.upsert(str(i), entry(i + 1)), ids)
+    get = timed(lambda i: store.get(str(i)), ids)
+    return fill_s, up, get
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='10000,100000,1000000')
+    parser.add_argument('--ops', type=int, default=1000, help="timed upserts/gets per size (SQLite)")
+    parser.add_argument('--json-ops', type=int, default=5, help="timed upserts/gets per size (JSON)")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix='pred_store_bench_')
+    try:
+        print(f"{'entries':>9s} {'store':7s} {'fill s':>8s} {'upsert p50':>11s} {'upsert p99':>11s} "
+              f"{'get p50':>9s} {'get p99':>9s}   (ms)")
+        for n in (int(s) for s in args.sizes.split(',')):
+            for name, fn, ops in (('sqlite', bench_sqlite, args.ops), ('json', bench_json, args.json_ops)):
+                fill_s, (up50, up99), (get50, get99) = fn(tmp, n, ops)
+                print(f"{n:9d} {name:7s} {fill_s:8.2f} {up50:11.3f} {up99:11.3f} {get50:9.3f} {get99:9.3f}")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""
+Keras vs TFLite (fp16 / int8) report: accuracy delta, latency and memory.
+
+Usage: python benchmarks/bench_tflite.py [--images DIR] [--runs N]
+Run convert_tflite.py first. Each backend is measured in its own subprocess
+so load time and peak RSS are not polluted by the other backends.
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, BACKEND_DIR)
+from inference import tflite_model_path  # noqa: E402
+
+MODEL_DIR = os.path.join(BACKEND_DIR, 'models')
+MODELS = {
+    'plastic': os.path.join(MODEL_DIR, 'plastic_detection_model.h5'),
+    'oil': os.path.join(MODEL_DIR, 'oil_spill_detection_model.h5'),
+}
+BACKENDS = ['keras', 'fp16', 'int8']
+
+
+def load_images(image_dir, size=(224, 224)):
+    out = []
+    for fname in sorted(os.listdir(image_dir)):
+        try:
+            img = Image.open(os.path.join(image_dir, fname)).convert('RGB').resize(size)
+        except Exception:
+            continue
+        out.append(np.array(img, dtype=np.float32) / 255.0)
+    return np.stack(out) if out else np.zeros((0,) + size + (3,), dtype=np.float32)
+
+
+def child(backend, image_dir, runs):
+    """Load one backend, score every image, time single-image inference; print JSON."""
+    t0 = time.perf_counter()
+    if backend == 'keras':
+        import tensorflow as tf
+        from inference import CompiledModel
+        runners = {k: CompiledModel(tf.keras.models.load_model(p)) for k, p in MODELS.items()}
+    else:
+        from inference import TFLiteModel
+        runners = {k: TFLiteModel(tflite_model_path(p, backend)) for k, p in MODELS.items()}
+    load_s = time.perf_counter() - t0
+
+    images = load_images(image_dir)
+    probs = {k: [float(np.asarray(r.infer(images[i:i + 1])).flatten()[0]) for i in range(len(images))]
+             for k, r in runners.items()}
+
+    x = images[:1] if len(images) else np.zeros((1, 224, 224, 3), dtype=np.float32)
+    latencies = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        for r in runners.values():
+            r.infer(x)
+        latencies.append((time.perf_counter() - t0) * 1000.0)
+
+    print(json.dumps({
+        "load_s": load_s,
+        "probs": probs,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        # ru_maxrss is KiB on Linux
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--images', default=os.path.join(BACKEND_DIR, 'uploads'))
+    parser.add_argument('--runs', type=int, default=100)
+    parser.add_argument('--threshold', type=float, default=0.5,
+                        help="probability cut-off used for the label agreement column")
+    parser.add_argument('--child', choices=BACKENDS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.images, args.runs)
+        return
+
+    results = {}
+    for backend in BACKENDS:
+        proc = subprocess.run([sys.executable, __file__, '--child', backend,
+                               '--images', args.images, '--runs', str(args.runs)],
+                              capture_output=True, text=True)
+        if proc.returncode != 0:
+            print(f"{backend}: FAILED\n{proc.stderr[-2000:]}")
+            continue
+        results[backend] = json.loads(proc.stdout.strip().splitlines()[-1])
+
+    if 'keras' not in results:
+        sys.exit(1)
+    ref = results['keras']
+    n_images = len(ref['probs']['plastic'])
+    print(f"\n{n_images} images from {args.images}, {args.runs} latency runs (plastic + oil per run)\n")
+    print(f"{'backend':8s} {'load s':>8s} {'p50 ms':>8s} {'p99 ms':>8s} {'RSS MB':>8s} "
+          f"{'max |dp|':>9s} {'mean |dp|':>10s} {'labels =':>9s}")
+    for backend, r in results.items():
+        deltas, agree = [], 0
+        for k in MODELS:
+            a = np.array(ref['probs'][k])
+            b = np.array(r['probs'][k])
+            deltas.extend(np.abs(a - b).tolist())
+            agree += int(np.sum((a >= args.threshold) == (b >= args.threshold)))
+        max_d = max(deltas) if deltas else 0.0
+        mean_d = float(np.mean(deltas)) if deltas else 0.0
+        total = n_images * len(MODELS)
+        print(f"{backend:8s} {r['load_s']:8.2f} {r['p50_ms']:8.2f} {r['p99_ms']:8.2f} {r['max_rss_mb']:8.1f} "
+              f"{max_d:9.4f} {mean_d:10.4f} {agree:>4d}/{total:<4d}")
+
+
+if __name__ == '__main__':
+    main()
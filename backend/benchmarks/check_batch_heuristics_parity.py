@@ -0,0 +1,98 @@
+"""
+Parity and speed of BatchHeuristics against the scalar water check and heuristic.
+
+Usage: python benchmarks/check_batch_heuristics_parity.py [--images-dir uploads] [--synthetic 500]
+Runs predict_service.analyze_water + heuristic_prediction image by image and
+BatchHeuristics once over the stack of the same 128x128 thumbnails, for every
+image in --images-dir plus --synthetic generated ones (flat and noisy colors
+spread over every water branch). Water flags, reasons and labels must be
+identical, and stats and scores must agree within --tolerance; the batch code
+uses exact integer channel sums where the scalar code uses float32 means.
+Exits non-zero on any mismatch.
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, BACKEND)
+
+
+def synthetic(n, seed=0):
+    rng = np.random.default_rng(seed)
+    for _ in range(n):
+        base = rng.integers(0, 256, 3)
+        noise = rng.normal(0, rng.uniform(0, 40), (128, 128, 3))
+        yield Image.fromarray(np.clip(base + noise, 0, 255).astype(np.uint8))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--images-dir', default=os.path.join(BACKEND, 'uploads'))
+    parser.add_argument('--synthetic', type=int, default=500)
+    parser.add_argument('--tolerance', type=float, default=1e-6)
+    args = parser.parse_args()
+
+    import predict_service as ps  # noqa: E402
+    from batch_heuristics import WATER_REASONS, BatchHeuristics  # noqa: E402
+    from image_pipeline import ImagePipeline  # noqa: E402
+    logging.getLogger().setLevel(logging.WARNING)
+
+    imgs = []
+    for name in sorted(os.listdir(args.images_dir)):
+        try:
+            imgs.append(ImagePipeline.decode(os.path.join(args.images_dir, name)))
+        except Exception as e:
+            print(f"skipping {name}: {e}")
+    n_files = len(imgs)
+    imgs += [ImagePipeline(img) for img in synthetic(args.synthetic)]
+    stack = np.stack([img.array((128, 128)) for img in imgs])
+
+    t0 = time.perf_counter()
+    scalar = []
+    for img in imgs:
+        stats = ps.analyze_water(img)
+        scalar.append((stats, ps.heuristic_prediction(stats)))
+    t_scalar = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    batch = BatchHeuristics(stack, ps.PLASTIC_THRESHOLD, ps.OIL_THRESHOLD, ps.NONE_THRESHOLD)
+    t_batch = time.perf_counter() - t0
+
+    mismatches = 0
+    max_diff = 0.0
+    for i, (stats, (p_plastic, p_oil, label, _)) in enumerate(scalar):
+        got = batch.stats(i)
+        row = (float(batch.p_plastic[i]), float(batch.p_oil[i]), str(batch.label[i]))
+        diffs = [abs(got[k] - stats[k]) for k in ('mean_brightness', 'r_mean', 'g_mean', 'b_mean', 'blue_ratio')]
+        diffs += [abs(row[0] - p_plastic), abs(row[1] - p_oil)]
+        max_diff = max(max_diff, *diffs)
+        same = (got["is_water_like"] == stats["is_water_like"] and got["water_reason"] == stats["water_reason"]
+                and row[2] == label and max(diffs) <= args.tolerance)
+        if not same:
+            mismatches += 1
+            if mismatches <= 5:
+                print(f"mismatch at {i}: scalar {stats} {(p_plastic, p_oil, label)}\n"
+                      f"               batch  {got} {row}")
+
+    water = int(batch.is_water_like.sum())
+    reasons = {r or 'not water': int((batch.water_code == c).sum()) for c, r in enumerate(WATER_REASONS)}
+    labels = {str(lbl): int((batch.label == lbl).sum()) for lbl in np.unique(batch.label)}
+    print(f"{len(imgs)} images ({n_files} from {args.images_dir}, {args.synthetic} synthetic)")
+    print(f"water: {water}  by condition: {reasons}")
+    print(f"heuristic labels: {labels}")
+    print(f"scalar: {t_scalar * 1000:.1f} ms   batch: {t_batch * 1000:.1f} ms   "
+          f"({t_scalar / max(t_batch, 1e-9):.1f}x)")
+    print(f"max |stat/score diff|: {max_diff:.2e} (tolerance {args.tolerance:g})")
+    print(f"mismatches: {mismatches}")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == '__main__':
+    main()
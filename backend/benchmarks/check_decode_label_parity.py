@@ -0,0 +1,100 @@
+"""
+Label parity of the fast (reduced-size) decode against a full-resolution decode.
+
+Usage: python benchmarks/check_decode_label_parity.py [--images-dir uploads] [--synthetic 24]
+                                                      [--size 4032x3024] [--margin 2] [--wait-models 120]
+Classifies every image in --images-dir plus --synthetic generated photo-like
+JPEGs of --size (tinted across the water / non-water boundary) twice through
+predict_service.fallback_predict_from_pil: once decoded at full resolution
+(PRED_FAST_DECODE=false) and once decoded as the service does by default
+(image_decode with min_size=DECODE_MIN_SIZE and the given DRAFT_MARGIN).
+Prints the largest drift of the 128x128 channel means analyze_water works on
+and every image whose label changed. Models are used if they load within
+--wait-models seconds, otherwise the heuristic. Exits non-zero on any label
+change.
+"""
+
+import argparse
+import io
+import logging
+import os
+import sys
+
+import numpy as np
+from PIL import Image
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, BACKEND)
+
+
+def tinted_photo(seed, size):
+    """JPEG bytes of a smooth, noisy scene around a random tint (blues and greens weighted up)."""
+    rng = np.random.default_rng(seed)
+    w, h = size
+    tint = rng.uniform([0.05, 0.2, 0.3], [0.7, 0.75, 0.95]) * 255
+    small = np.clip(tint + rng.normal(0, 35, (h // 64, w // 64, 3)), 0, 255).astype(np.uint8)
+    arr = np.asarray(Image.fromarray(small).resize((w, h), Image.BICUBIC), dtype=np.float32)
+    arr = np.clip(arr + rng.normal(0, 14, arr.shape), 0, 255).astype(np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(arr).save(buf, 'JPEG', quality=88)
+    return buf.getvalue()
+
+
+def channel_means(img, size):
+    return img.array(size).reshape(-1, 3).mean(axis=0) / 255.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--images-dir', default=os.path.join(BACKEND, 'uploads'))
+    parser.add_argument('--synthetic', type=int, default=24)
+    parser.add_argument('--size', default='4032x3024')
+    parser.add_argument('--margin', type=int, default=None, help='DRAFT_MARGIN to check (default: the shipped one)')
+    parser.add_argument('--wait-models', type=float, default=120.0)
+    args = parser.parse_args()
+    size = tuple(int(v) for v in args.size.lower().split('x'))
+
+    import image_decode
+    import image_pipeline
+    import predict_service as ps
+    logging.getLogger().setLevel(logging.WARNING)
+    if args.margin is not None:
+        image_decode.DRAFT_MARGIN = image_pipeline.DRAFT_MARGIN = args.margin
+    models = ps.wait_for_models(args.wait_models)
+
+    images = []
+    if os.path.isdir(args.images_dir):
+        for name in sorted(os.listdir(args.images_dir)):
+            with open(os.path.join(args.images_dir, name), 'rb') as f:
+                images.append((name, f.read()))
+    print(f"Generating {args.synthetic} {size[0]}x{size[1]} JPEGs...")
+    images += [(f"synthetic-{i}", tinted_photo(i, size)) for i in range(args.synthetic)]
+
+    print(f"{len(images)} images, decode_min_size {list(ps.DECODE_MIN_SIZE)}, "
+          f"margin {image_decode.DRAFT_MARGIN}, {'models' if models else 'heuristic only'}")
+    drifts, changed, reduced = [], [], 0
+    for name, content in images:
+        try:
+            full = ps.ImagePipeline.decode(content)
+        except Exception as e:
+            print(f"skipping {name}: {e}")
+            continue
+        fast = ps.ImagePipeline.decode(content, min_size=ps.DECODE_MIN_SIZE)
+        reduced += fast.size != full.size
+        drift = float(np.abs(channel_means(full, ps.WATER_STATS_SIZE) - channel_means(fast, ps.WATER_STATS_SIZE)).max())
+        drifts.append(drift)
+        label_full = ps.fallback_predict_from_pil(full)[2]
+        label_fast = ps.fallback_predict_from_pil(fast)[2]
+        if label_full != label_fast:
+            changed.append((name, full.size, label_full, label_fast, drift))
+
+    print(f"reduced decodes: {reduced}/{len(drifts)}")
+    print(f"channel mean drift (0-1 scale): max {max(drifts):.5f}, mean {float(np.mean(drifts)):.5f}")
+    for name, full_size, before, after, drift in changed:
+        print(f"  LABEL CHANGED {name} ({full_size[0]}x{full_size[1]}): {before} -> {after} (drift {drift:.5f})")
+    print(f"label changes: {len(changed)} {'ok' if not changed else 'FAIL'}")
+    sys.exit(1 if changed else 0)
+
+
+if __name__ == '__main__':
+    main()
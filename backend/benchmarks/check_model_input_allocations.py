@@ -0,0 +1,151 @@
+"""
+Allocation budget and parity check for model_input.InputPacker.
+
+Usage: python benchmarks/check_model_input_allocations.py [--budget-bytes 4096] [--batch 8] [--threads 16]
+Measures, with tracemalloc, the heap allocated by packing a 224x224 image
+(and a batch) into the pooled float32 buffers, against the old
+np.array(..., float32) / 255 + expand_dims preprocessing, both on a warm
+thread and on a fresh thread per pack (the werkzeug server starts one per
+request). Then packs from --threads threads at once and checks the pool never
+grows past its bound. Also checks that packed values equal the old ones
+exactly and, if TensorFlow is installed, that a CompiledModel dividing by 255
+in its graph gives the same outputs. Exits non-zero if a check fails.
+"""
+
+import argparse
+import os
+import sys
+import threading
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from model_input import InputPacker  # noqa: E402
+
+SHAPE = (224, 224, 3)
+
+
+def old_preprocess(pixels):
+    arr = np.array(pixels, dtype=np.float32) / 255.0
+    return np.expand_dims(arr, axis=0)
+
+
+def use(packer, images):
+    with packer.pack(images) as x:
+        return float(x[0, 0, 0, 0])
+
+
+def on_new_thread(fn):
+    """Run fn on a thread of its own, as each request does."""
+    def run():
+        thread = threading.Thread(target=fn)
+        thread.start()
+        thread.join()
+    return run
+
+
+def allocated(fn, repeat=50):
+    """(peak bytes during one call, bytes still held after `repeat` calls)."""
+    fn()  # warm up: the first call fills the pool
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    fn()
+    peak = tracemalloc.get_traced_memory()[1] - base
+    for _ in range(repeat):
+        fn()
+    held = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+    return peak, held
+
+
+def graph_parity(images):
+    try:
+        import tensorflow as tf
+    except ImportError:
+        print("graph parity: skipped (TensorFlow not installed)")
+        return True
+    from inference import CompiledModel
+
+    tf.keras.utils.set_random_seed(0)
+    model = tf.keras.Sequential([tf.keras.Input(shape=SHAPE), tf.keras.layers.Conv2D(4, 3, strides=4),
+                                 tf.keras.layers.GlobalAveragePooling2D(), tf.keras.layers.Dense(1, 'sigmoid')])
+    ref = CompiledModel(model).infer(np.concatenate([old_preprocess(i) for i in images]))
+    with InputPacker(SHAPE, normalize=False).pack(images) as raw:
+        out = CompiledModel(model, normalize_input=True).infer(raw)
+    ok = np.allclose(ref, out, atol=1e-6)
+    print(f"graph parity (/255 folded into the graph): max |diff| {float(np.abs(ref - out).max()):.2e} "
+          f"{'ok' if ok else 'FAIL'}")
+    return ok
+
+
+def concurrent_bound(images, threads, batch):
+    """Pack from `threads` threads at once; the pool must stay at its bound."""
+    packer = InputPacker(SHAPE, capacity=batch, buffers=2)
+    barrier = threading.Barrier(threads)
+
+    def client():
+        barrier.wait()
+        for _ in range(20):
+            use(packer, images)
+
+    workers = [threading.Thread(target=client) for _ in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    stats = packer.stats()
+    ok = stats["buffers"] <= stats["max_buffers"] and stats["in_use"] == 0
+    print(f"{threads} concurrent threads: {stats['buffers']} pooled buffer(s) ({stats['buffer_bytes']:,d} bytes), "
+          f"{stats['transient']} transient of {stats['packs']} packs {'ok' if ok else 'FAIL'}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--budget-bytes', type=int, default=4096)
+    parser.add_argument('--batch', type=int, default=8)
+    parser.add_argument('--threads', type=int, default=16)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    images = [rng.integers(0, 256, SHAPE, dtype=np.uint8) for _ in range(args.batch)]
+    single = images[0][np.newaxis]
+    packer = InputPacker(SHAPE, capacity=args.batch)
+
+    failures = 0
+    # starting a thread allocates a little by itself; new-thread rows report the rest
+    thread_cost = allocated(on_new_thread(lambda: None))
+    print(f"{'path':40s} {'peak bytes':>12s} {'held bytes':>12s}")
+    for name, fn, budgeted, baseline in (
+        ('old: np.array/255 + expand_dims', lambda: old_preprocess(images[0]), False, (0, 0)),
+        ('InputPacker.pack, 1 image', lambda: use(packer, [single]), True, (0, 0)),
+        (f'InputPacker.pack, {args.batch} images', lambda: use(packer, images), True, (0, 0)),
+        ('InputPacker.pack, 1 image, new thread', on_new_thread(lambda: use(packer, [single])), True, thread_cost),
+    ):
+        peak, held = (max(0, a - b) for a, b in zip(allocated(fn), baseline))
+        verdict = ''
+        if budgeted:
+            ok = peak <= args.budget_bytes and held <= args.budget_bytes
+            failures += not ok
+            verdict = 'ok' if ok else f'FAIL (budget {args.budget_bytes})'
+        print(f"{name:40s} {peak:12,d} {held:12,d} {verdict}")
+
+    pooled = packer.stats()["buffers"]
+    failures += pooled != 1
+    print(f"pooled buffers after all packs: {pooled} {'ok' if pooled == 1 else 'FAIL (expected 1)'}")
+    failures += not concurrent_bound(images, args.threads, args.batch)
+
+    expected = np.concatenate([old_preprocess(i) for i in images])
+    with packer.pack(images) as packed:
+        exact = np.array_equal(packed, expected)
+    failures += not exact
+    print(f"numpy parity (normalize=True): {'exact' if exact else 'FAIL'}")
+    failures += not graph_parity(images)
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
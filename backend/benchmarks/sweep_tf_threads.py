@@ -0,0 +1,146 @@
+"""
+Images/s across TensorFlow threading configurations on this machine.
+
+Usage: python benchmarks/sweep_tf_threads.py [--intra 0,1,2,4] [--inter 0,1,2] [--onednn on,off]
+                                             [--processes 1] [--batch 1,16] [--seconds 5]
+For every combination, starts --processes fresh Python processes with
+PRED_TF_INTRA_OP_THREADS / PRED_TF_INTER_OP_THREADS / PRED_TF_ONEDNN set (and,
+with --pin, PRED_CPU_AFFINITY giving each process its own share of the
+cores). The settings only take effect in a fresh interpreter, before
+TensorFlow is imported. Each process loads the fused models through
+tf_runtime the way predict_service does, then all of them classify batches at
+the same time for --seconds. --processes > 1 shows the oversubscription of
+several service workers on one host. Prints total images/s per batch size,
+best first. Intra/inter 0 means TensorFlow's default.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import subprocess
+import sys
+import time
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, BACKEND)
+
+MODELS = os.path.join(BACKEND, 'models')
+
+
+def child(batches, seconds):
+    """Runs in a fresh process: apply the env settings, load, signal ready, wait for go, measure."""
+    import numpy as np
+    from tf_runtime import RuntimeConfig
+    runtime = RuntimeConfig.from_env()
+    runtime.apply_process()
+    import tensorflow as tf
+    from inference_pool import load_runners
+    from model_input import InputPacker
+    spec = {
+        "backend": 'keras',
+        "plastic_path": os.path.join(MODELS, 'plastic_detection_model.h5'),
+        "oil_path": os.path.join(MODELS, 'oil_spill_detection_model.h5'),
+        "mode": 'fused',
+        "compiled": True,
+        "normalize_input": True,
+        "input_shape": (224, 224, 3),
+    }
+    infer, info = load_runners(spec, runtime)
+    packer = InputPacker(spec['input_shape'], capacity=max(batches), normalize=not info['normalizes_input'])
+    rng = np.random.default_rng(os.getpid())
+    images = {n: rng.integers(0, 256, (n, 224, 224, 3), dtype=np.uint8) for n in batches}
+    for n in batches:
+        with packer.pack([images[n]]) as x:  # warm up / trace each batch size
+            infer(x)
+
+    print(json.dumps({"ready": True}), flush=True)
+    sys.stdin.readline()
+    rates = {}
+    for n in batches:
+        done, t0 = 0, time.perf_counter()
+        while time.perf_counter() - t0 < seconds:
+            with packer.pack([images[n]]) as x:
+                infer(x)
+            done += n
+        rates[n] = done / (time.perf_counter() - t0)
+    print(json.dumps({"rates": rates, "effective": runtime.effective(tf)}), flush=True)
+
+
+def run_config(intra, inter, onednn, processes, pin, batches, seconds):
+    from inference_pool import worker_cores
+    procs = []
+    for i in range(processes):
+        env = dict(os.environ, PRED_TF_INTRA_OP_THREADS=str(intra), PRED_TF_INTER_OP_THREADS=str(inter),
+                   PRED_TF_ONEDNN=onednn, TF_CPP_MIN_LOG_LEVEL='2')
+        if pin:
+            env['PRED_CPU_AFFINITY'] = ','.join(map(str, worker_cores(i, processes)))
+        procs.append(subprocess.Popen(
+            [sys.executable, __file__, '--child', '--batch', ','.join(map(str, batches)), '--seconds', str(seconds)],
+            env=env, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True))
+    try:
+        for p in procs:
+            line = p.stdout.readline()
+            if not line:
+                raise RuntimeError(f"child exited with code {p.wait()} before loading the models")
+        for p in procs:  # start every process measuring at once
+            p.stdin.write('go\n')
+            p.stdin.flush()
+        results = [json.loads(p.stdout.readline()) for p in procs]
+    finally:
+        for p in procs:
+            if p.poll() is None:
+                p.kill()
+            p.wait()
+    totals = {int(n): sum(r["rates"][n] for r in results) for n in results[0]["rates"]}
+    return totals, results[0]["effective"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--intra', default=None, help='intra-op thread counts (default 0,1,2,4,...,cores)')
+    parser.add_argument('--inter', default='0,1,2')
+    parser.add_argument('--onednn', default='on,off')
+    parser.add_argument('--processes', type=int, default=1)
+    parser.add_argument('--pin', action='store_true', help='give each process its own cores')
+    parser.add_argument('--batch', default='1,16')
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    batches = [int(b) for b in args.batch.split(',')]
+
+    if args.child:
+        child(batches, args.seconds)
+        return
+
+    from inference_pool import available_cores
+    cores = len(available_cores())
+    intra = ([int(v) for v in args.intra.split(',')] if args.intra
+             else [0] + sorted({2 ** k for k in range(cores.bit_length()) if 2 ** k <= cores} | {cores}))
+    inter = [int(v) for v in args.inter.split(',')]
+    onednn = [v.strip() for v in args.onednn.split(',')]
+    print(f"{cores} cores, {args.processes} process(es){' pinned' if args.pin else ''}, "
+          f"{args.seconds:g}s per batch size")
+
+    rows = []
+    for i, j, d in itertools.product(intra, inter, onednn):
+        try:
+            totals, effective = run_config(i, j, d, args.processes, args.pin, batches, args.seconds)
+        except Exception as e:
+            print(f"intra={i} inter={j} onednn={d}: failed ({e})")
+            continue
+        rows.append((i, j, d, totals, effective))
+        print(f"intra={i:<3d} inter={j:<3d} onednn={d:<4s} "
+              + '  '.join(f"batch {n}: {totals[n]:8.1f} img/s" for n in batches)
+              + f"   (TF reports intra={effective['intra_op_threads']} inter={effective['inter_op_threads']})",
+              flush=True)
+
+    for n in batches:
+        print(f"\nBest for batch {n}:")
+        for i, j, d, totals, _ in sorted(rows, key=lambda r: -r[3][n])[:5]:
+            print(f"  PRED_TF_INTRA_OP_THREADS={i} PRED_TF_INTER_OP_THREADS={j} PRED_TF_ONEDNN={d}  "
+                  f"{totals[n]:8.1f} img/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Marine DB Classification Stages
+Gate settings and per-stage counters for the staged (early-exit) classifier
+"""
+
+import threading
+import time
+from collections import Counter
+
+# Stage order and the outcomes each stage records
+STAGES = ('stats', 'strict', 'model')
+EXIT_OUTCOMES = {'stats': 'water', 'strict': 'water'}
+
+STATS_GATES = ('exit', 'off')
+STRICT_GATES = ('off', 'confirm', 'exit')
+
+
+def parse_gate(value, choices, name):
+    value = (value or '').strip().lower()
+    if value not in choices:
+        raise ValueError(f"{name} must be one of {', '.join(choices)}, got {value!r}")
+    return value
+
+
+class StageCounters:
+    """
+    Thread-safe counters for the classification stages.
+
+    Each stage records an outcome per image ('water' or 'pass' for the stats
+    and strict water stages, 'model' or 'heuristic' for the model stage) and
+    the time it spent. stats() reports, per stage, how many images entered,
+    how many left at that stage, and overall which fraction of traffic exited
+    before the models, which is what model capacity has to be sized for.
+    """
+
+    def __init__(self, stages=STAGES):
+        self.stages = tuple(stages)
+        self._lock = threading.Lock()
+        self._outcomes = {s: Counter() for s in self.stages}
+        self._seconds = {s: 0.0 for s in self.stages}
+
+    def record(self, stage, outcome, seconds, n=1):
+        with self._lock:
+            self._outcomes[stage][outcome] += n
+            self._seconds[stage] += seconds
+
+    def timed(self, stage):
+        """Context manager timing one stage; call .outcome(name, n=1) inside it."""
+        return _StageTimer(self, stage)
+
+    def stats(self):
+        with self._lock:
+            outcomes = {s: dict(c) for s, c in self._outcomes.items()}
+            seconds = dict(self._seconds)
+        stages = {}
+        for stage in self.stages:
+            entered = sum(outcomes[stage].values())
+            exited = outcomes[stage].get(EXIT_OUTCOMES.get(stage), 0)
+            stages[stage] = {
+                "entered": entered,
+                "outcomes": outcomes[stage],
+                "exit_fraction": round(exited / entered, 4) if entered else 0.0,
+                "total_ms": round(seconds[stage] * 1000.0, 1),
+                "mean_ms": round(seconds[stage] * 1000.0 / entered, 3) if entered else 0.0,
+            }
+        total = stages[self.stages[0]]["entered"]
+        early = sum(outcomes[s].get(o, 0) for s, o in EXIT_OUTCOMES.items() if s in outcomes)
+        reached_model = stages['model']["entered"] if 'model' in stages else 0
+        return {
+            "images": total,
+            "early_exits": early,
+            "early_exit_fraction": round(early / total, 4) if total else 0.0,
+            "model_fraction": round(reached_model / total, 4) if total else 0.0,
+            "stages": stages,
+        }
+
+
+class _StageTimer:
+    __slots__ = ('_counters', '_stage', '_start', '_recorded')
+
+    def __init__(self, counters, stage):
+        self._counters = counters
+        self._stage = stage
+        self._recorded = []
+
+    def outcome(self, name, n=1):
+        if n > 0:
+            self._recorded.append((name, n))
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self._start
+        if not self._recorded:
+            return False
+        share = elapsed / len(self._recorded)
+        for name, n in self._recorded:
+            self._counters.record(self._stage, name, share, n)
+        return False
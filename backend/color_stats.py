@@ -0,0 +1,76 @@
+"""
+Marine DB Color Statistics
+Vectorized HSV / saturation helpers shared by the water and color checks
+"""
+
+import numpy as np
+
+
+def _as_rgb_float(arr):
+    """Return an (..., 3) float array scaled to [0, 1]."""
+    arr = np.asarray(arr)
+    if arr.shape[-1] != 3:
+        raise ValueError(f"Expected (..., 3) RGB array, got shape {arr.shape}")
+    if arr.dtype == np.uint8:
+        # same scaling the water checks use: np.array(img, float32) / 255.0
+        return arr.astype(np.float32) / 255.0
+    return arr
+
+
+def _max_min(rgb):
+    """Per-pixel channel max/min; exact in any float precision."""
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    return np.maximum(np.maximum(r, g), b), np.minimum(np.minimum(r, g), b)
+
+
+def saturation(arr):
+    """
+    Per-pixel HSV saturation, identical to colorsys.rgb_to_hsv(...)[1].
+    Accepts uint8 (0-255) or float (0-1) arrays of shape (..., 3).
+    """
+    maxc, minc = _max_min(_as_rgb_float(arr))
+    # colorsys works on Python floats, so do the subtraction/division in float64
+    maxc = maxc.astype(np.float64)
+    rangec = maxc - minc
+    maxc[maxc == 0] = 1.0  # black pixels: rangec is 0, saturation stays 0
+    return rangec / maxc
+
+
+def mean_saturation(arr):
+    """Mean HSV saturation over all pixels (0.0 for an empty array)."""
+    sats = saturation(arr)
+    if sats.size == 0:
+        return 0.0
+    return float(sats.mean())
+
+
+def rgb_to_hsv(arr):
+    """
+    Vectorized colorsys.rgb_to_hsv.
+    Returns (h, s, v) float64 arrays with the shape of arr[..., 0].
+    """
+    rgb = _as_rgb_float(arr).astype(np.float64)
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    maxc, minc = _max_min(rgb)
+    rangec = maxc - minc
+    chroma = rangec > 0
+
+    s = np.zeros_like(maxc)
+    np.divide(rangec, maxc, out=s, where=chroma)
+
+    safe_range = np.where(chroma, rangec, 1.0)
+    rc = (maxc - r) / safe_range
+    gc = (maxc - g) / safe_range
+    bc = (maxc - b) / safe_range
+
+    # Same branch order as colorsys: red wins ties, then green, then blue
+    h = np.where(r == maxc, bc - gc,
+                 np.where(g == maxc, 2.0 + rc - bc, 4.0 + gc - rc))
+    h = np.where(chroma, (h / 6.0) % 1.0, 0.0)
+    return h, s, maxc
+
+
+def channel_means(arr):
+    """Return (mean_brightness, r_mean, g_mean, b_mean) for an (H, W, 3) float array."""
+    return (float(arr.mean()), float(arr[..., 0].mean()),
+            float(arr[..., 1].mean()), float(arr[..., 2].mean()))
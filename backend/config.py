@@ -27,6 +27,15 @@ NONE_THRESHOLD = float(os.getenv('PRED_NONE_THRESHOLD', 0.15))
 TARGET_SIZE = tuple(int(x) for x in os.getenv('PRED_TARGET_SIZE', '224,224').split(','))
 CACHE_MAX_AGE = int(os.getenv('CACHE_MAX_AGE_HOURS', 24)) * 3600
 
+# TensorFlow Runtime (applied by predict_service before TensorFlow is imported, see tf_runtime.py)
+# 0 / empty keeps TensorFlow's default. With several service processes on one
+# host, give each a share of the cores (threads and affinity) instead of
+# letting every process start a full-width intra-op pool.
+TF_INTRA_OP_THREADS = int(os.getenv('PRED_TF_INTRA_OP_THREADS', 0))
+TF_INTER_OP_THREADS = int(os.getenv('PRED_TF_INTER_OP_THREADS', 0))
+TF_ONEDNN = os.getenv('PRED_TF_ONEDNN', '').lower()  # 'on', 'off' or '' (TF default)
+CPU_AFFINITY = os.getenv('PRED_CPU_AFFINITY', '')  # CPU list such as '0-3,8'; '' leaves affinity alone
+
 # Batch Processing
 MAX_BATCH_SIZE = 20
 REQUEST_TIMEOUT = 15
@@ -40,11 +49,13 @@ LOGS_DIR = os.path.join(os.path.dirname(__file__), 'logs')
 os.makedirs(CACHE_DIR, exist_ok=True)
 os.makedirs(LOGS_DIR, exist_ok=True)
 
-# IPFS Gateways (ordered by preference)
-IPFS_GATEWAYS = [
+# IPFS Gateways (seed list; the live order comes from the gateway registry,
+# see GET /api/ipfs/gateways)
+IPFS_GATEWAYS = [g.strip() for g in os.getenv('PRED_IPFS_GATEWAYS', ','.join([
     "https://ipfs.io/ipfs/",
     "https://cloudflare-ipfs.com/ipfs/",
     "https://dweb.link/ipfs/",
     "https://gateway.pinata.cloud/ipfs/",
     "https://infura-ipfs.io/ipfs/"
-]
+])).split(',') if g.strip()]
+GATEWAY_STATE_FILE = os.getenv('PRED_GATEWAY_STATE_FILE', os.path.join(os.path.dirname(__file__), 'gateway_state.json'))
@@ -0,0 +1,112 @@
+"""
+Convert the Keras .h5 models to TFLite for the PRED_BACKEND=tflite mode.
+
+Usage:
+    python convert_tflite.py                       # fp16 + int8 for both models
+    python convert_tflite.py --variants int8 --calib-dir uploads --calib-limit 200
+
+Writes models/<name>_fp16.tflite and models/<name>_int8.tflite next to the .h5
+files. The int8 variant is calibrated on images from --calib-dir using the
+same preprocessing as predict_service (RGB, resize to the model input, /255).
+"""
+
+import argparse
+import os
+import sys
+
+import numpy as np
+from PIL import Image
+
+from inference import tflite_model_path
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_DIR = os.path.join(BASE_DIR, 'models')
+MODEL_FILES = ['plastic_detection_model.h5', 'oil_spill_detection_model.h5']
+DEFAULT_CALIB_DIR = os.path.join(BASE_DIR, 'uploads')
+
+
+def load_calibration_images(calib_dir, target_size, limit):
+    """Decode up to `limit` images from calib_dir as (1, H, W, 3) float32 batches."""
+    batches = []
+    for fname in sorted(os.listdir(calib_dir)):
+        path = os.path.join(calib_dir, fname)
+        if not os.path.isfile(path):
+            continue
+        try:
+            img = Image.open(path).convert('RGB').resize(target_size)
+        except Exception:
+            continue  # not an image
+        arr = np.array(img, dtype=np.float32) / 255.0
+        batches.append(np.expand_dims(arr, axis=0))
+        if len(batches) >= limit:
+            break
+    return batches
+
+
+def convert(tf, model, variant, calib_batches=None):
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if variant == 'fp16':
+        converter.target_spec.supported_types = [tf.float16]
+    elif variant == 'int8':
+        if not calib_batches:
+            raise ValueError("int8 conversion needs calibration images")
+
+        def representative_dataset():
+            for batch in calib_batches:
+                yield [batch]
+
+        converter.representative_dataset = representative_dataset
+        # int8 weights and activations; input/output stay float32 so the
+        # service can feed the same preprocessed tensors to either backend
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    else:
+        raise ValueError(f"Unknown variant: {variant}")
+    return converter.convert()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert .h5 models to TFLite (fp16 / int8)")
+    parser.add_argument('--models-dir', default=MODEL_DIR)
+    parser.add_argument('--variants', nargs='+', default=['fp16', 'int8'], choices=['fp16', 'int8'])
+    parser.add_argument('--calib-dir', default=DEFAULT_CALIB_DIR)
+    parser.add_argument('--calib-limit', type=int, default=100)
+    args = parser.parse_args()
+
+    import tensorflow as tf
+
+    failed = False
+    for fname in MODEL_FILES:
+        h5_path = os.path.join(args.models_dir, fname)
+        if not os.path.exists(h5_path):
+            print(f"Model not found: {h5_path}")
+            failed = True
+            continue
+
+        print(f"\nLoading {h5_path}")
+        model = tf.keras.models.load_model(h5_path)
+        target_size = tuple(int(d) for d in model.input_shape[1:3])
+
+        calib = None
+        if 'int8' in args.variants:
+            calib = load_calibration_images(args.calib_dir, target_size, args.calib_limit)
+            print(f"Calibration images: {len(calib)} from {args.calib_dir}")
+
+        for variant in args.variants:
+            out_path = tflite_model_path(h5_path, variant)
+            try:
+                data = convert(tf, model, variant, calib)
+            except Exception as e:
+                print(f"  {variant}: FAILED - {e}")
+                failed = True
+                continue
+            with open(out_path, 'wb') as f:
+                f.write(data)
+            print(f"  {variant}: {out_path} ({len(data) / 1024:.1f} KiB, "
+                  f"h5 {os.path.getsize(h5_path) / 1024:.1f} KiB)")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,411 @@
+"""
+Marine DB Gateway Fetch
+Hedged (racing) and sequential image fetches across IPFS gateway candidates
+"""
+
+import io
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import requests
+from PIL import Image
+
+from gateway_registry import GatewayRegistry, gateway_of
+from http_client import get_client
+
+DEFAULT_GATEWAYS = [
+    "https://ipfs.io/ipfs/",
+    "https://cloudflare-ipfs.com/ipfs/",
+    "https://dweb.link/ipfs/",
+    "https://gateway.pinata.cloud/ipfs/",
+    "https://infura-ipfs.io/ipfs/"
+]
+
+
+class FetchError(RuntimeError):
+    """A single candidate URL did not return a usable image."""
+
+
+def ipfs_path(image_url):
+    """'<cid>[/sub/path]' for an IPFS gateway URL or bare CID, else None."""
+    if not image_url:
+        return None
+    if '/ipfs/' in image_url:
+        path = image_url.split('/ipfs/', 1)[1].split('?', 1)[0].split('#', 1)[0]
+        return path.strip('/') or None
+    if urlparse(image_url).scheme == '' and len(image_url) in (46, 59):
+        return image_url
+    return None
+
+
+def gateway_url(gateway, path):
+    """URL of an IPFS path on a gateway base ('https://host/ipfs/' or just 'https://host')."""
+    base = gateway.rstrip('/')
+    if not base.endswith('/ipfs'):
+        base += '/ipfs'
+    return f"{base}/{path}"
+
+
+def candidate_urls(image_url, gateways):
+    """The original URL (if it is one) followed by the same IPFS path on each gateway, deduplicated."""
+    out = []
+    if image_url and urlparse(image_url).scheme in ('http', 'https'):
+        out.append(image_url)
+    path = ipfs_path(image_url)
+    if path:
+        for gw in gateways:
+            url = gateway_url(gw, path)
+            if url not in out:
+                out.append(url)
+    return out
+
+
+def is_image_bytes(content, content_type=None):
+    """True if PIL recognises content as an image (header parse only, no decode)."""
+    if not content:
+        return False
+    try:
+        Image.open(io.BytesIO(content))
+        return True
+    except Exception:
+        return False
+
+
+IMAGE_SIGNATURES = (
+    b'\xff\xd8\xff',         # JPEG
+    b'\x89PNG\r\n\x1a\n',    # PNG
+    b'GIF87a', b'GIF89a',
+    b'II*\x00', b'MM\x00*',    # TIFF
+    b'BM',
+)
+
+
+def looks_like_image(prefix):
+    """Magic-number check on the first bytes of a body (for streams that cannot be parsed yet)."""
+    if not prefix:
+        return False
+    if prefix.startswith(IMAGE_SIGNATURES):
+        return True
+    if prefix[:4] == b'RIFF' and prefix[8:12] == b'WEBP':
+        return True
+    return is_image_bytes(prefix)
+
+
+def retry_after_seconds(resp):
+    """Retry-After header in seconds (numeric form only), else None."""
+    try:
+        return max(0.0, float(resp.headers.get('Retry-After')))
+    except (TypeError, ValueError):
+        return None
+
+
+def sequential_fetch(candidates, headers=None, timeout=15, attempts=3, registry=None, client=None):
+    """
+    The original strategy: each candidate in turn, with up to `attempts` tries
+    and exponential backoff. Outcomes are recorded in registry if given.
+    Returns (content, content_type, url).
+    """
+    client = client or get_client()
+    last_exc = None
+    for url in candidates:
+        backoff = 0.5
+        for _ in range(attempts):
+            if registry is not None and not registry.allow(url):
+                last_exc = FetchError(f"{gateway_of(url)} unavailable (circuit open or cooling down)")
+                break
+            t0 = time.monotonic()
+            try:
+                resp = client.get(url, headers=headers, timeout=timeout, retries=0)
+                if registry is not None:
+                    registry.record_ttfb(url, time.monotonic() - t0)
+                if resp.status_code == 200:
+                    if registry is not None:
+                        registry.record_success(url)
+                    return resp.content, resp.headers.get('Content-Type'), url
+                if resp.status_code == 429:
+                    logging.warning("Rate limited (429) from %s", url)
+                else:
+                    logging.warning("Non-200 response %s from %s", resp.status_code, url)
+                if registry is not None:
+                    registry.record_failure(url, status=resp.status_code, retry_after=retry_after_seconds(resp))
+                last_exc = FetchError(f"{resp.status_code} from {url}")
+            except Exception as e:
+                logging.warning("Fetch error for %s: %s", url, e)
+                if registry is not None:
+                    registry.record_failure(url, error=e,
+                                            timeout=timeout if isinstance(e, requests.Timeout) else None)
+                last_exc = e
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 3.0)
+    raise last_exc or FetchError("No candidate URLs")
+
+
+class _Cancellation:
+    """
+    A race's cancel flag. Attempts register an abort for their connection
+    while it is in flight; set() aborts every registered one, so losers
+    blocked waiting for headers or a chunk fail at once instead of holding a
+    fetch thread and a per-host slot until their timeout.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._set = False
+        self._aborts = {}  # attempt thread ident -> abort()
+
+    def is_set(self):
+        return self._set
+
+    def set(self):
+        with self._lock:
+            self._set = True
+            aborts, self._aborts = list(self._aborts.values()), {}
+        for abort in aborts:
+            abort()
+
+    def register(self, abort):
+        """HttpClient on_sent callback: abort the connection now if already cancelled."""
+        with self._lock:
+            if not self._set:
+                self._aborts[threading.get_ident()] = abort
+                return
+        abort()
+
+    def unregister(self):
+        """Called by an attempt before its connection can go back to the pool."""
+        with self._lock:
+            self._aborts.pop(threading.get_ident(), None)
+
+
+class HedgedFetcher:
+    """
+    Races candidate URLs: the first is requested immediately and another is
+    started each time the in-flight ones fail or exceed their hedge delay,
+    with at most max_parallel in flight. The first response that is a 200 and
+    passes validate() wins; losers' connections are shut down, whether they
+    are still waiting for headers or reading the body.
+
+    Per-gateway latency and health live in a GatewayRegistry: a gateway's
+    request timeout is srtt + 4*rttvar (clamped to [min_timeout, timeout], and
+    to a shorter per-call timeout passed to fetch()),
+    its hedge delay is min(hedge_delay, srtt + 2*rttvar), and gateways with
+    an open circuit or a 429 cooldown are skipped.
+    """
+
+    def __init__(self, max_parallel=3, hedge_delay_ms=300.0, timeout=15.0, min_timeout=1.0,
+                 validate=is_image_bytes, max_workers=32, chunk_size=64 * 1024, registry=None, client=None):
+        self.max_parallel = max(1, int(max_parallel))
+        self.hedge_delay = max(0.0, float(hedge_delay_ms)) / 1000.0
+        self.timeout = float(timeout)
+        self.min_timeout = min(float(min_timeout), self.timeout)
+        self.validate = validate
+        self.chunk_size = chunk_size
+        self.registry = registry if registry is not None else GatewayRegistry([])
+        self.client = client or get_client()
+
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='gateway-fetch')
+        self._lock = threading.Lock()
+        self._counters = {"fetches": 0, "successes": 0, "failures": 0, "attempts": 0,
+                          "hedges": 0, "cancelled": 0}
+        self._wins_by_rank = {}
+
+    # ---------- public API ----------
+
+    def fetch(self, candidates, headers=None, timeout=None):
+        """
+        Return (content, content_type, url) from the first candidate with a valid image.
+        timeout, if given, caps each attempt's request timeout below the fetcher's own.
+        """
+        (content, ctype), url = self._race(
+            candidates, lambda url, cancel: self._attempt(url, headers, cancel, timeout))
+        return content, ctype, url
+
+    def open_stream(self, candidates, headers=None):
+        """
+        Race candidates to the first 200 response whose first chunk looks like
+        an image, without reading the rest of the body. The winner's per-host
+        slot (HttpClient) is released once the first chunk is in.
+        Returns (response, chunk_iterator, first_chunk, content_type, url);
+        the caller must close the response.
+        """
+        (resp, chunks, first, ctype), url = self._race(
+            candidates, lambda url, cancel: self._attempt_open(url, headers, cancel),
+            discard=lambda result: result[0].close())
+        return resp, chunks, first, ctype, url
+
+    def _race(self, candidates, attempt, discard=None):
+        """
+        Run attempt(url, cancel_event) over the candidates with hedging; returns
+        (result, url) of the first success. Results of attempts that finish
+        after the winner are passed to discard().
+        """
+        pending = list(candidates)
+        total = len(pending)
+        if not pending:
+            raise FetchError("No candidate URLs")
+        cancel = _Cancellation()
+        done = queue.Queue()
+        errors = []
+        in_flight = {}  # url -> (launch rank, future)
+        last_url = None
+
+        def launch():
+            nonlocal last_url
+            rank = total - len(pending)
+            url = pending.pop(0)
+            last_url = url
+            fut = self._pool.submit(attempt, url, cancel)
+            in_flight[url] = (rank, fut)
+            fut.add_done_callback(lambda f, u=url: done.put((u, f)))
+
+        def discard_late(fut):
+            if fut.exception() is None:
+                discard(fut.result())
+
+        with self._lock:
+            self._counters["fetches"] += 1
+        launch()
+        try:
+            while in_flight:
+                wait = None
+                if pending and len(in_flight) < self.max_parallel:
+                    wait = self.registry.hedge_delay_for(last_url, self.hedge_delay)
+                try:
+                    url, fut = done.get(timeout=wait)
+                except queue.Empty:
+                    with self._lock:
+                        self._counters["hedges"] += 1
+                    launch()
+                    continue
+
+                rank, _ = in_flight.pop(url)
+                try:
+                    result = fut.result()
+                except Exception as e:
+                    errors.append(f"{url}: {e}")
+                    if pending and len(in_flight) < self.max_parallel:
+                        launch()
+                    continue
+
+                with self._lock:
+                    self._counters["successes"] += 1
+                    self._wins_by_rank[rank] = self._wins_by_rank.get(rank, 0) + 1
+                    self._counters["cancelled"] += len(in_flight)
+                if discard is not None:
+                    for _, loser in in_flight.values():
+                        loser.add_done_callback(discard_late)
+                return result, url
+        finally:
+            cancel.set()
+
+        with self._lock:
+            self._counters["failures"] += 1
+        raise FetchError("All candidates failed: " + "; ".join(errors))
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters,
+                        max_parallel=self.max_parallel,
+                        hedge_delay_ms=self.hedge_delay * 1000.0,
+                        wins_by_rank={str(k): v for k, v in sorted(self._wins_by_rank.items())})
+
+    # ---------- internals ----------
+
+    def _request_timeout(self, url, cap=None):
+        """The gateway's adaptive timeout, capped by the caller's timeout if it is shorter."""
+        ceiling = min(self.timeout, float(cap)) if cap else self.timeout
+        return self.registry.timeout_for(url, ceiling, min(self.min_timeout, ceiling))
+
+    def _check_cancelled(self, url, cancel):
+        """Raise if the race is over; an aborted loser is not held against its gateway."""
+        if cancel.is_set():
+            self.registry.release(url)
+            raise FetchError("cancelled")
+
+    def _attempt(self, url, headers, cancel, cap=None):
+        if cancel.is_set():
+            raise FetchError("cancelled before start")
+        if not self.registry.allow(url):
+            raise FetchError(f"{gateway_of(url)} unavailable (circuit open or cooling down)")
+        with self._lock:
+            self._counters["attempts"] += 1
+        timeout = self._request_timeout(url, cap)
+        t0 = time.monotonic()
+        try:
+            resp = self.client.get(url, headers=headers, timeout=timeout, stream=True, retries=0,
+                                   on_sent=cancel.register)
+        except Exception as e:
+            cancel.unregister()
+            self._check_cancelled(url, cancel)
+            self.registry.record_failure(url, error=e,
+                                         timeout=timeout if isinstance(e, requests.Timeout) else None)
+            raise
+        try:
+            self.registry.record_ttfb(url, time.monotonic() - t0)
+            if resp.status_code != 200:
+                self.registry.record_failure(url, status=resp.status_code, retry_after=retry_after_seconds(resp))
+                raise FetchError(f"{resp.status_code} from {url}")
+            chunks = []
+            for chunk in resp.iter_content(self.chunk_size):
+                self._check_cancelled(url, cancel)
+                chunks.append(chunk)
+            content = b''.join(chunks)
+            ctype = resp.headers.get('Content-Type')
+        except requests.RequestException as e:
+            self._check_cancelled(url, cancel)
+            self.registry.record_failure(url, error=e)
+            raise
+        finally:
+            cancel.unregister()
+            resp.close()
+        if self.validate is not None and not self.validate(content, ctype):
+            self.registry.record_failure(url, error="invalid image")
+            raise FetchError(f"invalid image from {url} ({len(content)} bytes, {ctype})")
+        self.registry.record_success(url)
+        return content, ctype
+
+    def _attempt_open(self, url, headers, cancel):
+        if cancel.is_set():
+            raise FetchError("cancelled before start")
+        if not self.registry.allow(url):
+            raise FetchError(f"{gateway_of(url)} unavailable (circuit open or cooling down)")
+        with self._lock:
+            self._counters["attempts"] += 1
+        timeout = self._request_timeout(url)
+        t0 = time.monotonic()
+        try:
+            resp = self.client.get(url, headers=headers, timeout=timeout, stream=True, retries=0,
+                                   on_sent=cancel.register)
+        except Exception as e:
+            cancel.unregister()
+            self._check_cancelled(url, cancel)
+            self.registry.record_failure(url, error=e,
+                                         timeout=timeout if isinstance(e, requests.Timeout) else None)
+            raise
+        try:
+            self.registry.record_ttfb(url, time.monotonic() - t0)
+            if resp.status_code != 200:
+                self.registry.record_failure(url, status=resp.status_code, retry_after=retry_after_seconds(resp))
+                raise FetchError(f"{resp.status_code} from {url}")
+            chunks = resp.iter_content(self.chunk_size)
+            first = next(chunks, b'')
+            if not looks_like_image(first):
+                self.registry.record_failure(url, error="invalid image")
+                raise FetchError(f"invalid image from {url} ({resp.headers.get('Content-Type')})")
+            cancel.unregister()
+            self._check_cancelled(url, cancel)
+        except BaseException as e:
+            cancel.unregister()
+            resp.close()
+            if isinstance(e, requests.RequestException):
+                self._check_cancelled(url, cancel)
+                self.registry.record_failure(url, error=e)
+            raise
+        self.registry.record_success(url)
+        # the rest of the body goes out at the client's pace: stop counting it against the host
+        resp.release_slot()
+        return resp, chunks, first, resp.headers.get('Content-Type')
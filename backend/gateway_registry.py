@@ -0,0 +1,299 @@
+"""
+Marine DB Gateway Registry
+Shared per-gateway health table: latency, success rate, 429 cooldowns and circuit breaker
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from urllib.parse import urlparse
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+
+def gateway_of(url):
+    """Origin ('scheme://host[:port]') a URL is served from."""
+    parsed = urlparse(url)
+    return f"{parsed.scheme}://{parsed.netloc}"
+
+
+class GatewayRegistry:
+    """
+    Health and latency of every gateway origin (scheme://host) the service fetches from.
+
+    Per gateway it keeps an RTO-style time-to-first-byte estimate (srtt/rttvar),
+    an EWMA success rate, a 429 cooldown and a circuit breaker:
+
+      closed     normal; failure_threshold consecutive failures open it
+      open       skipped for open_seconds (doubling on every failed probe, up
+                 to max_open_seconds)
+      half_open  one probe request is let through; success closes the
+                 circuit, failure re-opens it
+
+    order_urls() sorts candidate URLs by expected time-to-first-byte
+    (srtt / success rate) and drops unavailable gateways unless nothing else
+    is left. The table is written to state_path (atomically, at most every
+    save_interval seconds) and reloaded on start.
+    """
+
+    def __init__(self, gateways, state_path=None, alpha=0.2, failure_threshold=5, open_seconds=30.0,
+                 max_open_seconds=600.0, cooldown_seconds=10.0, max_cooldown_seconds=300.0,
+                 default_ttfb_ms=300.0, save_interval=10.0, max_entries=256):
+        self.gateways = [gateway_of(g) for g in gateways]
+        self.state_path = state_path
+        self.alpha = alpha
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.open_seconds = float(open_seconds)
+        self.max_open_seconds = float(max_open_seconds)
+        self.cooldown_seconds = float(cooldown_seconds)
+        self.max_cooldown_seconds = float(max_cooldown_seconds)
+        self.default_ttfb = default_ttfb_ms / 1000.0
+        self.save_interval = float(save_interval)
+        self.max_entries = max(len(self.gateways), int(max_entries))
+
+        self._lock = threading.Lock()
+        self._table = {}
+        self._dirty = False
+        self._last_save = 0.0
+        self._load()
+        for gw in self.gateways:
+            self._entry(gw)
+
+    # ---------- routing ----------
+
+    def order_urls(self, urls, drop_unavailable=True):
+        """
+        Candidate URLs sorted by expected time-to-first-byte, unavailable
+        gateways last. With drop_unavailable they are removed unless nothing
+        else is left.
+        """
+        now = time.time()
+        with self._lock:
+            ranked = []
+            for i, url in enumerate(urls):
+                e = self._entry(gateway_of(url))
+                ranked.append((not self._available(e, now), self._expected_ttfb(e), i, url))
+        ranked.sort()
+        usable = [url for blocked, _, _, url in ranked if not blocked]
+        if drop_unavailable and usable:
+            return usable
+        return [url for _, _, _, url in ranked]
+
+    def ordered_gateways(self):
+        """Configured gateway origins, best first."""
+        return [gateway_of(u) for u in self.order_urls(self.gateways)]
+
+    def allow(self, url):
+        """
+        Claim a request slot for url's gateway. False while its circuit is open
+        or it is cooling down after a 429; in half_open only one probe is allowed.
+        """
+        now = time.time()
+        with self._lock:
+            e = self._entry(gateway_of(url))
+            if not self._available(e, now):
+                return False
+            if e["state"] == HALF_OPEN or (e["state"] == OPEN and now >= e["open_until"]):
+                e["state"] = HALF_OPEN
+                e["probe_in_flight"] = True
+            return True
+
+    # ---------- latency ----------
+
+    def timeout_for(self, url, default, minimum):
+        """srtt + 4*rttvar clamped to [minimum, default]; default for unknown gateways."""
+        with self._lock:
+            e = self._table.get(gateway_of(url))
+            if e is None or e["srtt"] is None:
+                return default
+            return min(default, max(minimum, e["srtt"] + 4 * e["rttvar"]))
+
+    def hedge_delay_for(self, url, default):
+        """min(default, srtt + 2*rttvar): hedge once a request is slower than usual for its gateway."""
+        with self._lock:
+            e = self._table.get(gateway_of(url))
+            if e is None or e["srtt"] is None:
+                return default
+            return min(default, e["srtt"] + 2 * e["rttvar"])
+
+    # ---------- observations ----------
+
+    def record_ttfb(self, url, seconds):
+        with self._lock:
+            e = self._entry(gateway_of(url))
+            if e["srtt"] is None:
+                e["srtt"], e["rttvar"] = seconds, seconds / 2.0
+            else:
+                e["rttvar"] = 0.75 * e["rttvar"] + 0.25 * abs(e["srtt"] - seconds)
+                e["srtt"] = 0.875 * e["srtt"] + 0.125 * seconds
+            self._dirty = True
+
+    def record_success(self, url):
+        with self._lock:
+            e = self._entry(gateway_of(url))
+            e["requests"] += 1
+            e["successes"] += 1
+            e["success_rate"] += self.alpha * (1.0 - e["success_rate"])
+            e["consecutive_failures"] = 0
+            e["cooldown_strikes"] = 0
+            e["last_success"] = time.time()
+            if e["state"] != CLOSED:
+                logging.info("Gateway %s recovered, closing circuit", e["gateway"])
+            e["state"] = CLOSED
+            e["open_seconds"] = self.open_seconds
+            e["probe_in_flight"] = False
+            self._dirty = True
+        self._maybe_save()
+
+    def record_failure(self, url, status=None, error=None, timeout=None, retry_after=None):
+        """
+        Count a failed request. status=429 starts a cooldown (Retry-After if
+        given, else exponential); a timeout raises the latency estimate to at
+        least the timeout.
+        """
+        now = time.time()
+        with self._lock:
+            e = self._entry(gateway_of(url))
+            e["requests"] += 1
+            e["failures"] += 1
+            e["success_rate"] -= self.alpha * e["success_rate"]
+            e["last_error"] = str(error or status)[:200]
+            e["last_failure"] = now
+            if timeout is not None:
+                e["srtt"] = max(e["srtt"] or 0.0, timeout)
+                e["rttvar"] = max(e["rttvar"] or 0.0, timeout / 2.0)
+            if status == 429:
+                e["rate_limited"] += 1
+                e["cooldown_strikes"] += 1
+                cooldown = retry_after if retry_after is not None else min(
+                    self.max_cooldown_seconds, self.cooldown_seconds * 2 ** (e["cooldown_strikes"] - 1))
+                e["cooldown_until"] = now + cooldown
+                logging.warning("Gateway %s rate limited, cooling down for %.0fs", e["gateway"], cooldown)
+            else:
+                e["consecutive_failures"] += 1
+                if e["state"] == HALF_OPEN:
+                    e["open_seconds"] = min(self.max_open_seconds, e["open_seconds"] * 2)
+                    self._open(e, now)
+                elif e["state"] == CLOSED and e["consecutive_failures"] >= self.failure_threshold:
+                    self._open(e, now)
+            e["probe_in_flight"] = False
+            self._dirty = True
+        self._maybe_save()
+
+    def release(self, url):
+        """Give back a half_open probe slot when the request was abandoned (e.g. lost a race)."""
+        with self._lock:
+            e = self._table.get(gateway_of(url))
+            if e is not None:
+                e["probe_in_flight"] = False
+
+    # ---------- reporting / persistence ----------
+
+    def table(self):
+        """Live routing table, best gateway first."""
+        now = time.time()
+        with self._lock:
+            rows = []
+            for gw, e in self._table.items():
+                state = e["state"]
+                if state == OPEN and now >= e["open_until"]:
+                    state = HALF_OPEN
+                rows.append({
+                    "gateway": gw,
+                    "configured": gw in self.gateways,
+                    "state": state,
+                    "available": self._available(e, now),
+                    "expected_ttfb_ms": round(self._expected_ttfb(e) * 1000.0, 1),
+                    "srtt_ms": None if e["srtt"] is None else round(e["srtt"] * 1000.0, 1),
+                    "rttvar_ms": None if e["rttvar"] is None else round(e["rttvar"] * 1000.0, 1),
+                    "success_rate": round(e["success_rate"], 4),
+                    "requests": e["requests"],
+                    "successes": e["successes"],
+                    "failures": e["failures"],
+                    "rate_limited": e["rate_limited"],
+                    "consecutive_failures": e["consecutive_failures"],
+                    "cooldown_remaining_s": round(max(0.0, e["cooldown_until"] - now), 1),
+                    "open_remaining_s": round(max(0.0, e["open_until"] - now), 1) if state == OPEN else 0.0,
+                    "last_error": e["last_error"],
+                    "last_success": e["last_success"],
+                })
+        rows.sort(key=lambda r: (not r["available"], r["expected_ttfb_ms"]))
+        return rows
+
+    def save(self):
+        if not self.state_path:
+            return
+        with self._lock:
+            data = json.dumps({"version": 1, "saved": time.time(), "gateways": self._table})
+            self._dirty = False
+            self._last_save = time.time()
+        tmp = f"{self.state_path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(tmp, self.state_path)
+        except OSError:
+            logging.exception("Failed to save gateway registry to %s", self.state_path)
+
+    # ---------- internals ----------
+
+    def _maybe_save(self):
+        if self.state_path and self._dirty and time.time() - self._last_save >= self.save_interval:
+            self.save()
+
+    def _load(self):
+        if not self.state_path or not os.path.exists(self.state_path):
+            return
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                saved = json.load(f).get("gateways", {})
+        except (OSError, ValueError):
+            logging.exception("Ignoring unreadable gateway registry %s", self.state_path)
+            return
+        for gw, e in saved.items():
+            entry = self._entry(gw)
+            entry.update({k: v for k, v in e.items() if k in entry})
+            entry["probe_in_flight"] = False
+        logging.info("Loaded gateway registry (%d gateways) from %s", len(saved), self.state_path)
+
+    def _entry(self, gw):
+        e = self._table.get(gw)
+        if e is None:
+            if len(self._table) >= self.max_entries:
+                self._evict()
+            e = self._table[gw] = {
+                "gateway": gw, "state": CLOSED, "srtt": None, "rttvar": None, "success_rate": 1.0,
+                "requests": 0, "successes": 0, "failures": 0, "rate_limited": 0,
+                "consecutive_failures": 0, "cooldown_strikes": 0, "cooldown_until": 0.0,
+                "open_until": 0.0, "open_seconds": self.open_seconds, "probe_in_flight": False,
+                "last_error": None, "last_success": None, "last_failure": None,
+            }
+        return e
+
+    def _evict(self):
+        # drop the least recently used origin that is not a configured gateway
+        extras = [(max(e["last_success"] or 0, e["last_failure"] or 0), gw)
+                  for gw, e in self._table.items() if gw not in self.gateways]
+        if extras:
+            del self._table[min(extras)[1]]
+
+    def _open(self, e, now):
+        e["state"] = OPEN
+        e["open_until"] = now + e["open_seconds"]
+        logging.warning("Gateway %s circuit open for %.0fs after %d consecutive failures",
+                        e["gateway"], e["open_seconds"], e["consecutive_failures"])
+
+    def _available(self, e, now):
+        if now < e["cooldown_until"]:
+            return False
+        if e["state"] == OPEN:
+            return now >= e["open_until"]
+        if e["state"] == HALF_OPEN:
+            return not e["probe_in_flight"]
+        return True
+
+    def _expected_ttfb(self, e):
+        srtt = self.default_ttfb if e["srtt"] is None else e["srtt"]
+        return srtt / max(e["success_rate"], 0.05)
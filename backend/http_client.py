@@ -0,0 +1,272 @@
+"""
+Marine DB HTTP Client
+Shared outbound HTTP layer: pooled keep-alive sessions, bounded retries,
+per-host concurrency limits and connection reuse stats
+"""
+
+import logging
+import os
+import socket
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS')
+RETRY_STATUSES = (502, 503, 504)
+
+
+class HostBusyError(requests.ConnectionError):
+    """No request slot for the host became free within acquire_timeout."""
+
+
+_local = threading.local()
+
+
+def _notify_sent(conn):
+    """Hand the calling request's on_sent callback an abort() for the connection it was sent on."""
+    on_sent = getattr(_local, 'on_sent', None)
+    sock = conn.sock
+    if on_sent is None or sock is None:
+        return
+
+    def abort():
+        # shutdown (not close) wakes a thread blocked reading the socket; go
+        # around SSLSocket.shutdown, which would drop the TLS state under it
+        try:
+            socket.socket.shutdown(sock, socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    on_sent(abort)
+
+
+class _NotifyingHTTPConnection(HTTPConnection):
+    def request(self, *args, **kwargs):
+        super().request(*args, **kwargs)
+        _notify_sent(self)
+
+
+class _NotifyingHTTPSConnection(HTTPSConnection):
+    def request(self, *args, **kwargs):
+        super().request(*args, **kwargs)
+        _notify_sent(self)
+
+
+class _NotifyingHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _NotifyingHTTPConnection
+
+
+class _NotifyingHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _NotifyingHTTPSConnection
+
+
+class _Adapter(HTTPAdapter):
+    """HTTPAdapter whose connections report each sent request to the caller's on_sent."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {'http': _NotifyingHTTPConnectionPool,
+                                                   'https': _NotifyingHTTPSConnectionPool}
+
+
+class HttpClient:
+    """
+    One requests.Session shared by every thread. Connections are kept alive in
+    a pool per host (pool_maxsize connections each, pool_connections hosts).
+
+    At most per_host_limit requests run against one host at a time; callers
+    wait up to acquire_timeout for a slot. Idempotent requests are retried up
+    to `retries` times with exponential backoff on connection errors and
+    502/503/504. Pass retries=0 where the caller has its own retry logic.
+
+    With stream=True the host slot is held until the response is closed, so
+    streamed responses must always be closed. Callers that hand the body to
+    something paced by a third party (a proxied download read by a browser)
+    call resp.release_slot() once the headers and first chunk are in, so slow
+    readers cannot starve other requests to the host.
+
+    on_sent(abort), if passed to a request, is called from the requesting
+    thread once the request is on the wire; abort() may then be called from
+    any thread to shut the connection down, failing a call still waiting for
+    the headers or reading the body with a ConnectionError.
+    """
+
+    def __init__(self, pool_connections=32, pool_maxsize=16, retries=2, backoff=0.2,
+                 per_host_limit=16, acquire_timeout=30.0, user_agent='marine-db/1.0'):
+        self.retries = max(0, int(retries))
+        self.backoff = float(backoff)
+        self.per_host_limit = max(1, int(per_host_limit))
+        self.acquire_timeout = float(acquire_timeout)
+        self.pool_connections = int(pool_connections)
+        self.pool_maxsize = int(pool_maxsize)
+
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = user_agent
+        self._adapter = _Adapter(pool_connections=self.pool_connections, pool_maxsize=self.pool_maxsize,
+                                    max_retries=0)
+        self.session.mount('http://', self._adapter)
+        self.session.mount('https://', self._adapter)
+
+        self._lock = threading.Lock()
+        self._slots = {}   # host -> BoundedSemaphore
+        self._hosts = {}   # host -> counters
+        self._counters = {"requests": 0, "errors": 0, "retries": 0, "limit_waits": 0, "limit_timeouts": 0}
+
+    # ---------- public API ----------
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def request(self, method, url, retries=None, on_sent=None, **kwargs):
+        """requests-compatible request through the shared pool; returns requests.Response."""
+        method = method.upper()
+        retries = self.retries if retries is None else max(0, int(retries))
+        if method not in IDEMPOTENT_METHODS:
+            retries = 0
+        host = urlparse(url).netloc
+        attempt = 0
+        while True:
+            try:
+                resp = self._send(host, method, url, on_sent, **kwargs)
+            except HostBusyError:
+                raise
+            except requests.ConnectionError as e:
+                if attempt >= retries:
+                    raise
+                logging.debug("Retrying %s %s after connection error: %s", method, url, e)
+            else:
+                if resp.status_code not in RETRY_STATUSES or attempt >= retries:
+                    return resp
+                resp.close()
+                logging.debug("Retrying %s %s after HTTP %s", method, url, resp.status_code)
+            attempt += 1
+            with self._lock:
+                self._counters["retries"] += 1
+                self._host(host)["retries"] += 1
+            time.sleep(self.backoff * 2 ** (attempt - 1))
+
+    def stats(self):
+        """Counters plus, per host, requests sent and new connections opened (reuse = 1 - new/requests)."""
+        pools = {}
+        try:
+            manager = self._adapter.poolmanager
+            for key in list(manager.pools.keys()):
+                pool = manager.pools.get(key)
+                if pool is not None:
+                    name = pool.host if pool.port in (None, 80, 443) else f"{pool.host}:{pool.port}"
+                    pools[name] = pool
+        except Exception:
+            logging.debug("Could not read connection pool stats", exc_info=True)
+
+        with self._lock:
+            hosts = {}
+            for host, c in self._hosts.items():
+                row = dict(c)
+                pool = pools.get(host)
+                if pool is not None:
+                    row["pool_requests"] = pool.num_requests
+                    row["pool_new_connections"] = pool.num_connections
+                    row["connection_reuse"] = round(1.0 - pool.num_connections / max(1, pool.num_requests), 4)
+                hosts[host] = row
+            return dict(self._counters,
+                        per_host_limit=self.per_host_limit,
+                        pool_maxsize=self.pool_maxsize,
+                        pool_connections=self.pool_connections,
+                        retries_per_request=self.retries,
+                        hosts=hosts)
+
+    def close(self):
+        self.session.close()
+
+    # ---------- internals ----------
+
+    def _host(self, host):
+        c = self._hosts.get(host)
+        if c is None:
+            c = self._hosts[host] = {"requests": 0, "errors": 0, "retries": 0, "in_flight": 0}
+        return c
+
+    def _send(self, host, method, url, on_sent=None, **kwargs):
+        with self._lock:
+            slot = self._slots.get(host)
+            if slot is None:
+                slot = self._slots[host] = threading.BoundedSemaphore(self.per_host_limit)
+        if not slot.acquire(blocking=False):
+            with self._lock:
+                self._counters["limit_waits"] += 1
+            if not slot.acquire(timeout=self.acquire_timeout):
+                with self._lock:
+                    self._counters["limit_timeouts"] += 1
+                raise HostBusyError(f"Too many concurrent requests to {host}")
+
+        with self._lock:
+            self._counters["requests"] += 1
+            c = self._host(host)
+            c["requests"] += 1
+            c["in_flight"] += 1
+
+        released = False
+
+        def release():
+            nonlocal released
+            if released:
+                return
+            released = True
+            with self._lock:
+                self._hosts[host]["in_flight"] -= 1
+            slot.release()
+
+        _local.on_sent = on_sent
+        try:
+            resp = self.session.request(method, url, **kwargs)
+        except Exception:
+            with self._lock:
+                self._counters["errors"] += 1
+                self._hosts[host]["errors"] += 1
+            release()
+            raise
+        finally:
+            _local.on_sent = None
+
+        if kwargs.get('stream'):
+            close = resp.close
+
+            def close_and_release():
+                try:
+                    close()
+                finally:
+                    release()
+
+            resp.close = close_and_release
+            resp.release_slot = release
+        else:
+            release()
+        return resp
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Process-wide HttpClient configured from PRED_HTTP_* environment variables."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HttpClient(
+                pool_connections=int(os.environ.get('PRED_HTTP_POOL_CONNECTIONS', 32)),
+                pool_maxsize=int(os.environ.get('PRED_HTTP_POOL_MAXSIZE', 16)),
+                retries=int(os.environ.get('PRED_HTTP_RETRIES', 2)),
+                backoff=float(os.environ.get('PRED_HTTP_RETRY_BACKOFF', 0.2)),
+                per_host_limit=int(os.environ.get('PRED_HTTP_PER_HOST_LIMIT', 16)),
+                acquire_timeout=float(os.environ.get('PRED_HTTP_ACQUIRE_TIMEOUT', 30))
+            )
+        return _client
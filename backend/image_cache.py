@@ -0,0 +1,331 @@
+"""
+Marine DB Image Cache
+Content-addressed, byte-bounded LRU cache of fetched report images
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from gateway_fetch import ipfs_path
+
+# Files this cache writes (objects/<aa>/<sha256>.bin, plus <name>.<thread>.<id>.tmp
+# while writing) and the ones the pre-index cache left in cache_dir
+OBJECT_FILE = re.compile(r'^[0-9a-f]{64}\.bin(\.\d+\.\d+\.tmp)?$')
+LEGACY_FILE = re.compile(r'^[0-9a-f]{64}\.(bin|meta)$')
+
+
+def image_cache_key(url_or_cid):
+    """
+    'ipfs:<cid>[/path]' for anything that names IPFS content (any gateway URL
+    or a bare CID), so every gateway shares one entry; otherwise 'url:<url>'.
+    """
+    path = ipfs_path(url_or_cid)
+    if path:
+        return f"ipfs:{path}"
+    return f"url:{url_or_cid}"
+
+
+class ImageCache:
+    """
+    Image bytes on disk under <cache_dir>/objects/<aa>/<sha256(key)>.bin.
+
+    An index (key -> file, size, content type, etag, created) is kept in LRU order
+    in memory and persisted to <cache_dir>/index.json, so startup reads one
+    file instead of stat'ing every object. Total size is bounded by
+    max_bytes; least recently used entries are evicted first. Objects are
+    written to a temp file and renamed into place, so readers never see a
+    partial image.
+
+    IPFS content is immutable and never expires; 'url:' entries expire after
+    url_ttl_seconds (0 = never).
+    """
+
+    INDEX_VERSION = 1
+
+    def __init__(self, cache_dir, max_bytes=1024 * 1024 * 1024, url_ttl_seconds=24 * 3600,
+                 index_save_interval=5.0):
+        self.cache_dir = cache_dir
+        self.objects_dir = os.path.join(cache_dir, 'objects')
+        self.index_path = os.path.join(cache_dir, 'index.json')
+        self.max_bytes = max(1, int(max_bytes))
+        self.url_ttl_seconds = max(0, int(url_ttl_seconds))
+        self.index_save_interval = float(index_save_interval)
+
+        self._lock = threading.Lock()
+        self._index = OrderedDict()  # key -> {"file", "size", "content_type", "etag", "created"}
+        self._bytes = 0
+        self._dirty = False
+        self._last_save = 0.0
+        self._counters = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expirations": 0,
+                          "bytes_served": 0, "bytes_stored": 0}
+
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self._load_index()
+
+    # ---------- public API ----------
+
+    def key_for(self, url_or_cid):
+        return image_cache_key(url_or_cid)
+
+    @staticmethod
+    def etag_for_key(key):
+        """Strong ETag for immutable IPFS keys (derivable without a lookup); None for URL keys."""
+        if key.startswith('ipfs:'):
+            return hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]
+        return None
+
+    def lookup(self, key, count_miss=True):
+        """(path, content_type, size, etag) for a cached entry, or None. Counts as a use for LRU."""
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None:
+                if count_miss:
+                    self._counters["misses"] += 1
+                return None
+            if self._expired(key, entry):
+                self._remove(key)
+                self._counters["expirations"] += 1
+                self._counters["misses"] += 1
+                return None
+            path = self._path(entry["file"])
+            if not os.path.exists(path):
+                self._remove(key)
+                self._counters["misses"] += 1
+                return None
+            self._index.move_to_end(key)
+            self._dirty = True
+            self._counters["hits"] += 1
+            self._counters["bytes_served"] += entry["size"]
+            return path, entry["content_type"], entry["size"], entry.get("etag")
+
+    def record_miss(self):
+        """Count a miss for callers that fill the cache themselves (e.g. via writer())."""
+        with self._lock:
+            self._counters["misses"] += 1
+
+    def get(self, key, count_miss=True):
+        """(content, content_type) for a cached entry, or None."""
+        found = self.lookup(key, count_miss)
+        if found is None:
+            return None
+        path, ctype = found[0], found[1]
+        try:
+            with open(path, 'rb') as f:
+                return f.read(), ctype
+        except OSError:
+            with self._lock:
+                self._remove(key)
+            return None
+
+    def put(self, key, content, content_type=None):
+        """Store bytes under key (atomic write-then-rename). Returns the object path or None."""
+        size = len(content)
+        if size == 0 or size > self.max_bytes:
+            return None
+        fname = self._file_for(key)
+        path = self._path(fname)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, 'wb') as f:
+                f.write(content)
+            os.replace(tmp, path)
+        except OSError:
+            logging.exception("Failed to write image cache entry %s", key)
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            return None
+        etag = self.etag_for_key(key) or hashlib.sha256(content).hexdigest()[:32]
+        with self._lock:
+            self._add(key, fname, size, content_type, etag)
+        self._maybe_save()
+        return path
+
+    def writer(self, key, content_type=None):
+        """
+        Incremental writer for bytes that arrive in chunks (e.g. a streamed
+        download): write() each chunk, then commit() to publish or abort().
+        """
+        return _CacheWriter(self, key, content_type)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters,
+                        entries=len(self._index),
+                        bytes=self._bytes,
+                        max_bytes=self.max_bytes,
+                        url_ttl_seconds=self.url_ttl_seconds,
+                        hit_rate=round(self._counters["hits"] /
+                                       max(1, self._counters["hits"] + self._counters["misses"]), 4))
+
+    def save_index(self):
+        with self._lock:
+            data = json.dumps({"version": self.INDEX_VERSION,
+                               "entries": [[k, e] for k, e in self._index.items()]})
+            self._dirty = False
+            self._last_save = time.time()
+        tmp = f"{self.index_path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(tmp, self.index_path)
+        except OSError:
+            logging.exception("Failed to save image cache index")
+
+    # ---------- internals ----------
+
+    def _file_for(self, key):
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        return os.path.join(digest[:2], f"{digest}.bin")
+
+    def _path(self, fname):
+        return os.path.join(self.objects_dir, fname)
+
+    def _expired(self, key, entry):
+        return (key.startswith('url:') and self.url_ttl_seconds > 0
+                and time.time() - entry["created"] > self.url_ttl_seconds)
+
+    def _add(self, key, fname, size, content_type, etag):
+        # lock held
+        old = self._index.pop(key, None)
+        if old is not None:
+            self._bytes -= old["size"]
+        self._index[key] = {"file": fname, "size": size, "content_type": content_type,
+                            "etag": etag, "created": time.time()}
+        self._bytes += size
+        self._counters["stores"] += 1
+        self._counters["bytes_stored"] += size
+        self._dirty = True
+        while self._bytes > self.max_bytes and len(self._index) > 1:
+            self._remove(next(iter(self._index)))
+            self._counters["evictions"] += 1
+
+    def _remove(self, key):
+        # lock held
+        entry = self._index.pop(key, None)
+        if entry is None:
+            return
+        self._bytes -= entry["size"]
+        self._dirty = True
+        try:
+            os.remove(self._path(entry["file"]))
+        except OSError:
+            pass
+
+    def _maybe_save(self):
+        if self._dirty and time.time() - self._last_save >= self.index_save_interval:
+            self.save_index()
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get("version") != self.INDEX_VERSION:
+                raise ValueError(f"index version {data.get('version')}")
+            for key, entry in data["entries"]:
+                self._index[key] = entry
+                self._bytes += entry["size"]
+            logging.info("Image cache: %d entries (%.1f MiB) from index", len(self._index), self._bytes / 2 ** 20)
+        except FileNotFoundError:
+            self._rebuild_index()
+        except (OSError, ValueError, KeyError, TypeError):
+            logging.exception("Image cache index unreadable, rebuilding")
+            self._index.clear()
+            self._bytes = 0
+            self._rebuild_index()
+        with self._lock:
+            while self._bytes > self.max_bytes and self._index:
+                self._remove(next(iter(self._index)))
+                self._counters["evictions"] += 1
+
+    def _rebuild_index(self):
+        """
+        No index yet: objects cannot be mapped back to keys, so they are
+        removed along with pre-index cache files (<sha256(url)>.bin / .meta
+        directly in cache_dir). Nothing else in cache_dir is touched.
+        """
+        doomed = []
+        for root, _, files in os.walk(self.objects_dir):
+            doomed.extend(os.path.join(root, f) for f in files if OBJECT_FILE.match(f))
+        try:
+            doomed.extend(os.path.join(self.cache_dir, f) for f in os.listdir(self.cache_dir)
+                          if LEGACY_FILE.match(f))
+        except OSError:
+            pass
+        removed = 0
+        for path in doomed:
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                pass
+        if removed:
+            logging.info("Image cache: no index, removed %d unindexed files", removed)
+        self._dirty = True
+
+
+class _CacheWriter:
+    """Temp file that becomes a cache entry on commit(); dropped if it outgrows the cache."""
+
+    def __init__(self, cache, key, content_type):
+        self.cache = cache
+        self.key = key
+        self.content_type = content_type
+        self.fname = cache._file_for(key)
+        self.path = cache._path(self.fname)
+        self.size = 0
+        self._hash = hashlib.sha256()
+        self._done = False
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.tmp = f"{self.path}.{threading.get_ident()}.{id(self)}.tmp"
+        self._file = open(self.tmp, 'wb')
+
+    def write(self, chunk):
+        if self._file is None:
+            return
+        self.size += len(chunk)
+        if self.size > self.cache.max_bytes:
+            self.abort()
+            return
+        self._file.write(chunk)
+        self._hash.update(chunk)
+
+    def commit(self):
+        """Publish the entry; returns its path, or None if it was aborted."""
+        if self._file is None or self._done:
+            self.abort()
+            return None
+        self._done = True
+        try:
+            self._file.close()
+            self._file = None
+            if self.size == 0:
+                raise OSError("empty image")
+            os.replace(self.tmp, self.path)
+        except OSError:
+            logging.exception("Failed to commit image cache entry %s", self.key)
+            self.abort()
+            return None
+        etag = self.cache.etag_for_key(self.key) or self._hash.hexdigest()[:32]
+        with self.cache._lock:
+            self.cache._add(self.key, self.fname, self.size, self.content_type, etag)
+        self.cache._maybe_save()
+        return self.path
+
+    def abort(self):
+        self._done = True
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        try:
+            os.remove(self.tmp)
+        except OSError:
+            pass
@@ -0,0 +1,92 @@
+"""
+Marine DB Image Decode
+Decodes report images directly at (or near) the size they are needed at
+"""
+
+import io
+
+import numpy as np
+from PIL import Image
+
+EXIF_ORIENTATION = 0x0112
+
+# img.info key set when a JPEG was decoded below its full size
+DRAFT_FROM = 'draft_from'
+
+# A reduced decode is kept at least this many times the requested size, so
+# the final resample (box reduce, then bicubic) works from real detail rather
+# than from an image barely the target size. DCT-scaled decoding still lifts
+# channel means by about 0.001-0.003 (0-1 scale) at any scale, which can move
+# images sitting on a water threshold; benchmarks/check_decode_label_parity.py
+# reports the labels that change against a full decode.
+DRAFT_MARGIN = 2
+
+# EXIF orientation -> transpose that makes the image upright (as ImageOps.exif_transpose)
+ORIENTATION_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+
+
+def _open(source):
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    return Image.open(source)
+
+
+def decode_image(source, min_size=None, exif_transpose=True):
+    """
+    Decode bytes, a path or a file object to an upright RGB image.
+
+    With min_size=(w, h), JPEGs are decoded at 1/2, 1/4 or 1/8 scale in the
+    DCT domain (Image.draft), as small as possible while still covering
+    DRAFT_MARGIN x min_size, so a 12 MP photo headed for a 224x224 tensor
+    never exists at full resolution. Other formats cannot be decoded partially; resize_rgb()
+    box-reduces them before resampling. min_size=None decodes at full size.
+    A reduced decode carries the stored full size in img.info[DRAFT_FROM].
+    """
+    img = _open(source)
+    orientation = img.getexif().get(EXIF_ORIENTATION, 1) if exif_transpose else 1
+    if min_size and img.format == 'JPEG':
+        full_size = img.size
+        w, h = (int(v) * DRAFT_MARGIN for v in min_size)
+        # min_size is for the upright image; rotated sources are stored with w/h swapped
+        img.draft('RGB', (h, w) if orientation in (5, 6, 7, 8) else (w, h))
+        if img.size != full_size:
+            img.info[DRAFT_FROM] = full_size
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    if orientation in ORIENTATION_TRANSPOSE:
+        img = img.transpose(ORIENTATION_TRANSPOSE[orientation])
+    else:
+        img.load()
+    return img
+
+
+# Downscales by more than this factor first shrink with Image.reduce (integer
+# box filter over the exact source box), then resample; see Image.resize.
+REDUCING_GAP = 3.0
+
+
+def resize_rgb(img, size):
+    """img as RGB at exactly size (w, h); no work if it already is."""
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    if img.size != tuple(size):
+        img = img.resize(size, Image.BICUBIC, reducing_gap=REDUCING_GAP)
+    return img
+
+
+def to_array(img, size):
+    """(h, w, 3) uint8 array of img resized to size, copied once out of the PIL buffer."""
+    return np.asarray(resize_rgb(img, size))
+
+
+def decode_array(source, size, exif_transpose=True):
+    """Decode source straight to a (h, w, 3) uint8 array of the given size."""
+    return to_array(decode_image(source, min_size=size, exif_transpose=exif_transpose), size)
@@ -0,0 +1,97 @@
+"""
+Marine DB Image Pipeline
+Per-request decoded image with lazily derived, memoised representations
+"""
+
+import numpy as np
+
+from image_decode import DRAFT_FROM, DRAFT_MARGIN, decode_image, resize_rgb
+
+
+class ImagePipeline:
+    """
+    One decoded RGB image and everything derived from it during a request.
+
+    The image is decoded once (at reduced size where min_size allows, see
+    image_decode.decode_image) and every stage asks this object for the
+    representation it needs: uint8 arrays and [0, 1] float32 arrays at a
+    given size, the batched model tensor, or any value registered through
+    derive(). Each is computed on first use and reused afterwards, so the
+    water check, the heuristic and the models share one 128x128 resize and
+    one 224x224 resize instead of each converting and resizing on its own.
+
+    A reduced decode of bytes or a path keeps its source: asking for an array
+    the decoded image does not cover DRAFT_MARGIN times over decodes again at
+    that size (once), so a
+    request can start from a tiny decode for the water stats and pay for the
+    model-sized one only if it gets that far.
+    """
+
+    __slots__ = ('_rgb', '_derived', '_source', '_exif_transpose')
+
+    def __init__(self, image, source=None, exif_transpose=True):
+        self._rgb = resize_rgb(image, image.size)  # RGB, same size
+        self._derived = {}
+        self._source = source
+        self._exif_transpose = exif_transpose
+
+    @classmethod
+    def decode(cls, source, min_size=None, exif_transpose=True):
+        """Decode bytes/path/file object now; errors surface here rather than in a later stage."""
+        img = decode_image(source, min_size=min_size, exif_transpose=exif_transpose)
+        reopenable = isinstance(source, (bytes, bytearray, memoryview, str))
+        return cls(img, source if reopenable and DRAFT_FROM in img.info else None, exif_transpose)
+
+    @classmethod
+    def wrap(cls, img):
+        """Accept an ImagePipeline or a PIL image."""
+        return img if isinstance(img, cls) else cls(img)
+
+    @property
+    def rgb(self):
+        return self._rgb
+
+    @property
+    def size(self):
+        return self._rgb.size
+
+    def array(self, size):
+        """(h, w, 3) uint8 array at size (w, h)."""
+        def resize():
+            self._cover(size)
+            return np.asarray(resize_rgb(self._rgb, size))
+        return self.derive(('uint8', tuple(size)), resize)
+
+    def float_array(self, size):
+        """(h, w, 3) float32 array in [0, 1] at size (w, h)."""
+        def scale():
+            arr = self.array(size).astype(np.float32)
+            arr /= 255.0
+            return arr
+        return self.derive(('float32', tuple(size)), scale)
+
+    def model_input(self, size):
+        """(1, h, w, 3) float32 batch of one, as the models take it."""
+        return self.derive(('model', tuple(size)), lambda: self.float_array(size)[np.newaxis])
+
+    def derive(self, key, fn):
+        """fn() computed once per key for this image."""
+        try:
+            return self._derived[key]
+        except KeyError:
+            value = self._derived[key] = fn()
+            return value
+
+    def _cover(self, size):
+        """Decode the source again if the reduced decode is under DRAFT_MARGIN x size."""
+        if self._source is None or (self._rgb.width >= size[0] * DRAFT_MARGIN
+                                    and self._rgb.height >= size[1] * DRAFT_MARGIN):
+            return
+        img = decode_image(self._source, min_size=size, exif_transpose=self._exif_transpose)
+        self._rgb = resize_rgb(img, img.size)
+        if DRAFT_FROM not in img.info:
+            self._source = None  # now at full size
+
+    def derived(self):
+        """Keys computed so far (for logging/tests)."""
+        return list(self._derived)
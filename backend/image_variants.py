@@ -0,0 +1,89 @@
+"""
+Marine DB Image Variants
+Resized / re-encoded renditions of report images for thumbnails and lists
+"""
+
+import io
+
+from PIL import Image
+
+from image_decode import EXIF_ORIENTATION, ORIENTATION_TRANSPOSE, REDUCING_GAP
+
+VARIANT_FORMATS = {
+    'jpeg': ('JPEG', 'image/jpeg'),
+    'jpg': ('JPEG', 'image/jpeg'),
+    'webp': ('WEBP', 'image/webp'),
+}
+
+class VariantError(ValueError):
+    """Invalid w/h/fmt parameters."""
+
+
+def parse_variant(args, max_dim=2048, default_format='jpeg'):
+    """
+    (w, h, fmt) from request args, or None if no variant was asked for.
+    w or h alone keep the aspect ratio; both fit the image inside a w x h box.
+    """
+    w, h, fmt = args.get('w'), args.get('h'), args.get('fmt')
+    if not (w or h or fmt):
+        return None
+    try:
+        w = int(w) if w else 0
+        h = int(h) if h else 0
+    except ValueError:
+        raise VariantError("w and h must be integers")
+    if w < 0 or h < 0 or w > max_dim or h > max_dim:
+        raise VariantError(f"w and h must be between 1 and {max_dim}")
+    fmt = (fmt or default_format).lower()
+    if fmt not in VARIANT_FORMATS:
+        raise VariantError(f"fmt must be one of: {', '.join(sorted(set(VARIANT_FORMATS) - {'jpg'}))}")
+    if fmt == 'jpg':
+        fmt = 'jpeg'
+    return w, h, fmt
+
+
+def variant_key(key, w, h, fmt, quality=80, max_dim=2048):
+    """
+    Cache key of a variant: the original's key (CID or URL) plus size, format
+    and the render_variant settings, so changing those re-renders (new ETag).
+    """
+    return f"{key}#w={w or ''}&h={h or ''}&fmt={fmt}&q={quality}&max={max_dim}"
+
+
+def target_size(size, w, h, max_dim=2048):
+    """Output size for an image of `size`, fitting w/h (0 = unconstrained) without upscaling."""
+    src_w, src_h = size
+    box_w = min(w or max_dim, src_w)
+    box_h = min(h or max_dim, src_h)
+    scale = min(box_w / src_w, box_h / src_h, 1.0)
+    return max(1, round(src_w * scale)), max(1, round(src_h * scale))
+
+
+def render_variant(source, w, h, fmt, quality=80, max_dim=2048):
+    """
+    Encode a resized copy of the image at `source` (path or file object).
+    Returns (bytes, content_type).
+
+    JPEGs are decoded with draft() so libjpeg scales by 1/2, 1/4 or 1/8 in the
+    DCT domain, so a 12 MP photo is never fully decoded for a thumbnail; other
+    formats are box-reduced (reducing_gap) before the final resample.
+    """
+    pil_format, content_type = VARIANT_FORMATS[fmt]
+    with Image.open(source) as img:
+        orientation = img.getexif().get(EXIF_ORIENTATION, 1)
+        swap = orientation in (5, 6, 7, 8)  # rotated 90/270: the box applies to the transposed image
+        box_w, box_h = (h, w) if swap else (w, h)
+        out_size = target_size(img.size, box_w, box_h, max_dim)
+
+        if img.format == 'JPEG':
+            img.draft('RGB', out_size)
+        if img.mode not in ('RGB', 'L') and not (pil_format == 'WEBP' and img.mode == 'RGBA'):
+            img = img.convert('RGBA' if pil_format == 'WEBP' and 'A' in img.getbands() else 'RGB')
+        if img.size != out_size:
+            img = img.resize(out_size, Image.LANCZOS, reducing_gap=REDUCING_GAP)
+        if orientation in ORIENTATION_TRANSPOSE:
+            img = img.transpose(ORIENTATION_TRANSPOSE[orientation])
+
+        buf = io.BytesIO()
+        img.save(buf, pil_format, quality=quality, **({'method': 4} if pil_format == 'WEBP' else {'optimize': True}))
+    return buf.getvalue(), content_type
@@ -0,0 +1,213 @@
+"""
+Marine DB Inference Wrappers
+Traced tf.function inference for loaded Keras models (avoids model.predict overhead)
+and a TFLite interpreter backend for converted models
+"""
+
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+
+def _to_numpy(out):
+    if isinstance(out, (list, tuple)):
+        return [np.asarray(o) for o in out]
+    if isinstance(out, dict):
+        return [np.asarray(o) for o in out.values()]
+    return np.asarray(out)
+
+
+class KerasPredictModel:
+    """Plain model.predict path; used when compilation is disabled or fails."""
+
+    compiled = False
+    normalizes_input = False
+
+    def __init__(self, model, name=None):
+        self.model = model
+        self.name = name or getattr(model, 'name', 'model')
+
+    def infer(self, batch):
+        """Run the model on an (N, H, W, C) batch and return the output as numpy."""
+        return _to_numpy(self.model.predict(batch, verbose=0))
+
+    def warmup(self, batch_sizes=(1,)):
+        return {}
+
+
+class CompiledModel:
+    """
+    Wraps a Keras model in a traced tf.function with a fixed input signature
+    (None, H, W, C) float32. Calling it skips the data adapter, callbacks and
+    per-call setup that model.predict does, which dominate for batches of 1.
+
+    With normalize_input=True the graph divides its input by 255 itself, so
+    callers feed raw 0-255 pixel values (see model_input.InputPacker).
+    """
+
+    compiled = True
+
+    def __init__(self, model, name=None, normalize_input=False):
+        import tensorflow as tf
+
+        self.model = model
+        self.name = name or getattr(model, 'name', 'model')
+        input_shape = tuple(model.input_shape[1:])
+        if any(d is None for d in input_shape):
+            raise ValueError(f"{self.name}: input shape {model.input_shape} is not fully defined")
+        self.input_shape = input_shape
+
+        self.normalizes_input = bool(normalize_input)
+        spec = tf.TensorSpec(shape=(None,) + input_shape, dtype=tf.float32)
+        if self.normalizes_input:
+            self._fn = tf.function(lambda x: model(x / 255.0, training=False), input_signature=[spec])
+        else:
+            self._fn = tf.function(lambda x: model(x, training=False), input_signature=[spec])
+
+    def infer(self, batch):
+        """Run the model on an (N, H, W, C) batch and return the output as numpy."""
+        batch = np.asarray(batch, dtype=np.float32)
+        return _to_numpy(self._fn(batch))
+
+    def warmup(self, batch_sizes=(1,)):
+        """Trace the graph and run it once per batch size; returns timings in ms."""
+        timings = {}
+        for n in batch_sizes:
+            t0 = time.perf_counter()
+            self.infer(np.zeros((n,) + self.input_shape, dtype=np.float32))
+            timings[n] = round((time.perf_counter() - t0) * 1000.0, 2)
+        return timings
+
+
+def load_tflite_interpreter_class():
+    """
+    Prefer a standalone interpreter package (ai-edge-litert, then
+    tflite-runtime) so TFLite mode does not need TensorFlow; fall back to tf.lite.
+    """
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+        return Interpreter
+    except ImportError:
+        pass
+    try:
+        from tflite_runtime.interpreter import Interpreter
+        return Interpreter
+    except ImportError:
+        import tensorflow as tf
+        return tf.lite.Interpreter
+
+
+class TFLiteModel:
+    """
+    Runs a converted .tflite model through the TFLite interpreter.
+    Handles quantized (int8/uint8) input/output tensors and resizes the
+    input to the incoming batch size when it changes.
+    """
+
+    compiled = False
+    normalizes_input = False
+
+    def __init__(self, path, num_threads=None, name=None):
+        Interpreter = load_tflite_interpreter_class()
+        self.path = path
+        self.name = name or os.path.splitext(os.path.basename(path))[0]
+        self._interpreter = Interpreter(model_path=path, num_threads=num_threads)
+        self._interpreter.allocate_tensors()
+        self._input = self._interpreter.get_input_details()[0]
+        self._outputs = self._interpreter.get_output_details()
+        self.input_shape = tuple(int(d) for d in self._input['shape'][1:])
+        self._batch = int(self._input['shape'][0])
+        # the interpreter is not thread-safe
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _quantize(x, detail):
+        scale, zero_point = detail['quantization']
+        if detail['dtype'] in (np.int8, np.uint8) and scale:
+            info = np.iinfo(detail['dtype'])
+            return np.clip(np.round(x / scale + zero_point), info.min, info.max).astype(detail['dtype'])
+        return x.astype(detail['dtype'], copy=False)
+
+    @staticmethod
+    def _dequantize(y, detail):
+        scale, zero_point = detail['quantization']
+        if detail['dtype'] in (np.int8, np.uint8) and scale:
+            return (y.astype(np.float32) - zero_point) * scale
+        return y
+
+    def infer(self, batch):
+        """Run the model on an (N, H, W, C) batch and return the output as numpy."""
+        batch = np.asarray(batch, dtype=np.float32)
+        with self._lock:
+            if len(batch) != self._batch:
+                self._interpreter.resize_tensor_input(self._input['index'], [len(batch)] + list(self.input_shape))
+                self._interpreter.allocate_tensors()
+                self._outputs = self._interpreter.get_output_details()
+                self._batch = len(batch)
+            self._interpreter.set_tensor(self._input['index'], self._quantize(batch, self._input))
+            self._interpreter.invoke()
+            outs = [self._dequantize(self._interpreter.get_tensor(d['index']), d) for d in self._outputs]
+        return outs[0] if len(outs) == 1 else outs
+
+    def warmup(self, batch_sizes=(1,)):
+        timings = {}
+        for n in batch_sizes:
+            t0 = time.perf_counter()
+            self.infer(np.zeros((n,) + self.input_shape, dtype=np.float32))
+            timings[n] = round((time.perf_counter() - t0) * 1000.0, 2)
+        return timings
+
+
+def tflite_model_path(h5_path, variant):
+    """models/plastic_detection_model.h5 + 'int8' -> models/plastic_detection_model_int8.tflite"""
+    return f"{os.path.splitext(h5_path)[0]}_{variant}.tflite"
+
+
+def build_fused_model(tf, plastic, oil):
+    """
+    Combine the plastic and oil models into one tf.keras.Model with a shared
+    input and two outputs, so each image needs a single graph call.
+    """
+    if tuple(plastic.input_shape[1:]) != tuple(oil.input_shape[1:]):
+        raise ValueError(f"Input shapes differ: {plastic.input_shape} vs {oil.input_shape}")
+
+    # nested models must have unique names inside a functional model
+    for model, name in ((plastic, 'plastic_head'), (oil, 'oil_head')):
+        try:
+            model.name = name
+        except AttributeError:
+            model._name = name
+
+    inp = tf.keras.Input(shape=plastic.input_shape[1:], name='image')
+    fused = tf.keras.Model(inputs=inp, outputs=[plastic(inp), oil(inp)], name='plastic_oil_fused')
+
+    # sanity check: fused outputs must match the separate models
+    probe = np.random.default_rng(0).random((1,) + tuple(plastic.input_shape[1:]), dtype=np.float32)
+    p_ref = plastic.predict(probe, verbose=0)
+    o_ref = oil.predict(probe, verbose=0)
+    p_out, o_out = fused.predict(probe, verbose=0)
+    if not (np.allclose(p_ref, p_out, atol=1e-5) and np.allclose(o_ref, o_out, atol=1e-5)):
+        raise ValueError("Fused model outputs do not match the separate models")
+    return fused
+
+
+def wrap_model(model, compiled=True, warmup=True, name=None, normalize_input=False):
+    """
+    Return an object exposing infer(batch) -> np.ndarray for model.
+    Uses CompiledModel when possible and falls back to model.predict.
+    normalize_input is a request: check runner.normalizes_input for whether
+    the returned runner divides by 255 itself.
+    """
+    if compiled:
+        try:
+            runner = CompiledModel(model, name=name, normalize_input=normalize_input)
+            if warmup:
+                timings = runner.warmup()
+                logging.info("Compiled inference ready for %s (warmup ms: %s)", runner.name, timings)
+            return runner
+        except Exception:
+            logging.exception("Could not compile %s, using model.predict", name or getattr(model, 'name', 'model'))
+    return KerasPredictModel(model, name=name)
@@ -0,0 +1,531 @@
+"""
+Marine DB Inference Pool
+Runs the models in N worker processes fed with uint8 tensors through shared memory
+"""
+
+import logging
+import multiprocessing as mp
+import os
+import queue
+import sys
+import threading
+import time
+import types
+from collections import Counter
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeout
+from multiprocessing import connection as mp_connection
+from multiprocessing import shared_memory
+
+import numpy as np
+
+N_OUTPUTS = 2  # plastic, oil
+
+
+def available_cores():
+    """CPU ids this process may run on."""
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def worker_cores(index, workers, cores_per_worker=None, cores=None):
+    """
+    Cores for worker `index`: consecutive blocks of `cores`, wrapping around
+    when workers * cores_per_worker exceeds them.
+    """
+    cores = list(cores if cores is not None else available_cores())
+    per = int(cores_per_worker or max(1, len(cores) // max(1, workers)))
+    start = index * per
+    return [cores[(start + k) % len(cores)] for k in range(min(per, len(cores)))]
+
+
+class SlotLayout:
+    """
+    Shared-memory layout: `slots` input slots of (capacity, H, W, 3) uint8
+    followed by their (capacity, N_OUTPUTS) float32 outputs.
+    """
+
+    def __init__(self, slots, capacity, input_shape):
+        self.slots = int(slots)
+        self.capacity = int(capacity)
+        self.input_shape = tuple(int(d) for d in input_shape)
+        self.input_bytes = self.slots * self.capacity * int(np.prod(self.input_shape))
+        self.output_offset = -(-self.input_bytes // 64) * 64
+        self.nbytes = self.output_offset + self.slots * self.capacity * N_OUTPUTS * 4
+
+    def views(self, buf):
+        inputs = np.ndarray((self.slots, self.capacity) + self.input_shape, dtype=np.uint8, buffer=buf)
+        outputs = np.ndarray((self.slots, self.capacity, N_OUTPUTS), dtype=np.float32, buffer=buf,
+                             offset=self.output_offset)
+        return inputs, outputs
+
+
+def load_runners(spec, runtime=None):
+    """
+    Load the models described by spec (a dict, see InferencePool) in this
+    process, applying runtime's TF threading first (tf_runtime.RuntimeConfig).
+    Returns (infer, info): infer(float32 batch) -> (plastic_raw, oil_raw).
+    """
+    from inference import TFLiteModel, build_fused_model, tflite_model_path, wrap_model
+
+    if spec['backend'] == 'tflite':
+        runners = [TFLiteModel(tflite_model_path(spec[k], spec['tflite_variant']),
+                               num_threads=spec.get('intra_op_threads'), name=name)
+                   for k, name in (('plastic_path', 'plastic'), ('oil_path', 'oil'))]
+        for runner in runners:
+            runner.warmup()
+        mode = 'separate'
+    else:
+        import tensorflow as tf
+        if runtime is not None:
+            runtime.apply_tensorflow(tf)
+        plastic = tf.keras.models.load_model(spec['plastic_path'])
+        oil = tf.keras.models.load_model(spec['oil_path'])
+        fused = None
+        if spec.get('mode', 'fused') == 'fused':
+            try:
+                fused = build_fused_model(tf, plastic, oil)
+            except Exception:
+                logging.exception("Could not build fused model, using separate models")
+        kwargs = dict(compiled=spec.get('compiled', True), normalize_input=spec.get('normalize_input', True))
+        if fused is not None:
+            runners = [wrap_model(fused, name='fused', **kwargs)]
+        else:
+            runners = [wrap_model(plastic, name='plastic', **kwargs), wrap_model(oil, name='oil', **kwargs)]
+            if runners[0].normalizes_input != runners[1].normalizes_input:
+                runners = [wrap_model(plastic, compiled=kwargs['compiled'], name='plastic'),
+                           wrap_model(oil, compiled=kwargs['compiled'], name='oil')]
+        mode = 'fused' if fused is not None else 'separate'
+
+    if len(runners) == 1:
+        infer = runners[0].infer
+    else:
+        def infer(x):
+            return runners[0].infer(x), runners[1].infer(x)
+    input_shape = tuple(getattr(runners[0], 'input_shape', None) or spec['input_shape'])
+    info = {
+        "model_mode": mode,
+        "compiled": bool(runners[0].compiled),
+        "normalizes_input": bool(runners[0].normalizes_input),
+        "input_shape": list(input_shape),
+    }
+    return infer, info
+
+
+def _worker_main(index, spec, shm_name, layout, jobs, results, cores):
+    """
+    Worker process: pin, load models, then run batches of the slots sent on
+    its own jobs pipe until a None job (or the pipe closes), answering on its
+    own results pipe.
+    """
+    from tf_runtime import RuntimeConfig
+    runtime = RuntimeConfig(intra_op_threads=spec.get('intra_op_threads') or len(cores) or 1,
+                            inter_op_threads=spec.get('inter_op_threads'), onednn=spec.get('onednn', ''),
+                            cpu_affinity=cores)
+    runtime.apply_process()
+    logging.basicConfig(level=logging.INFO, format=f'%(asctime)s - %(levelname)s - [worker {index}] %(message)s')
+
+    started = time.perf_counter()
+    try:
+        infer, info = load_runners(spec, runtime)
+        if tuple(info["input_shape"]) != layout.input_shape:
+            raise ValueError(f"Model input {info['input_shape']} does not match the pool's {list(layout.input_shape)}")
+        shm = shared_memory.SharedMemory(name=shm_name)
+    except Exception as e:
+        logging.exception("Inference worker %d failed to start", index)
+        results.send(('failed', repr(e)))
+        return
+
+    from model_input import InputPacker
+    inputs, outputs = layout.views(shm.buf)
+    max_batch = int(spec.get('max_batch', layout.capacity))
+    packer = InputPacker(layout.input_shape, capacity=max_batch, normalize=not info["normalizes_input"], buffers=1)
+    results.send(('ready', dict(info, pid=os.getpid(), cores=list(cores),
+                                load_seconds=round(time.perf_counter() - started, 2))))
+
+    held = []  # a job drained from the pipe that did not fit the last batch
+    while True:
+        try:
+            job = held.pop() if held else jobs.recv()
+        except EOFError:
+            break
+        if job is None:
+            break
+        batch, n = [job], job[1]
+        # drain whatever else is already queued into the same model call
+        while n < max_batch and jobs.poll():
+            job = jobs.recv()
+            if job is None or n + job[1] > max_batch:
+                held.append(job)
+                break
+            batch.append(job)
+            n += job[1]
+        slots = [slot for slot, _ in batch]
+        try:
+            with packer.pack([inputs[slot, :k] for slot, k in batch]) as x:
+                p_raw, o_raw = infer(x)
+            p = np.asarray(p_raw).reshape(n, -1)[:, 0]
+            o = np.asarray(o_raw).reshape(n, -1)[:, 0]
+            row = 0
+            for slot, k in batch:
+                outputs[slot, :k, 0] = p[row:row + k]
+                outputs[slot, :k, 1] = o[row:row + k]
+                row += k
+            results.send(('done', slots, None))
+        except Exception as e:
+            logging.exception("Inference worker %d batch failed", index)
+            results.send(('done', slots, repr(e)))
+    del inputs, outputs
+    try:
+        shm.close()
+    except BufferError:
+        pass  # a view is still referenced; the mapping goes away with the process
+
+
+class _Worker:
+    """Serving-side handle of one worker process and the slots assigned to it."""
+
+    __slots__ = ('index', 'proc', 'jobs', 'results', 'assigned')
+
+    def __init__(self, index, proc, jobs, results):
+        self.index = index
+        self.proc = proc
+        self.jobs = jobs          # send end of the worker's job pipe
+        self.results = results    # receive end of its results pipe
+        self.assigned = {}        # slot -> n images, sent and not yet answered
+
+    def close(self):
+        for conn in (self.jobs, self.results):
+            try:
+                conn.close()
+            except OSError:
+                pass
+
+
+class InferencePool:
+    """
+    N worker processes, each with its own copy of the models, pinned to its
+    own block of cores with matching TF intra/inter-op thread counts.
+
+    The serving process only copies preprocessed uint8 (n, H, W, 3) tensors
+    into a free slot of one shared-memory block and sends the slot id to the
+    least loaded worker over that worker's own pipe; the tensor itself never
+    goes through a pipe. A worker drains every slot id already sent to it
+    into the same model call (up to max_batch images), writes the two model
+    outputs back into the slots and reports them done on its results pipe.
+
+    The serving side records which worker each slot was sent to, so when a
+    worker exits, however it died, a dispatcher thread fails exactly the
+    slots still assigned to it, returns them to the free list and starts a
+    replacement with fresh pipes. Nothing a worker held can outlive it (a
+    queue lock, a half-written message), and answers it sent before dying
+    are read before its exit is handled.
+
+    spec describes the models (the same settings the in-process path uses):
+    backend, plastic_path, oil_path, tflite_variant, mode, compiled,
+    normalize_input, input_shape, plus intra_op_threads (default: the
+    worker's core count), inter_op_threads, onednn ('on' / 'off' / '', see
+    tf_runtime.RuntimeConfig) and max_batch.
+
+    on_ready, if given, is called (from the dispatcher thread) the first time
+    a worker is ready.
+    """
+
+    def __init__(self, spec, workers, slots=None, cores_per_worker=None, cores=None, start_timeout=300.0,
+                 name='inference', on_ready=None):
+        self.spec = dict(spec)
+        self.workers = max(1, int(workers))
+        self.name = name
+        self.max_batch = int(self.spec.setdefault('max_batch', 16))
+        self.input_shape = tuple(int(d) for d in self.spec['input_shape'])
+        self.layout = SlotLayout(slots or self.workers * 4, self.max_batch, self.input_shape)
+        self._cores = [worker_cores(i, self.workers, cores_per_worker, cores) for i in range(self.workers)]
+        self.start_timeout = float(start_timeout)
+
+        self._ctx = mp.get_context('spawn')
+        self._shm = shared_memory.SharedMemory(create=True, size=self.layout.nbytes)
+        self._inputs, self._outputs = self.layout.views(self._shm.buf)
+
+        self._free = queue.Queue()
+        for slot in range(self.layout.slots):
+            self._free.put(slot)
+        self._lock = threading.Lock()
+        self._pending = {}  # slot -> (future, n)
+        self._workers = [None] * self.workers
+        self._info = {}  # worker index -> info from its 'ready' message
+        self._ready = threading.Event()
+        self._on_ready = on_ready
+        self._failed = set()  # workers whose model load failed
+        self._closed = False
+        self._counters = Counter()
+        self._batch_sizes = Counter()
+
+        for index in range(self.workers):
+            self._start_worker(index)
+        self._dispatcher = threading.Thread(target=self._dispatch, name=f"{name}-dispatch", daemon=True)
+        self._dispatcher.start()
+
+    # ---------- serving side ----------
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    @property
+    def failed(self):
+        """True when every worker failed to load the models."""
+        return len(self._failed) >= self.workers
+
+    def wait_ready(self, timeout=None):
+        """Block until at least one worker has loaded its models."""
+        return self._ready.wait(timeout)
+
+    def model_info(self):
+        """Model settings reported by the first ready worker (None before any is ready)."""
+        with self._lock:
+            return next(iter(self._info.values()), None)
+
+    def infer(self, pixels, timeout=None):
+        """
+        Run both models on uint8 pixels, an (n, H, W, 3) array or a list of
+        (H, W, 3) arrays. Returns (plastic_raw, oil_raw), each (n, 1).
+        """
+        if not isinstance(pixels, np.ndarray):
+            pixels = np.stack(pixels)
+        if pixels.ndim == len(self.input_shape):
+            pixels = pixels[np.newaxis]
+        if pixels.shape[1:] != self.input_shape:
+            raise ValueError(f"Expected images of shape {self.input_shape}, got {pixels.shape[1:]}")
+        if self._closed:
+            raise RuntimeError(f"Inference pool '{self.name}' is closed")
+        if self.failed:
+            raise RuntimeError(f"Inference pool '{self.name}' has no workers: every worker failed to load the models")
+        deadline = None if timeout is None else time.monotonic() + timeout
+        futures = [self._submit(pixels[i:i + self.max_batch], deadline)
+                   for i in range(0, len(pixels), self.max_batch)]
+        try:
+            out = np.concatenate([f.result(timeout=None if deadline is None else max(0.0, deadline - time.monotonic()))
+                                  for f in futures])
+        except FutureTimeout:
+            with self._lock:
+                self._counters["timeouts"] += 1
+            raise TimeoutError(f"Inference pool '{self.name}' did not answer within {timeout}s") from None
+        return out[:, :1], out[:, 1:2]
+
+    def _submit(self, chunk, deadline):
+        try:
+            slot = self._free.get(timeout=None if deadline is None else max(0.0, deadline - time.monotonic()))
+        except queue.Empty:
+            raise TimeoutError(f"No free inference slot in pool '{self.name}'") from None
+        n = len(chunk)
+        self._inputs[slot, :n] = chunk
+        fut = Future()
+        with self._lock:
+            worker = self._pick_worker()
+            if worker is None:
+                self._free.put(slot)
+                raise RuntimeError(f"Inference pool '{self.name}' has no live workers")
+            self._pending[slot] = (fut, n)
+            worker.assigned[slot] = n
+            self._counters["jobs"] += 1
+            self._counters["images"] += n
+            try:
+                worker.jobs.send((slot, n))
+            except (OSError, ValueError) as e:
+                # the worker is gone; the dispatcher fails its assigned slots when it reaps it
+                logging.debug("Could not send job to inference worker %d: %s", worker.index, e)
+        return fut
+
+    def _pick_worker(self):
+        """Least loaded worker, preferring ones that are ready; None if none can take work. Holds _lock."""
+        live = [w for w in self._workers
+                if w is not None and w.index not in self._failed and w.proc.exitcode is None]
+        if not live:
+            return None
+        ready = [w for w in live if w.index in self._info]
+        return min(ready or live, key=lambda w: sum(w.assigned.values()))
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+            batches = sum(self._batch_sizes.values())
+            workers = [{
+                "index": i,
+                "alive": bool(w is not None and w.proc.is_alive()),
+                "pid": w.proc.pid if w is not None else None,
+                "cores": self._cores[i],
+                "ready": i in self._info,
+                "assigned_slots": len(w.assigned) if w is not None else 0,
+                "load_seconds": self._info.get(i, {}).get("load_seconds"),
+            } for i, w in enumerate(self._workers)]
+            slots_busy = len(self._pending)
+            histogram = {str(k): v for k, v in sorted(self._batch_sizes.items())}
+        return {
+            "workers": self.workers,
+            "ready_workers": sum(w["ready"] for w in workers),
+            "slots": self.layout.slots,
+            "slots_busy": slots_busy,
+            "max_batch": self.max_batch,
+            "shared_memory_bytes": self.layout.nbytes,
+            "jobs": counters.get("jobs", 0),
+            "images": counters.get("images", 0),
+            "batches": batches,
+            "mean_batch_images": round(counters.get("batched_images", 0) / batches, 2) if batches else 0.0,
+            "batch_jobs_histogram": histogram,
+            "errors": counters.get("errors", 0),
+            "timeouts": counters.get("timeouts", 0),
+            "restarts": counters.get("restarts", 0),
+            "reclaimed_slots": counters.get("reclaimed_slots", 0),
+            "load_failures": counters.get("load_failures", 0),
+            "worker_detail": workers,
+        }
+
+    def close(self, timeout=10.0):
+        if self._closed:
+            return
+        self._closed = True
+        with self._lock:
+            workers = [w for w in self._workers if w is not None]
+            for w in workers:
+                try:
+                    w.jobs.send(None)
+                except (OSError, ValueError):
+                    pass
+        for w in workers:
+            w.proc.join(timeout)
+            if w.proc.is_alive():
+                w.proc.terminate()
+        self._dispatcher.join(timeout=2)
+        for w in workers:
+            w.close()
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for fut, _ in pending.values():
+            if not fut.done():
+                fut.set_exception(RuntimeError(f"Inference pool '{self.name}' closed"))
+        del self._inputs, self._outputs
+        self._shm.close()
+        self._shm.unlink()
+
+    # ---------- workers ----------
+
+    def _start_worker(self, index):
+        jobs_recv, jobs_send = self._ctx.Pipe(duplex=False)
+        results_recv, results_send = self._ctx.Pipe(duplex=False)
+        proc = self._ctx.Process(target=_worker_main, name=f"{self.name}-worker-{index}", daemon=True,
+                                 args=(index, dict(self.spec, intra_op_threads=self.spec.get('intra_op_threads')
+                                                   or len(self._cores[index])),
+                                       self._shm.name, self.layout, jobs_recv, results_send, self._cores[index]))
+        # Workers only need this module; don't let spawn re-run the serving
+        # script (__main__) in every worker, which would start the whole service again.
+        main = sys.modules.get('__main__')
+        sys.modules['__main__'] = types.ModuleType('__main__')
+        try:
+            proc.start()
+        finally:
+            sys.modules['__main__'] = main
+        # keep only our ends, so a dead worker shows up as EOF / a broken pipe
+        jobs_recv.close()
+        results_send.close()
+        with self._lock:
+            self._workers[index] = _Worker(index, proc, jobs_send, results_recv)
+        logging.info("Inference worker %d starting (pid %s, cores %s)", index, proc.pid, self._cores[index])
+
+    def _dispatch(self):
+        deadline = time.monotonic() + self.start_timeout
+        while not self._closed:
+            with self._lock:
+                workers = {w.results: w for w in self._workers if w is not None}
+            if not workers:
+                time.sleep(1.0)
+                continue
+            for conn in mp_connection.wait(list(workers), timeout=1.0):
+                worker = workers[conn]
+                try:
+                    msg = conn.recv()
+                except (EOFError, OSError):
+                    self._reap(worker)
+                    continue
+                self._handle(worker, msg)
+            for worker in workers.values():
+                if worker.proc.exitcode is not None and not self._closed:
+                    self._reap(worker)
+            if deadline is not None and time.monotonic() > deadline:
+                if not self._ready.is_set():
+                    logging.error("No inference worker became ready within %.0fs", self.start_timeout)
+                deadline = None
+
+    def _handle(self, worker, msg):
+        index, kind = worker.index, msg[0]
+        if kind == 'ready':
+            with self._lock:
+                self._info[index] = msg[1]
+                first = not self._counters["ready_events"]
+                self._counters["ready_events"] += 1
+            logging.info("Inference worker %d ready: %s", index, msg[1])
+            self._ready.set()
+            if first and self._on_ready is not None:
+                try:
+                    self._on_ready()
+                except Exception:
+                    logging.exception("on_ready callback failed")
+        elif kind == 'failed':
+            logging.error("Inference worker %d failed to load models: %s", index, msg[1])
+            with self._lock:
+                self._counters["load_failures"] += 1
+                self._failed.add(index)
+        elif kind == 'done':
+            slots, error = msg[1], msg[2]
+            with self._lock:
+                for slot in slots:
+                    worker.assigned.pop(slot, None)
+                self._batch_sizes[len(slots)] += 1
+                self._counters["batched_images"] += sum(self._pending[s][1] for s in slots if s in self._pending)
+                if error:
+                    self._counters["errors"] += 1
+            for slot in slots:
+                self._finish(slot, error)
+
+    def _finish(self, slot, error):
+        with self._lock:
+            fut, n = self._pending.pop(slot, (None, 0))
+        if fut is not None and not fut.done():
+            if error:
+                fut.set_exception(RuntimeError(f"Inference worker error: {error}"))
+            else:
+                fut.set_result(self._outputs[slot, :n].copy())
+        self._free.put(slot)
+
+    def _reap(self, worker):
+        """Worker exited: fail and free every slot still assigned to it, then replace it."""
+        index = worker.index
+        with self._lock:
+            if self._workers[index] is not worker:
+                return  # already reaped
+            self._workers[index] = None
+            was_ready = self._info.pop(index, None) is not None
+            if not was_ready and index not in self._failed:
+                # died while loading without reporting why
+                self._failed.add(index)
+                self._counters["load_failures"] += 1
+            slots, worker.assigned = list(worker.assigned), {}
+            self._counters["reclaimed_slots"] += len(slots)
+            if not self._info:
+                self._ready.clear()
+        worker.proc.join(timeout=5)
+        worker.close()
+        if slots:
+            logging.error("Inference worker %d exited with %d job(s) assigned; failing them", index, len(slots))
+        for slot in slots:
+            self._finish(slot, f"worker {index} exited with code {worker.proc.exitcode}")
+        if self._closed:
+            return
+        if was_ready:
+            logging.error("Inference worker %d exited (code %s), restarting", index, worker.proc.exitcode)
+            with self._lock:
+                self._counters["restarts"] += 1
+            self._start_worker(index)
+        else:
+            logging.error("Inference worker %d exited before loading the models (code %s)",
+                          index, worker.proc.exitcode)
@@ -0,0 +1,104 @@
+"""
+Marine DB Model Input
+Packs uint8 images into preallocated, reused float32 model input buffers
+"""
+
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+PIXEL_SCALE = np.float32(255.0)
+
+
+class InputPacker:
+    """
+    Writes uint8 (H, W, 3) images, or (n, H, W, 3) stacks, into a float32
+    (capacity, H, W, 3) buffer taken from a small shared pool and yields a
+    view of the filled rows. At most `buffers` pooled buffers are ever
+    allocated, however many threads pack (the werkzeug server runs every
+    request on a new thread); they are handed out under a lock and returned
+    when the `with` block ends, so packing a request allocates no pixel
+    arrays once the pool is warm. A batch larger than capacity, or a pack
+    while every pooled buffer is in use, gets a one-off buffer of exactly n
+    rows instead (counted as transient in stats()).
+
+    With normalize=True pixels are divided by 255 in place; pass False when
+    the model graph divides by 255 itself (CompiledModel(normalize_input=True)),
+    in which case packing is a plain uint8 -> float32 copy.
+
+        with packer.pack(images) as x:
+            out = model(x)
+
+    The view belongs to the next caller once the block exits: run the model
+    inside it.
+    """
+
+    def __init__(self, input_shape, capacity=16, normalize=True, buffers=4):
+        self.input_shape = tuple(int(d) for d in input_shape)
+        self.capacity = max(1, int(capacity))
+        self.normalize = bool(normalize)
+        self.max_buffers = max(1, int(buffers))
+        self._lock = threading.Lock()
+        self._free = []
+        self._pooled = 0
+        self._counters = {"packs": 0, "images": 0, "buffers": 0, "buffer_bytes": 0, "in_use": 0,
+                          "transient": 0, "transient_bytes": 0}
+
+    @contextmanager
+    def pack(self, images):
+        """Context manager yielding a float32 (n, H, W, 3) view holding images, in order."""
+        n = 0
+        for img in images:
+            n += len(img) if img.ndim == len(self.input_shape) + 1 else 1
+        buf, pooled = self._acquire(n)
+        try:
+            row = 0
+            for img in images:
+                if img.ndim == len(self.input_shape):
+                    img = img[np.newaxis]
+                if img.shape[1:] != self.input_shape:
+                    raise ValueError(f"Expected images of shape {self.input_shape}, got {img.shape[1:]}")
+                out = buf[row:row + len(img)]
+                np.copyto(out, img, casting='unsafe')
+                if self.normalize:
+                    np.divide(out, PIXEL_SCALE, out=out)
+                row += len(img)
+            with self._lock:
+                self._counters["packs"] += 1
+                self._counters["images"] += n
+            yield buf[:n]
+        finally:
+            if pooled:
+                self._release(buf)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, max_buffers=self.max_buffers, input_shape=list(self.input_shape),
+                        capacity=self.capacity, normalize=self.normalize)
+
+    def _acquire(self, n):
+        """(buffer with >= n rows, whether it goes back to the pool)."""
+        with self._lock:
+            if n <= self.capacity and self._free:
+                self._counters["in_use"] += 1
+                return self._free.pop(), True
+            pooled = n <= self.capacity and self._pooled < self.max_buffers
+            rows = self.capacity if pooled else n
+            if pooled:
+                self._pooled += 1
+                self._counters["in_use"] += 1
+                self._counters["buffers"] += 1
+                self._counters["buffer_bytes"] += self._nbytes(rows)
+            else:
+                self._counters["transient"] += 1
+                self._counters["transient_bytes"] += self._nbytes(rows)
+        return np.empty((rows,) + self.input_shape, dtype=np.float32), pooled
+
+    def _release(self, buf):
+        with self._lock:
+            self._free.append(buf)
+            self._counters["in_use"] -= 1
+
+    def _nbytes(self, rows):
+        return rows * int(np.prod(self.input_shape)) * 4
@@ -1,36 +1,55 @@
+import atexit
+import importlib.util
 import io
 import os
 import sys
 import logging
-from flask import Flask, request, jsonify, send_file, render_template_string
+import threading
+from flask import Flask, request, jsonify, send_file, render_template_string, Response, stream_with_context
 from flask_cors import CORS
 from PIL import Image, UnidentifiedImageError
 import numpy as np
 import requests
 import time
-from urllib.parse import urlparse
 from datetime import datetime
 import json
 import base64
 from io import BytesIO
 import random
 from datetime import timedelta
+from color_stats import channel_means, mean_saturation
+from batching import MicroBatcher
+from inference import TFLiteModel, build_fused_model, tflite_model_path, wrap_model
+from inference_pool import InferencePool
+from model_input import InputPacker
+from batch_heuristics import BatchHeuristics
+from classification_stages import STATS_GATES, STRICT_GATES, StageCounters, parse_gate
+from prediction_cache import PredictionCache
+from batch_jobs import JobManager
+from prediction_store import PredictionIndex, open_store
+from gateway_fetch import DEFAULT_GATEWAYS, HedgedFetcher, candidate_urls, gateway_url, sequential_fetch
+from gateway_registry import GatewayRegistry
+from http_client import get_client
+from image_cache import ImageCache
+from image_decode import DRAFT_MARGIN
+from image_pipeline import ImagePipeline
+from image_variants import VariantError, parse_variant, render_variant, variant_key
+from singleflight import SingleFlight
+from tf_runtime import RuntimeConfig
+
+# start of the import-to-ready measurement (see load_models_and_report)
+_IMPORT_STARTED = time.perf_counter()
 
 app = Flask(__name__)
 CORS(app)
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-# AUTO-DETECT TensorFlow (no hardcoded fallback)
-try:
-    import tensorflow
-    TF_AVAILABLE = True
-    TF_IMPORT_ERROR = None
-    logging.info("=" * 70)
-    logging.info("✓ TensorFlow AVAILABLE - Attempting to load models")
-    logging.info("=" * 70)
-except ImportError as e:
-    TF_AVAILABLE = False
-    TF_IMPORT_ERROR = str(e)
+# TensorFlow thread pools, oneDNN and CPU affinity (tf_runtime.py; see config.py).
+# Applied before TensorFlow is imported and before any model loads.
+TF_RUNTIME = RuntimeConfig.from_env()
+TF_RUNTIME.apply_process()
+
+def log_fallback_mode():
     logging.info("=" * 70)
     logging.info("FALLBACK MODE ENABLED (no TensorFlow)")
     logging.info("=" * 70)
@@ -39,8 +58,49 @@ except ImportError as e:
     logging.info("Install: pip install tensorflow-cpu==2.19.0")
     logging.info("=" * 70)
 
+# AUTO-DETECT TensorFlow (no hardcoded fallback). Only whether it is installed is
+# checked here; import_tensorflow() imports it when the models load, so importing
+# this module does not wait for TensorFlow.
+tf_module = None
+TF_AVAILABLE = importlib.util.find_spec('tensorflow') is not None
+TF_IMPORT_ERROR = None if TF_AVAILABLE else "No module named 'tensorflow'"
+if not TF_AVAILABLE:
+    log_fallback_mode()
+
+def import_tensorflow():
+    """Import TensorFlow once (with TF_RUNTIME's threading applied); None if it cannot be imported."""
+    global tf_module, TF_AVAILABLE, TF_IMPORT_ERROR
+    if tf_module is not None or not TF_AVAILABLE:
+        return tf_module
+    t0 = time.perf_counter()
+    try:
+        import tensorflow
+    except ImportError as e:
+        TF_AVAILABLE = False
+        TF_IMPORT_ERROR = str(e)
+        log_fallback_mode()
+        return None
+    TF_RUNTIME.apply_tensorflow(tensorflow)
+    tf_module = tensorflow
+    logging.info("=" * 70)
+    logging.info("✓ TensorFlow AVAILABLE (imported in %.1fs) - Attempting to load models", time.perf_counter() - t0)
+    logging.info("=" * 70)
+    return tf_module
+
 plastic_model = None
 oil_model = None
+plastic_batcher = None
+oil_batcher = None
+fused_model = None
+fused_batcher = None
+# infer(batch) wrappers around the loaded models (see inference.py)
+plastic_runner = None
+oil_runner = None
+fused_runner = None
+# packs uint8 pixels into reused float32 input buffers (see model_input.py)
+input_packer = None
+# worker processes running the models when PRED_INFERENCE_WORKERS > 0 (see inference_pool.py)
+inference_pool = None
 
 # Model paths (adjust names if different)
 PLASTIC_MODEL_PATH = os.path.join(os.path.dirname(__file__), 'models', 'plastic_detection_model.h5')
@@ -53,10 +113,164 @@ OIL_THRESHOLD = float(os.environ.get('PRED_OIL_THRESHOLD', 0.35))
 NONE_THRESHOLD = float(os.environ.get('PRED_NONE_THRESHOLD', 0.15))
 CONFIDENCE_THRESHOLD = float(os.environ.get('PRED_CONFIDENCE_THRESHOLD', 0.35))  # ← LOWERED from 0.60 to 0.35
 
+# Micro-batching: merge concurrent requests into one model call per model
+BATCHING_ENABLED = os.environ.get('PRED_BATCHING', 'true').lower() == 'true'
+BATCH_MAX_SIZE = int(os.environ.get('PRED_BATCH_MAX_SIZE', 16))
+BATCH_MAX_WAIT_MS = float(os.environ.get('PRED_BATCH_MAX_WAIT_MS', 10))
+
+# Inference backend: 'keras' (.h5 via TensorFlow) or 'tflite' (converted models, see convert_tflite.py)
+PRED_BACKEND = os.environ.get('PRED_BACKEND', 'keras').lower()
+TFLITE_VARIANT = os.environ.get('PRED_TFLITE_VARIANT', 'fp16').lower()
+TFLITE_THREADS = (int(os.environ['PRED_TFLITE_THREADS']) if os.environ.get('PRED_TFLITE_THREADS')
+                  else TF_RUNTIME.intra_op_threads)
+
+# Traced tf.function inference instead of model.predict
+COMPILED_INFERENCE = os.environ.get('PRED_COMPILED_INFERENCE', 'true').lower() == 'true'
+# Divide pixels by 255 inside the compiled graph instead of in numpy (needs compiled inference)
+NORMALIZE_IN_GRAPH = os.environ.get('PRED_NORMALIZE_IN_GRAPH', 'true').lower() == 'true'
+
+# 'fused' runs plastic + oil as one two-headed graph; 'separate' keeps two model calls
+MODEL_MODE = os.environ.get('PRED_MODEL_MODE', 'fused').lower()
+
+# Multi-process inference: N worker processes with their own model copies, each
+# pinned to PRED_INFERENCE_CORES_PER_WORKER cores (default: an equal share),
+# fed preprocessed tensors through shared memory. 0 runs the models in this process.
+INFERENCE_WORKERS = int(os.environ.get('PRED_INFERENCE_WORKERS', 0))
+INFERENCE_CORES_PER_WORKER = int(os.environ.get('PRED_INFERENCE_CORES_PER_WORKER', 0)) or None
+INFERENCE_INTRA_OP_THREADS = int(os.environ.get('PRED_INFERENCE_INTRA_OP_THREADS', 0)) or None  # default: cores per worker
+INFERENCE_INTER_OP_THREADS = int(os.environ.get('PRED_INFERENCE_INTER_OP_THREADS', 1))
+INFERENCE_TIMEOUT = float(os.environ.get('PRED_INFERENCE_TIMEOUT', 60))
+
+# 'background' (default): the module imports and the HTTP server starts at once while
+# a thread imports TensorFlow and loads the models; until then predictions use the
+# heuristic (meta.models_loading) and /health reports "loading".
+# 'sync': load before the module finishes importing.
+MODEL_LOAD_MODE = os.environ.get('PRED_MODEL_LOAD', 'background').lower()
+MODEL_LOAD_STATE = 'loading'  # loading -> ready | unavailable (in-process models)
+MODEL_LOAD_SECONDS = None  # import-to-ready time
+model_load_done = threading.Event()
+
+def models_ready():
+    """True when model inference (Keras or TFLite, in process or in the worker pool) is available."""
+    if inference_pool is not None:
+        return inference_pool.ready
+    return MODEL_LOAD_STATE == 'ready'
+
+def model_state():
+    """'loading', 'ready' or 'unavailable' (heuristic only)."""
+    if inference_pool is not None:
+        if inference_pool.ready:
+            return 'ready'
+        return 'unavailable' if inference_pool.failed else 'loading'
+    return MODEL_LOAD_STATE
+
+def wait_for_models(timeout=None):
+    """Block until the model load has finished (or timeout); returns models_ready()."""
+    if model_load_done.wait(timeout) and inference_pool is not None:
+        inference_pool.wait_ready(timeout)
+    return models_ready()
+
+def model_settings():
+    """(model_mode, compiled, normalizes_input) of whatever runs the models."""
+    if inference_pool is not None:
+        info = inference_pool.model_info() or {}
+        return info.get("model_mode"), bool(info.get("compiled")), bool(info.get("normalizes_input"))
+    runner = fused_runner or plastic_runner
+    return ("fused" if fused_model is not None else "separate",
+            bool(runner is not None and runner.compiled), bool(runner is not None and runner.normalizes_input))
+
+def start_batchers():
+    """
+    Create the input packer for the loaded runners, then start micro-batchers
+    around them (if batching is enabled); batchers and direct calls share the
+    packer's small pool of float32 buffers.
+    """
+    global plastic_batcher, oil_batcher, fused_batcher, input_packer
+    runners = [r for r in (fused_runner, plastic_runner, oil_runner) if r is not None]
+    input_packer = InputPacker(getattr(runners[0], 'input_shape', (224, 224, 3)), capacity=BATCH_MAX_SIZE,
+                               normalize=not runners[0].normalizes_input)
+    if not BATCHING_ENABLED:
+        return
+    if fused_runner is not None:
+        fused_batcher = MicroBatcher(fused_runner.infer,
+                                     BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS, name='fused', pack=input_packer.pack)
+    else:
+        plastic_batcher = MicroBatcher(plastic_runner.infer,
+                                       BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS, name='plastic', pack=input_packer.pack)
+        oil_batcher = MicroBatcher(oil_runner.infer,
+                                   BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS, name='oil', pack=input_packer.pack)
+    logging.info("Micro-batching enabled (max_batch=%d, max_wait=%.1fms)",
+                 BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS)
+
+def load_tflite_models():
+    """Load the converted .tflite models into TFLite interpreters."""
+    global plastic_runner, oil_runner, TF_IMPORT_ERROR
+    plastic_path = tflite_model_path(PLASTIC_MODEL_PATH, TFLITE_VARIANT)
+    oil_path = tflite_model_path(OIL_MODEL_PATH, TFLITE_VARIANT)
+    logging.info("Loading TFLite models (%s): %s, %s", TFLITE_VARIANT, plastic_path, oil_path)
+    if not os.path.exists(plastic_path) or not os.path.exists(oil_path):
+        TF_IMPORT_ERROR = f"TFLite model files not found (run convert_tflite.py): {plastic_path}, {oil_path}"
+        logging.error("❌ %s", TF_IMPORT_ERROR)
+        return
+    try:
+        plastic_runner = TFLiteModel(plastic_path, num_threads=TFLITE_THREADS, name='plastic')
+        oil_runner = TFLiteModel(oil_path, num_threads=TFLITE_THREADS, name='oil')
+        plastic_runner.warmup()
+        oil_runner.warmup()
+    except Exception as e:
+        plastic_runner = oil_runner = None
+        TF_IMPORT_ERROR = str(e)
+        logging.exception("❌ FAILED TO LOAD TFLITE MODELS!")
+        return
+    logging.info("✓ TFLite models loaded successfully.")
+    start_batchers()
+
+def start_inference_pool():
+    """Start INFERENCE_WORKERS model processes instead of loading the models here."""
+    global inference_pool, TF_IMPORT_ERROR
+    if PRED_BACKEND == 'tflite':
+        model_files = [tflite_model_path(p, TFLITE_VARIANT) for p in (PLASTIC_MODEL_PATH, OIL_MODEL_PATH)]
+    else:
+        model_files = [PLASTIC_MODEL_PATH, OIL_MODEL_PATH]
+        if not TF_AVAILABLE:
+            logging.warning("❌ TensorFlow not available, not starting inference workers.")
+            return
+    missing = [p for p in model_files if not os.path.exists(p)]
+    if missing:
+        TF_IMPORT_ERROR = f"Model files not found: {', '.join(missing)}"
+        logging.error("❌ %s", TF_IMPORT_ERROR)
+        return
+    spec = {
+        "backend": PRED_BACKEND,
+        "plastic_path": PLASTIC_MODEL_PATH,
+        "oil_path": OIL_MODEL_PATH,
+        "tflite_variant": TFLITE_VARIANT,
+        "mode": MODEL_MODE,
+        "compiled": COMPILED_INFERENCE,
+        "normalize_input": NORMALIZE_IN_GRAPH,
+        "input_shape": (TARGET_SIZE[1], TARGET_SIZE[0], 3),
+        "max_batch": BATCH_MAX_SIZE,
+        "intra_op_threads": INFERENCE_INTRA_OP_THREADS,
+        "inter_op_threads": INFERENCE_INTER_OP_THREADS,
+        "onednn": TF_RUNTIME.onednn,
+    }
+    inference_pool = InferencePool(spec, INFERENCE_WORKERS, cores_per_worker=INFERENCE_CORES_PER_WORKER,
+                                   on_ready=note_models_ready)
+    atexit.register(inference_pool.close)
+    logging.info("Inference pool: %d worker processes loading models in the background", INFERENCE_WORKERS)
+
 def load_models():
-    global plastic_model, oil_model, TF_AVAILABLE, TF_IMPORT_ERROR
+    global plastic_model, oil_model, fused_model
+    global plastic_runner, oil_runner, fused_runner
+    global TF_AVAILABLE, TF_IMPORT_ERROR
+    if INFERENCE_WORKERS > 0:
+        start_inference_pool()
+        return
+    if PRED_BACKEND == 'tflite':
+        load_tflite_models()
+        return
     # ENABLE TensorFlow models
-    if not TF_AVAILABLE:
+    if import_tensorflow() is None:
         logging.warning("❌ TensorFlow not available, skipping model load.")
         return
     try:
@@ -77,7 +291,7 @@ def load_models():
             logging.error("❌ ONE OR MORE MODEL FILES NOT FOUND!")
             return
         
-        import tensorflow as _tf
+        _tf = tf_module
         logging.info("Loading plastic model from: %s", PLASTIC_MODEL_PATH)
         plastic_model = _tf.keras.models.load_model(PLASTIC_MODEL_PATH)
         logging.info("✓ Plastic model loaded successfully.")
@@ -89,6 +303,29 @@ def load_models():
         logging.info("=" * 70)
         logging.info("✓✓✓ BOTH MODELS LOADED SUCCESSFULLY! ✓✓✓")
         logging.info("=" * 70)
+
+        if MODEL_MODE == 'fused':
+            try:
+                fused_model = build_fused_model(_tf, plastic_model, oil_model)
+                logging.info("✓ Fused plastic+oil model built (single graph call per image)")
+            except Exception:
+                fused_model = None
+                logging.exception("Could not build fused model, using separate models")
+
+        if fused_model is not None:
+            fused_runner = wrap_model(fused_model, compiled=COMPILED_INFERENCE, name='fused',
+                                      normalize_input=NORMALIZE_IN_GRAPH)
+        else:
+            plastic_runner = wrap_model(plastic_model, compiled=COMPILED_INFERENCE, name='plastic',
+                                        normalize_input=NORMALIZE_IN_GRAPH)
+            oil_runner = wrap_model(oil_model, compiled=COMPILED_INFERENCE, name='oil',
+                                    normalize_input=NORMALIZE_IN_GRAPH)
+            if plastic_runner.normalizes_input != oil_runner.normalizes_input:
+                # one model fell back to model.predict: normalise in numpy for both
+                plastic_runner = wrap_model(plastic_model, compiled=COMPILED_INFERENCE, name='plastic')
+                oil_runner = wrap_model(oil_model, compiled=COMPILED_INFERENCE, name='oil')
+
+        start_batchers()
     except Exception as e:
         TF_IMPORT_ERROR = str(e)
         TF_AVAILABLE = False
@@ -97,14 +334,68 @@ def load_models():
         logging.error("=" * 70)
         logging.exception("Full error traceback:")
 
-load_models()
+def note_models_ready():
+    """Record and log the import-to-ready time (loader thread, or the inference pool's first ready worker)."""
+    global MODEL_LOAD_SECONDS
+    MODEL_LOAD_SECONDS = round(time.perf_counter() - _IMPORT_STARTED, 2)
+    logging.info("✓ Models ready %.2fs after import (load mode: %s)", MODEL_LOAD_SECONDS, MODEL_LOAD_MODE)
 
-def preprocess_pil_image(img: Image.Image, target_size=TARGET_SIZE):
-    """Preprocess image to model input format."""
-    img = img.convert('RGB').resize(target_size)
-    arr = np.array(img, dtype=np.float32) / 255.0
-    arr = np.expand_dims(arr, axis=0)
-    return arr
+def load_models_and_report():
+    """load_models(), then publish the load state; runs in the loader thread in background mode."""
+    global MODEL_LOAD_STATE
+    try:
+        load_models()
+    except Exception:
+        logging.exception("Model load failed")
+    finally:
+        if inference_pool is None:
+            ready = fused_runner is not None or (plastic_runner is not None and oil_runner is not None)
+            MODEL_LOAD_STATE = 'ready' if ready else 'unavailable'
+            if ready:
+                note_models_ready()
+        model_load_done.set()
+
+if MODEL_LOAD_MODE == 'sync' or INFERENCE_WORKERS > 0:
+    # the inference pool starts at once and its workers load the models in the background
+    load_models_and_report()
+    if MODEL_LOAD_MODE == 'sync' and inference_pool is not None:
+        inference_pool.wait_ready(inference_pool.start_timeout)
+else:
+    threading.Thread(target=load_models_and_report, name='model-loader', daemon=True).start()
+
+def model_input_size():
+    """(w, h) the models take; ImagePipeline.array(model_input_size()) is what run_models expects."""
+    h, w = (inference_pool or input_packer).input_shape[:2]
+    return w, h
+
+def run_models(pixels):
+    """
+    Run both models on uint8 pixels, an (n, H, W, 3) array or a list of
+    (H, W, 3) arrays, returning (plastic_raw, oil_raw). Normalisation happens
+    while packing into input_packer's pooled float32 buffers (or in the graph).
+    With the inference pool, the uint8 pixels go to a worker process instead.
+    A list goes to the batchers one image per submission, so a batch request
+    fills the same max_batch-sized buffers concurrent single requests do.
+    """
+    if inference_pool is not None:
+        return inference_pool.infer(pixels, timeout=INFERENCE_TIMEOUT)
+    if fused_batcher is not None or (plastic_batcher is not None and oil_batcher is not None):
+        items = [pixels] if isinstance(pixels, np.ndarray) else [p[np.newaxis] for p in pixels]
+        if fused_batcher is not None:
+            futures = [fused_batcher.submit_async(x) for x in items]
+            outs = [f.result() for f in futures]
+        else:
+            # submit to both batchers before waiting so the two models overlap
+            futures = [(plastic_batcher.submit_async(x), oil_batcher.submit_async(x)) for x in items]
+            outs = [(p.result(), o.result()) for p, o in futures]
+        if len(outs) == 1:
+            return outs[0]
+        return np.concatenate([p for p, _ in outs]), np.concatenate([o for _, o in outs])
+    with input_packer.pack([pixels] if isinstance(pixels, np.ndarray) else pixels) as x:
+        if fused_runner is not None:
+            p_raw, o_raw = fused_runner.infer(x)
+            return p_raw, o_raw
+        return plastic_runner.infer(x), oil_runner.infer(x)
 
 def clamp_prob(v):
     """Clamp probability to [0, 1]."""
@@ -231,12 +522,44 @@ def decide_label_with_confidence(p_plastic, p_oil):
         logging.info("→ OIL_SPILL (weak but above threshold)")
         return 'oil_spill', reason, max_prob
 
-def fallback_predict_from_pil(img: Image.Image):
-    """Use TensorFlow models if available, otherwise use heuristic."""
-    
-    # ============ STEP 1: WATER DETECTION FIRST ============
-    small = img.convert('RGB').resize((128, 128))
-    arr = np.array(small, dtype=np.float32) / 255.0
+# ==================== STAGED CLASSIFICATION ====================
+# 1. stats:  water statistics on the WATER_STATS_SIZE thumbnail of a reduced decode
+# 2. strict: is_pure_water_only
+# 3. model:  the ML models (heuristic when they are unavailable or fail)
+# An image leaves at the first stage whose gate fires; stage_counters counts
+# how many do, per stage, under "classification_stages" in /api/metrics.
+#
+# PRED_STAGE_STATS_GATE:  exit (water-like images return 'undetected' after stage 1)
+#                         off  (stage 1 never exits; its stats still feed the other stages)
+# PRED_STAGE_STRICT_GATE: off     (stage 2 skipped)
+#                         confirm (stage-1 water-like images exit only if the strict check
+#                                  agrees; the rest go on to the models)
+#                         exit    (strict check on every image reaching stage 2; exits on water)
+WATER_STATS_SIZE = (128, 128)
+PRED_STAGE_STATS_GATE = parse_gate(os.environ.get('PRED_STAGE_STATS_GATE', 'exit'), STATS_GATES,
+                                   'PRED_STAGE_STATS_GATE')
+PRED_STAGE_STRICT_GATE = parse_gate(os.environ.get('PRED_STAGE_STRICT_GATE', 'off'), STRICT_GATES,
+                                    'PRED_STAGE_STRICT_GATE')
+stage_counters = StageCounters()
+
+def stage_gates():
+    return {"stats": PRED_STAGE_STATS_GATE, "strict": PRED_STAGE_STRICT_GATE}
+
+# water-like images leave at stage 1 (with 'confirm' they are handed to stage 2 instead)
+STATS_STAGE_EXITS = PRED_STAGE_STATS_GATE == 'exit' and PRED_STAGE_STRICT_GATE != 'confirm'
+
+def runs_strict(is_water_like):
+    """Whether stage 2 checks an image that stage 1 let through."""
+    if PRED_STAGE_STRICT_GATE == 'confirm':
+        return is_water_like
+    return PRED_STAGE_STRICT_GATE == 'exit'
+
+def analyze_water(img):
+    """
+    STEP 1 of every prediction: RGB statistics on a 128x128 thumbnail and the
+    water-likeness checks. Returns a dict consumed by the later steps.
+    """
+    arr = ImagePipeline.wrap(img).float_array(WATER_STATS_SIZE)
     
     mean_brightness = float(arr.mean())
     r_mean = float(arr[:, :, 0].mean())
@@ -282,71 +605,71 @@ def fallback_predict_from_pil(img: Image.Image):
     
     logging.info("  Water Detection: %s (%s)", is_water_like, water_reason if is_water_like else "Not water")
     logging.info("=" * 70)
+
+    return {
+        "mean_brightness": mean_brightness,
+        "r_mean": r_mean,
+        "g_mean": g_mean,
+        "b_mean": b_mean,
+        "blue_ratio": blue_ratio,
+        "is_water_like": is_water_like,
+        "water_reason": water_reason
+    }
+
+def water_prediction(stats, stage='stats'):
+    """Result for an image a water stage (stats or strict) classified as water."""
+    logging.info(">>> WATER DETECTED (%s stage) - Returning 'undetected' (no pollution)", stage)
+    meta = {
+        "model": "water_detection",
+        "stage": stage,
+        "is_water_like": True,
+        "reason": stats["water_reason"] or "Pure water (strict check)",
+        "rgb": {"r": round(stats["r_mean"], 3), "g": round(stats["g_mean"], 3), "b": round(stats["b_mean"], 3)}
+    }
+    return 0.0, 0.0, 'undetected', meta
+
+def model_prediction(p_plastic, p_oil):
+    """Label + meta from model probabilities."""
+    logging.info("MODEL PREDICTIONS:")
+    logging.info("  Plastic prob: %.4f (threshold: %.2f)", p_plastic, PLASTIC_THRESHOLD)
+    logging.info("  Oil prob: %.4f (threshold: %.2f)", p_oil, OIL_THRESHOLD)
     
-    # ✓✓✓ IF WATER: RETURN IMMEDIATELY ✓✓✓
-    if is_water_like:
-        logging.info(">>> WATER DETECTED - Returning 'undetected' (no pollution)")
-        meta = {
-            "model": "water_detection",
-            "is_water_like": True,
-            "reason": water_reason,
-            "rgb": {"r": round(r_mean, 3), "g": round(g_mean, 3), "b": round(b_mean, 3)}
-        }
-        return 0.0, 0.0, 'undetected', meta
-    
-    # ============ STEP 2: NOT WATER - RUN ML MODELS ============
-    logging.info("Not water - Running ML models...")
+    # Determine label based on thresholds
+    if p_plastic >= PLASTIC_THRESHOLD and p_plastic > p_oil:
+        label = 'plastic'
+        logging.info(">>> RESULT: PLASTIC (plastic=%.4f > oil=%.4f)", p_plastic, p_oil)
+    elif p_oil >= OIL_THRESHOLD and p_oil > p_plastic:
+        label = 'oil_spill'
+        logging.info(">>> RESULT: OIL_SPILL (oil=%.4f > plastic=%.4f)", p_oil, p_plastic)
+    elif p_plastic >= PLASTIC_THRESHOLD:
+        label = 'plastic'
+        logging.info(">>> RESULT: PLASTIC (above threshold)")
+    elif p_oil >= OIL_THRESHOLD:
+        label = 'oil_spill'
+        logging.info(">>> RESULT: OIL_SPILL (above threshold)")
+    elif max(p_plastic, p_oil) < NONE_THRESHOLD:
+        label = 'undetected'
+        logging.info(">>> RESULT: UNDETECTED (both below none_threshold)")
+    else:
+        # Pick higher one if both below threshold but above none_threshold
+        label = 'plastic' if p_plastic >= p_oil else 'oil_spill'
+        logging.info(">>> RESULT: %s (weak signal, picked higher)", label.upper())
     
-    if TF_AVAILABLE and plastic_model is not None and oil_model is not None:
-        try:
-            x = preprocess_pil_image(img, target_size=(224, 224))
-            
-            p_raw = plastic_model.predict(x, verbose=0)
-            o_raw = oil_model.predict(x, verbose=0)
-            
-            p_plastic = float(np.asarray(p_raw).flatten()[0])
-            p_oil = float(np.asarray(o_raw).flatten()[0])
-            
-            logging.info("MODEL PREDICTIONS:")
-            logging.info("  Plastic prob: %.4f (threshold: %.2f)", p_plastic, PLASTIC_THRESHOLD)
-            logging.info("  Oil prob: %.4f (threshold: %.2f)", p_oil, OIL_THRESHOLD)
-            
-            # Determine label based on thresholds
-            if p_plastic >= PLASTIC_THRESHOLD and p_plastic > p_oil:
-                label = 'plastic'
-                logging.info(">>> RESULT: PLASTIC (plastic=%.4f > oil=%.4f)", p_plastic, p_oil)
-            elif p_oil >= OIL_THRESHOLD and p_oil > p_plastic:
-                label = 'oil_spill'
-                logging.info(">>> RESULT: OIL_SPILL (oil=%.4f > plastic=%.4f)", p_oil, p_plastic)
-            elif p_plastic >= PLASTIC_THRESHOLD:
-                label = 'plastic'
-                logging.info(">>> RESULT: PLASTIC (above threshold)")
-            elif p_oil >= OIL_THRESHOLD:
-                label = 'oil_spill'
-                logging.info(">>> RESULT: OIL_SPILL (above threshold)")
-            elif max(p_plastic, p_oil) < NONE_THRESHOLD:
-                label = 'undetected'
-                logging.info(">>> RESULT: UNDETECTED (both below none_threshold)")
-            else:
-                # Pick higher one if both below threshold but above none_threshold
-                label = 'plastic' if p_plastic >= p_oil else 'oil_spill'
-                logging.info(">>> RESULT: %s (weak signal, picked higher)", label.upper())
-            
-            meta = {
-                "model": "tensorflow",
-                "plastic_raw": round(p_plastic, 4),
-                "oil_raw": round(p_oil, 4),
-                "is_water_like": False
-            }
-            
-            return p_plastic, p_oil, label, meta
-            
-        except Exception as e:
-            logging.error("Model prediction failed: %s", e)
-            logging.info("Falling back to heuristic...")
+    meta = {
+        "model": "tflite" if PRED_BACKEND == 'tflite' else "tensorflow",
+        "model_mode": model_settings()[0],
+        "plastic_raw": round(p_plastic, 4),
+        "oil_raw": round(p_oil, 4),
+        "is_water_like": False
+    }
     
-    # ============ STEP 3: FALLBACK HEURISTIC ============
+    return p_plastic, p_oil, label, meta
+
+def heuristic_prediction(stats):
+    """Color-based fallback when the models are unavailable or failed."""
     logging.info("Using heuristic prediction...")
+    mean_brightness = stats["mean_brightness"]
+    r_mean, g_mean, b_mean = stats["r_mean"], stats["g_mean"], stats["b_mean"]
     
     # Dark images → likely oil
     darkness = 1.0 - mean_brightness
@@ -354,11 +677,7 @@ def fallback_predict_from_pil(img: Image.Image):
     redness = max(0, r_mean - max(g_mean, b_mean)) * 3
     
     p_plastic = clamp_prob(redness * 0.8 + mean_brightness * 0.2)
-    p_oil = clamp_prob(darkness * 0.7 + (1 - blue_ratio) * 0.3)
-    
-    logging.info("HEURISTIC:")
-    logging.info("  Darkness: %.3f, Redness: %.3f", darkness, redness)
-    logging.info("  Plastic score: %.4f, Oil score: %.4f", p_plastic, p_oil)
+    p_oil = clamp_prob(darkness * 0.7 + (1 - stats["blue_ratio"]) * 0.3)
     
     if p_plastic >= PLASTIC_THRESHOLD and p_plastic > p_oil:
         label = 'plastic'
@@ -369,6 +688,13 @@ def fallback_predict_from_pil(img: Image.Image):
     else:
         label = 'plastic' if p_plastic >= p_oil else 'oil_spill'
     
+    return heuristic_result(p_plastic, p_oil, label, darkness, redness)
+
+def heuristic_result(p_plastic, p_oil, label, darkness, redness):
+    """Result tuple for heuristic scores (from heuristic_prediction or BatchHeuristics)."""
+    logging.info("HEURISTIC:")
+    logging.info("  Darkness: %.3f, Redness: %.3f", darkness, redness)
+    logging.info("  Plastic score: %.4f, Oil score: %.4f", p_plastic, p_oil)
     logging.info(">>> HEURISTIC RESULT: %s", label.upper())
     
     meta = {
@@ -379,9 +705,212 @@ def fallback_predict_from_pil(img: Image.Image):
         "oil_raw": round(p_oil, 4),
         "is_water_like": False
     }
+    if model_state() == 'loading':
+        meta["models_loading"] = True  # models not loaded yet (background load), not missing
     
     return p_plastic, p_oil, label, meta
 
+def fallback_predict_from_pil(img):
+    """
+    Staged classification of one image: water stats, the optional strict water
+    check, then the models (heuristic if they are unavailable or fail); see
+    STAGED CLASSIFICATION above for the gates.
+    img is an ImagePipeline (or a PIL image, wrapped into one) shared by every stage.
+    """
+    img = ImagePipeline.wrap(img)
+    
+    # ============ STAGE 1: WATER STATS ============
+    with stage_counters.timed('stats') as stage:
+        stats = analyze_water(img)
+        water_exit = stats["is_water_like"] and STATS_STAGE_EXITS
+        stage.outcome('water' if water_exit else 'pass')
+    if water_exit:
+        return water_prediction(stats)
+    
+    # ============ STAGE 2: STRICT WATER CHECK ============
+    if runs_strict(stats["is_water_like"]):
+        with stage_counters.timed('strict') as stage:
+            water_exit = is_pure_water_only(img)
+            stage.outcome('water' if water_exit else 'pass')
+        if water_exit:
+            return water_prediction(stats, stage='strict')
+    
+    # ============ STAGE 3: ML MODELS ============
+    logging.info("Not water - Running ML models...")
+    with stage_counters.timed('model') as stage:
+        if models_ready():
+            try:
+                p_raw, o_raw = run_models(img.array(model_input_size())[np.newaxis])
+                
+                p_plastic = float(np.asarray(p_raw).flatten()[0])
+                p_oil = float(np.asarray(o_raw).flatten()[0])
+                stage.outcome('model')
+                return model_prediction(p_plastic, p_oil)
+                
+            except Exception as e:
+                logging.error("Model prediction failed: %s", e)
+                logging.info("Falling back to heuristic...")
+        
+        # fallback heuristic
+        stage.outcome('heuristic')
+        return heuristic_prediction(stats)
+
+def predict_pil_batch(imgs):
+    """
+    fallback_predict_from_pil for a list of images: the water stats and the
+    heuristic run vectorized over the stack of 128x128 thumbnails
+    (BatchHeuristics), the strict check runs on the images its gate selects,
+    and every image still undecided goes through the models in one stacked
+    call. Returns results in input order.
+    """
+    if not imgs:
+        return []
+    imgs = [ImagePipeline.wrap(img) for img in imgs]
+    with stage_counters.timed('stats') as stage:
+        batch = BatchHeuristics(np.stack([img.array(WATER_STATS_SIZE) for img in imgs]),
+                                PLASTIC_THRESHOLD, OIL_THRESHOLD, NONE_THRESHOLD)
+        water_exit = batch.is_water_like & STATS_STAGE_EXITS
+        exited = int(water_exit.sum())
+        stage.outcome('water', exited)
+        stage.outcome('pass', len(imgs) - exited)
+    results = [water_prediction(batch.stats(i)) if water_exit[i] else None for i in range(len(imgs))]
+
+    strict = [i for i in np.flatnonzero(~water_exit).tolist() if runs_strict(bool(batch.is_water_like[i]))]
+    if strict:
+        with stage_counters.timed('strict') as stage:
+            for i in strict:
+                if is_pure_water_only(imgs[i]):
+                    results[i] = water_prediction(batch.stats(i), stage='strict')
+            exited = sum(results[i] is not None for i in strict)
+            stage.outcome('water', exited)
+            stage.outcome('pass', len(strict) - exited)
+    pending = [i for i, result in enumerate(results) if result is None]
+    if not pending:
+        return results
+
+    with stage_counters.timed('model') as stage:
+        if models_ready():
+            try:
+                size = model_input_size()
+                p_raw, o_raw = run_models([imgs[i].array(size) for i in pending])
+                p_probs = np.asarray(p_raw).reshape(len(pending), -1)[:, 0]
+                o_probs = np.asarray(o_raw).reshape(len(pending), -1)[:, 0]
+                for i, p_plastic, p_oil in zip(pending, p_probs, o_probs):
+                    results[i] = model_prediction(float(p_plastic), float(p_oil))
+                stage.outcome('model', len(pending))
+            except Exception as e:
+                logging.error("Batched model prediction failed: %s", e)
+                logging.info("Falling back to heuristic...")
+
+        fallback = [i for i in pending if results[i] is None]
+        for i in fallback:
+            results[i] = heuristic_result(float(batch.p_plastic[i]), float(batch.p_oil[i]), str(batch.label[i]),
+                                          float(batch.darkness[i]), float(batch.redness[i]))
+        stage.outcome('heuristic', len(fallback))
+    return results
+
+# ==================== PREDICTION CACHE ====================
+
+PRED_CACHE_ENABLED = os.environ.get('PRED_CACHE_ENABLED', 'true').lower() == 'true'
+PRED_CACHE_DIR = os.environ.get('PRED_CACHE_DIR', os.path.join(os.path.dirname(__file__), 'cache_predictions'))
+PRED_CACHE_MAX_ENTRIES = int(os.environ.get('PRED_CACHE_MAX_ENTRIES', 10000))
+PRED_CACHE_MAX_BYTES = int(os.environ.get('PRED_CACHE_MAX_BYTES', 50 * 1024 * 1024))
+PRED_CACHE_TTL = int(os.environ.get('PRED_CACHE_TTL_SECONDS', 7 * 24 * 3600))
+PRED_CACHE_MEMORY_ENTRIES = int(os.environ.get('PRED_CACHE_MEMORY_ENTRIES', 1024))
+
+# Decode only as large as the first stage needs using JPEG DCT scaling
+# (image_decode): the 128x128 water thumbnail while a water stage can exit,
+# otherwise the model input. Images that reach the models are decoded again at
+# model size only if the reduced decode is too small (ImagePipeline).
+# false decodes at full resolution.
+PRED_FAST_DECODE = os.environ.get('PRED_FAST_DECODE', 'true').lower() == 'true'
+MODEL_DECODE_SIZE = (max(224, TARGET_SIZE[0]), max(224, TARGET_SIZE[1]))
+WATER_STAGE_EXITS = STATS_STAGE_EXITS or PRED_STAGE_STRICT_GATE != 'off'
+DECODE_MIN_SIZE = WATER_STATS_SIZE if WATER_STAGE_EXITS else MODEL_DECODE_SIZE
+
+class InvalidImageError(ValueError):
+    """Raised when image bytes cannot be decoded."""
+
+def prediction_cache_version():
+    """
+    Short hash of everything that changes a prediction: thresholds, backend and
+    the model files on disk (size + mtime), so edits or swapped models invalidate the cache.
+    """
+    model_files = [PLASTIC_MODEL_PATH, OIL_MODEL_PATH]
+    if PRED_BACKEND == 'tflite':
+        model_files = [tflite_model_path(p, TFLITE_VARIANT) for p in model_files]
+    files = []
+    for path in model_files:
+        try:
+            st = os.stat(path)
+            files.append([os.path.basename(path), st.st_size, st.st_mtime_ns])
+        except OSError:
+            files.append([os.path.basename(path), None, None])
+    state = {
+        "thresholds": [PLASTIC_THRESHOLD, OIL_THRESHOLD, NONE_THRESHOLD],
+        "target_size": list(TARGET_SIZE),
+        "backend": PRED_BACKEND,
+        "tflite_variant": TFLITE_VARIANT if PRED_BACKEND == 'tflite' else None,
+        "fast_decode": PRED_FAST_DECODE,
+        "decode_min_size": list(DECODE_MIN_SIZE),
+        "draft_margin": DRAFT_MARGIN,
+        "stage_gates": stage_gates(),
+        "files": files
+    }
+    import hashlib
+    return hashlib.sha256(json.dumps(state, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+prediction_cache = None
+if PRED_CACHE_ENABLED:
+    try:
+        prediction_cache = PredictionCache(PRED_CACHE_DIR, prediction_cache_version,
+                                           max_entries=PRED_CACHE_MAX_ENTRIES,
+                                           max_bytes=PRED_CACHE_MAX_BYTES,
+                                           ttl_seconds=PRED_CACHE_TTL,
+                                           memory_entries=PRED_CACHE_MEMORY_ENTRIES)
+    except Exception:
+        logging.exception("Failed to initialise prediction cache, continuing without it")
+
+def decode_image_bytes(content):
+    """Decode once into the ImagePipeline every prediction step reads from."""
+    try:
+        return ImagePipeline.decode(content, min_size=DECODE_MIN_SIZE if PRED_FAST_DECODE else None)
+    except Exception as e:
+        raise InvalidImageError(str(e)) from e
+
+def cache_lookup(content):
+    """Return (key, cached_result_or_None) for image bytes; key is None when caching is off."""
+    if prediction_cache is None:
+        return None, None
+    key = prediction_cache.key_for(content)
+    hit = prediction_cache.get(key)
+    if hit is None:
+        return key, None
+    p_plastic, p_oil, label, meta = hit
+    logging.info("Prediction cache hit: %s", key[:16])
+    return key, (p_plastic, p_oil, label, dict(meta, cached=True))
+
+def cache_store(key, result):
+    """
+    Store a fresh prediction and return it tagged as not cached. Heuristic
+    fallbacks (models loading, or a failed / timed-out model call) are not
+    stored, so the next request for the image gets the models again.
+    """
+    p_plastic, p_oil, label, meta = result
+    if key is not None and meta.get("model") != "heuristic":
+        prediction_cache.put(key, [p_plastic, p_oil, label, meta])
+    return p_plastic, p_oil, label, dict(meta, cached=False)
+
+def cached_predict(content):
+    """
+    fallback_predict_from_pil for raw image bytes, consulting the prediction
+    cache first. Only decodes on a miss; raises InvalidImageError for bad bytes.
+    """
+    key, hit = cache_lookup(content)
+    if hit is not None:
+        return hit
+    return cache_store(key, fallback_predict_from_pil(decode_image_bytes(content)))
+
 # after TF_IMPORT_ERROR writing to tf_import_error.log, provide fix metadata
 MSVC_REDIST_URL = "https://learn.microsoft.com/en-us/cpp/windows/latest-supported-vc-redist"
 # Recommended Python/TensorFlow commands (PowerShell friendly)
@@ -419,16 +948,33 @@ def tf_fix_instructions():
 def health():
     """
     Returns service health and TensorFlow availability.
+    model_state goes loading -> ready (or unavailable) while the models load in the background.
     """
-    if TF_AVAILABLE and plastic_model is not None and oil_model is not None:
+    state = model_state()
+    if state == 'ready':
         return jsonify({
             "status": "ok",
-            "tensorflow": True,
+            "model_state": state,
+            "tensorflow": TF_AVAILABLE,
             "models_loaded": True,
+            "backend": PRED_BACKEND,
             "message": "✓ Service ready. Both models loaded.",
+            "ready_seconds": MODEL_LOAD_SECONDS,
             "plastic_threshold": PLASTIC_THRESHOLD,
             "oil_threshold": OIL_THRESHOLD,
-            "none_threshold": NONE_THRESHOLD
+            "none_threshold": NONE_THRESHOLD,
+            "prediction_cache": prediction_cache.stats() if prediction_cache else None
+        }), 200
+    elif state == 'loading':
+        return jsonify({
+            "status": "loading",
+            "model_state": state,
+            "tensorflow": TF_AVAILABLE,
+            "models_loaded": False,
+            "backend": PRED_BACKEND,
+            "message": "Models are loading in the background. Serving heuristic predictions meanwhile.",
+            "seconds_since_import": round(time.perf_counter() - _IMPORT_STARTED, 1),
+            "prediction_cache": prediction_cache.stats() if prediction_cache else None
         }), 200
     else:
         detail = TF_IMPORT_ERROR or "TensorFlow not available or models not loaded."
@@ -442,142 +988,294 @@ def health():
 
         return jsonify({
             "status": "degraded",
+            "model_state": state,
             "tensorflow": False,
             "models_loaded": False,
             "message": "Service running but TF/models unavailable. Using fallback heuristic.",
             "details": detail,
-            "advice": extra_advice
+            "advice": extra_advice,
+            "prediction_cache": prediction_cache.stats() if prediction_cache else None
         }), 200
 
-CACHE_DIR = os.path.join(os.path.dirname(__file__), 'cache_images')
-os.makedirs(CACHE_DIR, exist_ok=True)
-
-def _cache_path_for_key(key: str):
-    import hashlib
-    h = hashlib.sha256(key.encode('utf-8')).hexdigest()
-    return os.path.join(CACHE_DIR, f"{h}.bin")
-
-def _is_cache_fresh(path, max_age_seconds=24*3600):
-    try:
-        mtime = os.path.getmtime(path)
-        return (time.time() - mtime) < max_age_seconds
-    except Exception:
-        return False
+# ----------------- Outbound image fetch -----------------
+# hedged: race the original URL and the same CID on the IPFS gateways (see
+# gateway_fetch.HedgedFetcher); sequential: try each candidate in turn.
+FETCH_MODE = os.environ.get('PRED_FETCH_MODE', 'hedged').lower()
+FETCH_HEDGE_PARALLEL = int(os.environ.get('PRED_FETCH_HEDGE_PARALLEL', 3))
+FETCH_HEDGE_DELAY_MS = float(os.environ.get('PRED_FETCH_HEDGE_DELAY_MS', 300))
+FETCH_HEDGE_ROUNDS = int(os.environ.get('PRED_FETCH_HEDGE_ROUNDS', 2))
+FETCH_MIN_TIMEOUT = float(os.environ.get('PRED_FETCH_MIN_TIMEOUT', 1.0))
+IPFS_GATEWAYS = [g.strip() for g in os.environ.get('PRED_IPFS_GATEWAYS', ','.join(DEFAULT_GATEWAYS)).split(',')
+                 if g.strip()]
+GATEWAY_STATE_FILE = os.environ.get('PRED_GATEWAY_STATE_FILE',
+                                    os.path.join(os.path.dirname(__file__), 'gateway_state.json'))
+
+# live health/latency table; decides candidate order, timeouts and which gateways to skip
+gateway_registry = GatewayRegistry(
+    IPFS_GATEWAYS,
+    state_path=GATEWAY_STATE_FILE or None,
+    failure_threshold=int(os.environ.get('PRED_GATEWAY_FAILURE_THRESHOLD', 5)),
+    open_seconds=float(os.environ.get('PRED_GATEWAY_OPEN_SECONDS', 30)),
+    cooldown_seconds=float(os.environ.get('PRED_GATEWAY_COOLDOWN_SECONDS', 10))
+)
+atexit.register(gateway_registry.save)
+
+gateway_fetcher = HedgedFetcher(max_parallel=FETCH_HEDGE_PARALLEL, hedge_delay_ms=FETCH_HEDGE_DELAY_MS,
+                                timeout=15, min_timeout=FETCH_MIN_TIMEOUT, registry=gateway_registry)
 
 def fetch_image_with_retries(image_url, forward_headers=None, timeout=15, max_attempts_per_candidate=3):
-    """Robust fetch with retries and IPFS gateway fallbacks."""
+    """
+    Robust fetch with retries and IPFS gateway fallbacks. timeout is the
+    per-request timeout; in hedged mode it caps each gateway attempt.
+    """
     headers = {'User-Agent': 'marine-db-fetcher/1.0', 'Accept': 'image/*'}
     if forward_headers:
         headers.update(forward_headers)
 
-    def try_get(url, to=timeout):
-        last_exc = None
+    candidates = gateway_registry.order_urls(candidate_urls(image_url, IPFS_GATEWAYS))
+    last_exc = None
+
+    if FETCH_MODE == 'hedged' and candidates:
         backoff = 0.5
-        for attempt in range(1, max_attempts_per_candidate+1):
+        for attempt in range(1, FETCH_HEDGE_ROUNDS + 1):
             try:
-                resp = requests.get(url, headers=headers, timeout=to)
-                if resp.status_code == 200:
-                    content_type = resp.headers.get('Content-Type', None)
-                    return resp.content, content_type
-                if resp.status_code == 429:
-                    logging.warning("Rate limited (429) from %s", url)
-                    last_exc = RuntimeError(f"429 from {url}")
-                else:
-                    logging.warning("Non-200 response %s from %s", resp.status_code, url)
-                    last_exc = RuntimeError(f"{resp.status_code} from {url}")
+                content, ctype, url = gateway_fetcher.fetch(candidates, headers, timeout=timeout)
+                logging.info("Fetched image from %s", url)
+                return content, ctype
             except Exception as e:
-                logging.warning("Fetch error for %s: %s", url, e)
+                logging.warning("Hedged fetch round %d failed for %s: %s", attempt, image_url, e)
                 last_exc = e
-            time.sleep(backoff)
-            backoff = min(backoff * 2, 3.0)
-        raise last_exc or RuntimeError("Failed to fetch")
+            if attempt < FETCH_HEDGE_ROUNDS:
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 3.0)
+        raise RuntimeError(f"Failed to fetch image from URL after retries: {last_exc}")
+
+    if candidates:
+        try:
+            content, ctype, url = sequential_fetch(candidates, headers, timeout, max_attempts_per_candidate,
+                                                   registry=gateway_registry)
+            logging.info("Fetched image from candidate %s", url)
+            return content, ctype
+        except Exception as e:
+            logging.debug("All candidates failed for %s: %s", image_url, e)
+            last_exc = e
 
-    # Try original URL first
     try:
-        content, ctype = try_get(image_url, timeout)
-        return content, ctype
+        resp = get_client().get(image_url, headers=headers, timeout=30)
+        resp.raise_for_status()
+        return resp.content, resp.headers.get('Content-Type')
     except Exception as e:
-        logging.debug("Primary fetch failed for %s: %s", image_url, e)
+        raise RuntimeError(f"Failed to fetch image from URL after retries: {e or last_exc}")
 
-    # Build IPFS gateway fallbacks
-    candidates = []
-    parsed = urlparse(image_url or "")
-    if image_url and '/ipfs/' in image_url:
-        try:
-            cid = image_url.split('/ipfs/')[1].split('/')[0]
-            candidates = [
-                f"https://ipfs.io/ipfs/{cid}",
-                f"https://cloudflare-ipfs.com/ipfs/{cid}",
-                f"https://dweb.link/ipfs/{cid}",
-                f"https://gateway.pinata.cloud/ipfs/{cid}",
-                f"https://infura-ipfs.io/ipfs/{cid}"
-            ]
-        except Exception:
-            candidates = [image_url]
+# ----------------- Image cache -----------------
+# Fetched images, keyed by CID where the URL names IPFS content, shared by the
+# report image proxy and the prediction fetch paths.
+CACHE_DIR = os.environ.get('PRED_IMAGE_CACHE_DIR', os.path.join(os.path.dirname(__file__), 'cache_images'))
+IMAGE_CACHE_MAX_BYTES = int(os.environ.get('PRED_IMAGE_CACHE_MAX_BYTES', 1024 * 1024 * 1024))
+IMAGE_CACHE_URL_TTL_SECONDS = int(os.environ.get('PRED_IMAGE_CACHE_URL_TTL_SECONDS', 24 * 3600))
+
+image_cache = ImageCache(CACHE_DIR, max_bytes=IMAGE_CACHE_MAX_BYTES, url_ttl_seconds=IMAGE_CACHE_URL_TTL_SECONDS)
+atexit.register(image_cache.save_index)
+
+# concurrent misses for the same image (proxy, /predict_url, batch) share one download
+fetch_flight = SingleFlight('image_fetch')
+
+def fetch_image(image_url, forward_headers=None):
+    """
+    (content, content_type) for an image URL or CID, from the image cache or
+    fetched (and cached). Concurrent misses for the same CID/URL are coalesced
+    into one download. Authorised fetches of non-IPFS URLs bypass both.
+    """
+    key = image_cache.key_for(image_url)
+    if not key.startswith('ipfs:') and (forward_headers or {}).get('Authorization'):
+        return fetch_image_with_retries(image_url, forward_headers, timeout=15)
+
+    cached = image_cache.get(key)
+    if cached is not None:
+        return cached
+
+    def download():
+        # a flight that finished just before this one started may have filled the cache
+        cached = image_cache.get(key, count_miss=False)
+        if cached is not None:
+            return cached
+        content, ctype = fetch_image_with_retries(image_url, forward_headers, timeout=15)
+        image_cache.put(key, content, ctype)
+        return content, ctype
+
+    result, shared = fetch_flight.do(key, download)
+    if shared:
+        logging.debug("Coalesced fetch of %s", key)
+    if result is None:
+        # joined a streamed proxy response (stream_image), which fills the cache rather than returning bytes
+        result = image_cache.get(key, count_miss=False)
+        if result is None:
+            result = fetch_image_with_retries(image_url, forward_headers, timeout=15)
+    return result
+
+# Browser caching of proxied images: IPFS content never changes, so it is
+# served as immutable with a CID-derived ETag; other URLs get a shorter max-age.
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+URL_IMAGE_MAX_AGE = int(os.environ.get('PRED_IMAGE_URL_MAX_AGE', 3600))
+IMAGE_FLIGHT_WAIT_SECONDS = 60
+# ?w=&h=&fmt= thumbnails/variants of proxied images
+IMAGE_VARIANT_MAX_DIM = int(os.environ.get('PRED_IMAGE_VARIANT_MAX_DIM', 2048))
+IMAGE_VARIANT_QUALITY = int(os.environ.get('PRED_IMAGE_VARIANT_QUALITY', 80))
+
+def image_cache_headers(key, etag=None):
+    headers = {}
+    if key.startswith('ipfs:'):
+        headers['Cache-Control'] = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
     else:
-        maybe_cid = None
-        if parsed.scheme == '' and image_url and len(image_url) in (46, 59):
-            maybe_cid = image_url
-        if maybe_cid:
-            candidates = [
-                f"https://ipfs.io/ipfs/{maybe_cid}",
-                f"https://cloudflare-ipfs.com/ipfs/{maybe_cid}",
-                f"https://dweb.link/ipfs/{maybe_cid}",
-                f"https://gateway.pinata.cloud/ipfs/{maybe_cid}"
-            ]
-        else:
-            candidates = [
-                image_url,
-                image_url.replace('gateway.pinata.cloud', 'ipfs.io'),
-                image_url.replace('gateway.pinata.cloud', 'cloudflare-ipfs.com'),
-                image_url.replace('gateway.pinata.cloud', 'dweb.link')
-            ]
-
-    for cand in candidates:
-        if not cand:
-            continue
+        headers['Cache-Control'] = f'public, max-age={URL_IMAGE_MAX_AGE}'
+    if etag:
+        headers['ETag'] = f'"{etag}"'
+    return headers
+
+def send_cached_image(key, cached):
+    """
+    Serve a cache file; send_file(conditional=True) answers If-None-Match (304) and Range (206).
+    Returns None if the file was evicted or expired since lookup(), so the caller fetches it again.
+    """
+    cache_path, ctype, _, etag = cached
+    try:
+        resp = send_file(cache_path, mimetype=ctype or 'application/octet-stream', conditional=True,
+                         etag=etag or False,
+                         max_age=IMMUTABLE_MAX_AGE if key.startswith('ipfs:') else URL_IMAGE_MAX_AGE)
+    except OSError as e:
+        logging.info("Cached image %s went away before it was sent (%s), fetching again", key, e)
+        return None
+    resp.headers['Cache-Control'] = image_cache_headers(key)['Cache-Control']
+    return resp
+
+def stream_image(key, fetch_url):
+    """
+    Leader of the fetch flight for key: stream the winning gateway response to
+    the client chunk by chunk while teeing it into the image cache. Concurrent
+    requests for the same key wait on the flight and are served the cache file.
+    Returns None if nothing could be opened (the caller falls back to fetch_image).
+    """
+    call, leader = fetch_flight.begin(key)
+    if not leader:
         try:
-            content, ctype = try_get(cand, timeout)
-            logging.info("Fetched image from candidate %s", cand)
-            return content, ctype
+            fetch_flight.wait(call, IMAGE_FLIGHT_WAIT_SECONDS)
         except Exception as e:
-            logging.debug("Candidate %s failed: %s", cand, e)
-            continue
+            logging.debug("Waited-on stream of %s failed: %s", key, e)
+        cached = image_cache.lookup(key, count_miss=False)
+        return send_cached_image(key, cached) if cached is not None else None
 
+    headers = {'User-Agent': 'marine-db-fetcher/1.0', 'Accept': 'image/*'}
+    candidates = gateway_registry.order_urls(candidate_urls(fetch_url, IPFS_GATEWAYS))
     try:
-        resp = requests.get(image_url, headers=headers, timeout=30)
-        resp.raise_for_status()
-        return resp.content, resp.headers.get('Content-Type')
+        upstream, chunks, first, ctype, url = gateway_fetcher.open_stream(candidates, headers)
     except Exception as e:
-        raise RuntimeError(f"Failed to fetch image from URL after retries: {e}")
+        logging.warning("Streaming open failed for %s: %s", fetch_url, e)
+        fetch_flight.finish(key, call, error=e)
+        return None
+
+    writer = image_cache.writer(key, ctype)
+    state = {"finished": False}
+
+    def finish(ok, error=None):
+        if state["finished"]:
+            return
+        state["finished"] = True
+        upstream.close()
+        if ok:
+            writer.commit()
+        else:
+            writer.abort()
+        fetch_flight.finish(key, call, error=error)
+
+    def generate():
+        ok, error = False, None
+        try:
+            writer.write(first)
+            yield first
+            for chunk in chunks:
+                writer.write(chunk)
+                yield chunk
+            ok = True
+        except GeneratorExit:
+            error = RuntimeError("client disconnected")
+            raise
+        except Exception as e:
+            logging.warning("Stream from %s broke off: %s", url, e)
+            gateway_registry.record_failure(url, error=e)
+            error = e
+            raise
+        finally:
+            finish(ok, error)
+
+    resp = Response(generate(), mimetype=ctype or 'application/octet-stream',
+                    headers=image_cache_headers(key, image_cache.etag_for_key(key)))
+    length = upstream.headers.get('Content-Length')
+    if length and not upstream.headers.get('Content-Encoding'):
+        resp.headers['Content-Length'] = length
+    # never-started generators skip their finally; make sure the flight is released
+    resp.call_on_close(lambda: finish(False, RuntimeError("response closed before streaming")))
+    logging.info("Streaming image %s from %s", key, url)
+    return resp
+
+def image_variant(key, fetch_url, w, h, fmt):
+    """
+    (content, content_type) of a resized/re-encoded copy of an image, rendered
+    from the cached original (fetched first if needed) and cached under its own
+    key, so each (image, size, format) is generated once.
+    """
+    vkey = variant_key(key, w, h, fmt, quality=IMAGE_VARIANT_QUALITY, max_dim=IMAGE_VARIANT_MAX_DIM)
+
+    def render():
+        cached = image_cache.get(vkey, count_miss=False)
+        if cached is not None:
+            return cached
+        base = image_cache.lookup(key, count_miss=False)
+        if base is None:
+            content, _ = fetch_image(fetch_url)
+            base = image_cache.lookup(key, count_miss=False)
+        source = base[0] if base is not None else io.BytesIO(content)  # original too big to cache
+        t0 = time.perf_counter()
+        content, ctype = render_variant(source, w, h, fmt, quality=IMAGE_VARIANT_QUALITY,
+                                        max_dim=IMAGE_VARIANT_MAX_DIM)
+        logging.info("Rendered %s (%d bytes) in %.1f ms", vkey, len(content), (time.perf_counter() - t0) * 1000)
+        image_cache.put(vkey, content, ctype)
+        return content, ctype
+
+    result, _ = fetch_flight.do(vkey, render)
+    return result
 
 @app.route('/api/reports/<report_id>/image', methods=['GET'])
 def report_image_proxy(report_id):
-    """Proxy endpoint to fetch and serve report image with caching."""
+    """
+    Proxy endpoint to fetch and serve report image with caching.
+    Cache hits are sent from disk (Range and If-None-Match supported); misses
+    are streamed from the fastest gateway while being written to the cache.
+    ?w=&h=&fmt=webp|jpeg returns a resized variant, itself cached.
+    """
     image_url = request.args.get('image_url')
     cid = request.args.get('cid')
 
     if not image_url and not cid:
         return jsonify({"error": "Provide image_url or cid query parameter"}), 400
 
-    key = image_url if image_url else cid
-    cache_path = _cache_path_for_key(key)
-
-    # Serve from cache if fresh
-    if os.path.exists(cache_path) and _is_cache_fresh(cache_path, max_age_seconds=24*3600):
-        try:
-            meta_path = cache_path + ".meta"
-            ctype = None
-            if os.path.exists(meta_path):
-                try:
-                    with open(meta_path, 'r', encoding='utf-8') as mf:
-                        ctype = mf.read().strip()
-                except Exception:
-                    ctype = None
-            logging.info("Serving report %s image from cache", report_id)
-            return send_file(cache_path, mimetype=ctype or 'application/octet-stream')
-        except Exception:
-            logging.exception("Failed to serve cached image, will refetch")
+    try:
+        variant = parse_variant(request.args, IMAGE_VARIANT_MAX_DIM)
+    except VariantError as e:
+        return jsonify({"error": str(e)}), 400
+
+    key = image_cache.key_for(image_url or cid)
+    serve_key = (variant_key(key, *variant, quality=IMAGE_VARIANT_QUALITY, max_dim=IMAGE_VARIANT_MAX_DIM)
+                 if variant else key)
+    etag = image_cache.etag_for_key(serve_key)
+    if etag and request.if_none_match.contains(etag):
+        # immutable content the browser already has: no cache or network I/O at all
+        return Response(status=304, headers=image_cache_headers(serve_key, etag))
+
+    cached = image_cache.lookup(serve_key, count_miss=False)  # fetch_image() counts the miss
+    resp = send_cached_image(serve_key, cached) if cached is not None else None
+    if resp is not None:
+        logging.info("Serving report %s image from cache", report_id)
+        return resp
 
     # Determine fetch URL
     fetch_url = image_url
@@ -595,24 +1293,35 @@ def report_image_proxy(report_id):
 
     logging.info("Report %s: Attempting to fetch image from: %s", report_id, fetch_url)
 
+    if variant:
+        image_cache.record_miss()
+        try:
+            content, ctype = image_variant(key, fetch_url, *variant)
+        except Exception as e:
+            logging.exception("Report %s: Failed to render %s: %s", report_id, serve_key, e)
+            return jsonify({"error": "Failed to render image variant", "details": str(e), "url": fetch_url}), 502
+        cached = image_cache.lookup(serve_key, count_miss=False)
+        resp = send_cached_image(serve_key, cached) if cached is not None else None
+        return resp if resp is not None else send_file(io.BytesIO(content), mimetype=ctype)
+
+    # Range requests need the whole object on disk first; sequential mode has no streaming race
+    if FETCH_MODE == 'hedged' and not request.range:
+        image_cache.record_miss()
+        resp = stream_image(key, fetch_url)
+        if resp is not None:
+            return resp
+
     try:
-        content, ctype = fetch_image_with_retries(fetch_url, forward_headers=None, timeout=15)
+        content, ctype = fetch_image(fetch_url)
         logging.info("Report %s: Successfully fetched image (%d bytes)", report_id, len(content))
     except Exception as e:
         logging.exception("Report %s: Failed to fetch image from %s: %s", report_id, fetch_url, e)
         return jsonify({"error": "Failed to fetch image", "details": str(e), "url": fetch_url}), 502
 
-    # Write to cache
-    try:
-        with open(cache_path, 'wb') as f:
-            f.write(content)
-        if ctype:
-            with open(cache_path + ".meta", 'w', encoding='utf-8') as mf:
-                mf.write(ctype)
-        logging.info("Report %s: Cached image (%d bytes)", report_id, len(content))
-    except Exception:
-        logging.exception("Report %s: Failed to write image cache", report_id)
-
+    cached = image_cache.lookup(key, count_miss=False)
+    resp = send_cached_image(key, cached) if cached is not None else None
+    if resp is not None:
+        return resp
     return send_file(io.BytesIO(content), mimetype=ctype or 'application/octet-stream')
 
 @app.route('/api/ipfs/test', methods=['POST'])
@@ -635,66 +1344,84 @@ def ipfs_test():
         "gateways_tested": []
     }
 
-    gateways = [
-        f"https://ipfs.io/ipfs/{cid}",
-        f"https://cloudflare-ipfs.com/ipfs/{cid}",
-        f"https://dweb.link/ipfs/{cid}",
-        f"https://gateway.pinata.cloud/ipfs/{cid}",
-    ]
+    # every configured gateway, best first; results feed the gateway registry
+    urls = gateway_registry.order_urls([gateway_url(gw, cid) for gw in IPFS_GATEWAYS], drop_unavailable=False)
 
-    for gateway_url in gateways:
+    for url in urls:
+        t0 = time.monotonic()
         try:
-            resp = requests.get(gateway_url, timeout=10)
+            resp = get_client().get(url, timeout=10, retries=0)
+            gateway_registry.record_ttfb(url, time.monotonic() - t0)
+            if resp.status_code == 200:
+                gateway_registry.record_success(url)
+            else:
+                gateway_registry.record_failure(url, status=resp.status_code)
             results["gateways_tested"].append({
-                "url": gateway_url,
+                "url": url,
                 "status": resp.status_code,
                 "content_length": len(resp.content),
                 "content_type": resp.headers.get('Content-Type'),
+                "elapsed_ms": round((time.monotonic() - t0) * 1000.0, 1),
                 "success": resp.status_code == 200
             })
-            logging.info("  %s: %s (%d bytes)", gateway_url, resp.status_code, len(resp.content))
+            logging.info("  %s: %s (%d bytes)", url, resp.status_code, len(resp.content))
         except Exception as e:
+            gateway_registry.record_failure(url, error=e, timeout=10 if isinstance(e, requests.Timeout) else None)
             results["gateways_tested"].append({
-                "url": gateway_url,
+                "url": url,
                 "error": str(e),
                 "success": False
             })
-            logging.warning("  %s: FAILED - %s", gateway_url, e)
+            logging.warning("  %s: FAILED - %s", url, e)
 
     return jsonify(results), 200
 
+@app.route('/api/ipfs/gateways', methods=['GET'])
+def ipfs_gateways():
+    """Live gateway routing table (latency, success rate, cooldowns, circuit state), best first."""
+    return jsonify({
+        "fetch_mode": FETCH_MODE,
+        "state_file": GATEWAY_STATE_FILE or None,
+        "gateways": gateway_registry.table()
+    }), 200
+
 @app.route('/api/analytics/summary', methods=['GET'])
 def analytics_summary():
     """Get prediction statistics and analytics."""
-    preds = load_predictions()
+    total, breakdown = prediction_counts()
     
-    if not preds:
+    if not total:
         return jsonify({
             "total_predictions": 0,
             "breakdown": {},
             "message": "No predictions recorded yet"
         }), 200
     
-    breakdown = {"plastic": 0, "oil_spill": 0, "undetected": 0}
-    for pred_data in preds.values():
-        label = pred_data.get("predicted_label", "unknown")
-        if label in breakdown:
-            breakdown[label] += 1
-    
     return jsonify({
-        "total_predictions": len(preds),
+        "total_predictions": total,
         "breakdown": breakdown,
         "percentages": {
-            k: round((v / len(preds) * 100), 1) for k, v in breakdown.items()
+            k: round((v / total * 100), 1) for k, v in breakdown.items()
         }
     }, 200)
 
 @app.route('/api/config', methods=['GET'])
 def get_config():
     """Get current service configuration."""
+    model_mode, compiled, normalizes_input = model_settings()
     return jsonify({
         "tensorflow_available": TF_AVAILABLE,
-        "models_loaded": plastic_model is not None and oil_model is not None,
+        "models_loaded": models_ready(),
+        "backend": PRED_BACKEND,
+        "tflite_variant": TFLITE_VARIANT if PRED_BACKEND == 'tflite' else None,
+        "fast_decode": PRED_FAST_DECODE,
+        "stage_gates": stage_gates(),
+        "model_mode": model_mode,
+        "compiled_inference": compiled,
+        "normalize_in_graph": normalizes_input,
+        "inference_workers": INFERENCE_WORKERS,
+        "tf_runtime": TF_RUNTIME.effective(tf_module),
+        "model_load": {"mode": MODEL_LOAD_MODE, "state": model_state(), "ready_seconds": MODEL_LOAD_SECONDS},
         "target_size": TARGET_SIZE,
         "thresholds": {
             "plastic": PLASTIC_THRESHOLD,
@@ -702,29 +1429,42 @@ def get_config():
             "none": NONE_THRESHOLD
         },
         "cache_directory": CACHE_DIR,
-        "predictions_file": PREDICTIONS_FILE
+        "predictions_file": PREDICTIONS_FILE,
+        "prediction_store": {
+            "backend": prediction_store.backend,
+            "path": PRED_STORE_PATH if prediction_store.backend == 'sqlite' else PREDICTIONS_FILE
+        }
     }), 200
 
-def is_pure_water_only(img: Image.Image) -> bool:
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Runtime metrics for monitoring (micro-batching queues, prediction index, outbound fetches)."""
+    return jsonify({
+        "batching": {
+            "enabled": fused_batcher is not None or (plastic_batcher is not None and oil_batcher is not None),
+            "fused": fused_batcher.stats() if fused_batcher else None,
+            "plastic": plastic_batcher.stats() if plastic_batcher else None,
+            "oil": oil_batcher.stats() if oil_batcher else None
+        },
+        "prediction_index": prediction_index.stats(),
+        "gateway_fetch": dict(gateway_fetcher.stats(), mode=FETCH_MODE),
+        "http_client": get_client().stats(),
+        "image_cache": image_cache.stats(),
+        "fetch_singleflight": fetch_flight.stats(),
+        "model_input": input_packer.stats() if input_packer else None,
+        "inference_pool": inference_pool.stats() if inference_pool else None,
+        "classification_stages": dict(stage_counters.stats(), gates=stage_gates())
+    }), 200
+
+def is_pure_water_only(img) -> bool:
     """
     STRICT water detection - returns True ONLY for pure water images.
-    This is the absolute first check before any ML models.
+    Stage 2 of the staged classification (PRED_STAGE_STRICT_GATE).
     """
-    import colorsys
-    small = img.convert('RGB').resize((128, 128))
-    arr = np.array(small, dtype=np.float32) / 255.0
-    
-    mean_brightness = float(arr.mean())
-    r_mean = float(arr[:, :, 0].mean())
-    g_mean = float(arr[:, :, 1].mean())
-    b_mean = float(arr[:, :, 2].mean())
+    arr = ImagePipeline.wrap(img).float_array(WATER_STATS_SIZE)
     
-    sample = arr.reshape(-1, 3)
-    sats = []
-    for pix in sample:
-        hsv = colorsys.rgb_to_hsv(float(pix[0]), float(pix[1]), float(pix[2]))
-        sats.append(hsv[1])
-    mean_sat = float(np.mean(sats)) if sats else 0.0
+    mean_brightness, r_mean, g_mean, b_mean = channel_means(arr)
+    mean_sat = mean_saturation(arr)
     
     denom = (r_mean + g_mean + b_mean) if (r_mean + g_mean + b_mean) > 1e-6 else 1e-6
     blue_green_ratio = (b_mean + g_mean) / (denom / 3.0) if denom > 0 else 0.0
@@ -750,14 +1490,12 @@ def predict():
         return jsonify({"error": "No image file part 'image' provided"}), 400
 
     file = request.files['image']
-    try:
-        img = Image.open(io.BytesIO(file.read()))
-    except Exception as e:
-        return jsonify({"error": f"Invalid image: {e}"}), 400
-
     logging.info("=" * 60)
     logging.info("PREDICT: Processing image")
-    p_plastic, p_oil, predicted_label, meta = fallback_predict_from_pil(img)
+    try:
+        p_plastic, p_oil, predicted_label, meta = cached_predict(file.read())
+    except InvalidImageError as e:
+        return jsonify({"error": f"Invalid image: {e}"}), 400
     
     logging.info("RESULT: label=%s, plastic=%.4f, oil=%.4f", predicted_label, p_plastic, p_oil)
     logging.info("=" * 60)
@@ -804,7 +1542,7 @@ def predict_url():
         forward_headers['Authorization'] = auth_header
 
     try:
-        fetched = fetch_image_with_retries(image_url, forward_headers, timeout=15)
+        fetched = fetch_image(image_url, forward_headers)
         if isinstance(fetched, tuple):
             content, content_type = fetched
         else:
@@ -817,15 +1555,13 @@ def predict_url():
     if not isinstance(content, (bytes, bytearray)):
         return jsonify({"error": "Fetched content is not valid image bytes"}), 400
 
+    logging.info("=" * 60)
+    logging.info("PREDICT_URL: Processing image from URL")
     try:
-        img = Image.open(io.BytesIO(content)).convert('RGB')
-    except Exception as e:
+        p_plastic, p_oil, predicted_label, meta = cached_predict(bytes(content))
+    except InvalidImageError as e:
         logging.warning("Failed to open image: %s", e)
         return jsonify({"error": f"Failed to open fetched image: {e}"}), 400
-
-    logging.info("=" * 60)
-    logging.info("PREDICT_URL: Processing image from URL")
-    p_plastic, p_oil, predicted_label, meta = fallback_predict_from_pil(img)
     
     logging.info("RESULT: label=%s, plastic=%.4f, oil=%.4f", predicted_label, p_plastic, p_oil)
     logging.info("=" * 60)
@@ -849,6 +1585,72 @@ def predict_url():
         "timestamp": datetime.utcnow().isoformat()
     }), 200
 
+BATCH_FETCH_WORKERS = int(os.environ.get('PRED_BATCH_FETCH_WORKERS', 20))
+
+def _fetch_and_decode(image_url):
+    """Batch worker: fetch, check the prediction cache, decode on a miss."""
+    content, _ = fetch_image(image_url)
+    key, hit = cache_lookup(content)
+    if hit is not None:
+        return key, hit, None
+    return key, None, decode_image_bytes(content)
+
+def predict_urls(urls, workers=BATCH_FETCH_WORKERS):
+    """
+    Pipelined batch prediction: fetch + decode every URL on a bounded thread
+    pool, then run all decoded images through the models in one batched call.
+    Returns one (result, error) pair per URL, in input order; a failing URL
+    only affects its own entry.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    outcomes = [None] * len(urls)
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(urls)))) as pool:
+        futures = [pool.submit(_fetch_and_decode, url) for url in urls]
+        for idx, fut in enumerate(futures):
+            try:
+                outcomes[idx] = fut.result()
+            except Exception as e:
+                logging.warning("  [%d/%d] Failed: %s", idx+1, len(urls), e)
+                outcomes[idx] = e
+
+    results = [None] * len(urls)
+    decoded = []
+    for idx, outcome in enumerate(outcomes):
+        if isinstance(outcome, Exception):
+            results[idx] = (None, outcome)
+        elif outcome[1] is not None:
+            results[idx] = (outcome[1], None)
+        else:
+            decoded.append(idx)
+
+    if decoded:
+        preds = predict_pil_batch([outcomes[i][2] for i in decoded])
+        for idx, pred in zip(decoded, preds):
+            results[idx] = (cache_store(outcomes[idx][0], pred), None)
+    return results
+
+def batch_result_entry(image_url, result, error):
+    """One entry of a batch response / job result line."""
+    if error is not None:
+        return {
+            "url": image_url,
+            "success": False,
+            "error": str(error)
+        }
+    p_plastic, p_oil, label, meta = result
+    return {
+        "url": image_url,
+        "predicted_label": label,
+        "plastic_prob": round(p_plastic, 4),
+        "oil_prob": round(p_oil, 4),
+        "is_water": meta.get('is_water_like', False),
+        "success": True
+    }
+
+def predict_url_entries(urls):
+    return [batch_result_entry(url, result, error) for url, (result, error) in zip(urls, predict_urls(urls))]
+
 @app.route('/api/batch/predict', methods=['POST'])
 def batch_predict():
     """Batch prediction from multiple image URLs."""
@@ -864,36 +1666,8 @@ def batch_predict():
     if len(urls) > 20:
         return jsonify({"error": "Maximum 20 URLs per batch"}), 400
     
-    results = []
     logging.info("BATCH_PREDICT: Processing %d URLs", len(urls))
-    
-    for idx, image_url in enumerate(urls):
-        try:
-            logging.info("  [%d/%d] Processing: %s", idx+1, len(urls), image_url[:50])
-            fetched = fetch_image_with_retries(image_url, None, timeout=15)
-            if isinstance(fetched, tuple):
-                content, _ = fetched
-            else:
-                content = fetched
-            
-            img = Image.open(io.BytesIO(content)).convert('RGB')
-            p_plastic, p_oil, label, meta = fallback_predict_from_pil(img)
-            
-            results.append({
-                "url": image_url,
-                "predicted_label": label,
-                "plastic_prob": round(p_plastic, 4),
-                "oil_prob": round(p_oil, 4),
-                "is_water": meta.get('is_water_like', False),
-                "success": True
-            })
-        except Exception as e:
-            results.append({
-                "url": image_url,
-                "success": False,
-                "error": str(e)
-            })
-            logging.warning("  [%d/%d] Failed: %s", idx+1, len(urls), e)
+    results = predict_url_entries(urls)
     
     logging.info("BATCH_PREDICT: Completed %d/%d", sum(1 for r in results if r.get('success')), len(urls))
     
@@ -904,35 +1678,137 @@ def batch_predict():
         "results": results
     }), 200
 
-PREDICTIONS_FILE = os.path.join(os.path.dirname(__file__), 'predictions.json')
+# ==================== ASYNC BATCH JOBS ====================
+
+JOBS_DIR = os.environ.get('PRED_JOBS_DIR', os.path.join(os.path.dirname(__file__), 'batch_jobs'))
+JOB_WORKERS = int(os.environ.get('PRED_JOB_WORKERS', 2))
+JOB_CHUNK_SIZE = int(os.environ.get('PRED_JOB_CHUNK_SIZE', 20))
+JOB_MAX_URLS = int(os.environ.get('PRED_JOB_MAX_URLS', 1000000))
 
-def load_predictions():
-    if os.path.exists(PREDICTIONS_FILE):
+_job_manager = None
+_job_manager_lock = threading.Lock()
+
+def get_job_manager():
+    """
+    The JobManager, created (recovering interrupted jobs and starting its
+    workers) on first use. It is not created at import, so only the process
+    that serves requests runs jobs - not the Werkzeug reloader's parent.
+    """
+    global _job_manager
+    with _job_manager_lock:
+        if _job_manager is None:
+            _job_manager = JobManager(JOBS_DIR, predict_url_entries, workers=JOB_WORKERS,
+                                      chunk_size=JOB_CHUNK_SIZE)
+        return _job_manager
+
+class _TooManyUrls(Exception):
+    pass
+
+def _limited(urls):
+    for n, url in enumerate(urls, 1):
+        if n > JOB_MAX_URLS:
+            raise _TooManyUrls()
+        yield url
+
+@app.route('/api/batch/jobs', methods=['POST', 'GET'])
+def batch_jobs():
+    """
+    POST: create an async batch job. Body is JSON {"urls": [...]} or text/plain
+    with one URL per line (streamed to disk, for very large sets).
+    GET: list jobs.
+    """
+    job_manager = get_job_manager()
+    if request.method == 'GET':
+        return jsonify({"jobs": job_manager.list()}), 200
+
+    if request.mimetype == 'text/plain':
+        urls = (line.decode('utf-8').strip() for line in request.stream)
+        urls = (u for u in urls if u)
+    else:
         try:
-            import json
-            with open(PREDICTIONS_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except Exception:
-            logging.exception("Failed to read predictions file")
-            return {}
-    return {}
+            data = request.get_json(force=True)
+        except Exception as e:
+            return jsonify({"error": f"Invalid JSON: {e}"}), 400
+        urls = (data or {}).get('urls', [])
+        if not isinstance(urls, list):
+            return jsonify({"error": "Provide 'urls' as a list"}), 400
+        if not urls:
+            return jsonify({"error": "Provide at least one URL"}), 400
 
-def save_predictions(preds):
     try:
-        import json
-        with open(PREDICTIONS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(preds, f, indent=2)
+        state = job_manager.submit(_limited(urls))
+    except _TooManyUrls:
+        return jsonify({"error": f"Maximum {JOB_MAX_URLS} URLs per job"}), 400
+    except ValueError:  # a text/plain body with no URLs in it
+        return jsonify({"error": "Provide at least one URL"}), 400
+    return jsonify(state), 202
+
+@app.route('/api/batch/jobs/<job_id>', methods=['GET', 'DELETE'])
+def batch_job_status(job_id):
+    """GET: job progress. DELETE: cancel a queued/running job."""
+    job_manager = get_job_manager()
+    state = job_manager.cancel(job_id) if request.method == 'DELETE' else job_manager.get(job_id)
+    if state is None:
+        return jsonify({"error": "Job not found"}), 404
+    state["progress"] = round(state["completed"] / state["total"], 4) if state["total"] else 1.0
+    return jsonify(state), 200
+
+@app.route('/api/batch/jobs/<job_id>/results', methods=['GET'])
+def batch_job_results(job_id):
+    """
+    Stream job results as they complete: NDJSON by default, Server-Sent Events
+    with ?format=sse or Accept: text/event-stream. ?offset=<bytes> resumes a stream.
+    """
+    job_manager = get_job_manager()
+    if job_manager.get(job_id) is None:
+        return jsonify({"error": "Job not found"}), 404
+    offset = request.args.get('offset', 0, type=int)
+    sse = request.args.get('format') == 'sse' or request.accept_mimetypes.best == 'text/event-stream'
+
+    def generate():
+        for line in job_manager.iter_results(job_id, offset=offset):
+            yield f"data: {line}\n\n" if sse else line + "\n"
+        if sse:
+            yield f"event: done\ndata: {json.dumps(job_manager.get(job_id))}\n\n"
+
+    mimetype = 'text/event-stream' if sse else 'application/x-ndjson'
+    return Response(stream_with_context(generate()), mimetype=mimetype,
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+PREDICTIONS_FILE = os.path.join(os.path.dirname(__file__), 'predictions.json')
+
+# ----------------- Prediction store -----------------
+# sqlite: indexed upserts in predictions.db (WAL); predictions.json is imported
+# once on first start. json: legacy whole-file rewrite of predictions.json.
+PRED_STORE = os.environ.get('PRED_STORE', 'sqlite').lower()
+PRED_STORE_PATH = os.environ.get('PRED_STORE_PATH', os.path.join(os.path.dirname(__file__), 'predictions.db'))
+
+prediction_store = open_store(PRED_STORE, PREDICTIONS_FILE, PRED_STORE_PATH)
+# per-label counters for analytics/map/dashboard, updated on every save
+prediction_index = PredictionIndex(prediction_store)
+
+def prediction_counts():
+    """(total, breakdown) of stored predictions for the known labels; O(1)."""
+    total, counts = prediction_index.snapshot()
+    return total, {label: counts.get(label, 0) for label in ("plastic", "oil_spill", "undetected")}
+
+def save_prediction(report_id, entry):
+    try:
+        prediction_index.upsert(report_id, entry)
         return True
     except Exception:
-        logging.exception("Failed to write predictions file")
+        logging.exception("Failed to write prediction for report %s", report_id)
         return False
 
 @app.route('/api/reports/<report_id>/prediction', methods=['PUT', 'GET'])
 def persist_prediction(report_id):
     """Save or retrieve prediction."""
     if request.method == 'GET':
-        preds = load_predictions()
-        entry = preds.get(str(report_id))
+        try:
+            entry = prediction_index.get(report_id)
+        except Exception:
+            logging.exception("Failed to read prediction for report %s", report_id)
+            return jsonify({"error": "Prediction store unavailable"}), 500
         if not entry:
             return jsonify({"found": False}), 404
         return jsonify({"found": True, "report_id": report_id, "prediction": entry}), 200
@@ -950,9 +1826,7 @@ def persist_prediction(report_id):
         return jsonify({"error": "Missing 'predicted_label' in request body"}), 400
 
     label = str(data['predicted_label'])
-    preds = load_predictions()
-    preds[str(report_id)] = {"predicted_label": label, "saved_by": "predict_service", "forced": force_save}
-    ok = save_predictions(preds)
+    ok = save_prediction(report_id, {"predicted_label": label, "saved_by": "predict_service", "forced": force_save})
     if not ok:
         return jsonify({"success": False, "message": "Failed to save prediction"}), 500
     logging.info("Persisted prediction for report %s -> %s", report_id, label)
@@ -961,7 +1835,7 @@ def persist_prediction(report_id):
 @app.route('/api/pollution/map', methods=['GET'])
 def pollution_map_data():
     """Get pollution incidents for map visualization."""
-    preds = load_predictions()
+    total, breakdown = prediction_counts()
     
     pollution_hotspots = {
         "plastic": [
@@ -979,17 +1853,9 @@ def pollution_map_data():
         ]
     }
     
-    plastic_count = sum(1 for p in preds.values() if p.get("predicted_label") == "plastic")
-    oil_count = sum(1 for p in preds.values() if p.get("predicted_label") == "oil_spill")
-    undetected_count = sum(1 for p in preds.values() if p.get("predicted_label") == "undetected")
-    
     return jsonify({
-        "total_incidents": len(preds),
-        "by_type": {
-            "plastic": plastic_count,
-            "oil_spill": oil_count,
-            "undetected": undetected_count
-        },
+        "total_incidents": total,
+        "by_type": breakdown,
         "hotspots": pollution_hotspots,
         "last_updated": datetime.utcnow().isoformat()
     }), 200
@@ -997,6 +1863,7 @@ def pollution_map_data():
 @app.route('/', methods=['GET'])
 def dashboard_home():
     """Serve interactive dashboard UI."""
+    total, breakdown = prediction_counts()
     return render_template_string("""
     <!DOCTYPE html>
     <html>
@@ -1070,10 +1937,10 @@ def dashboard_home():
     </body>
     </html>
     """, tf_available=TF_AVAILABLE, plastic_thr=PLASTIC_THRESHOLD, oil_thr=OIL_THRESHOLD,
-        total_preds=len(load_predictions()), 
-        plastic_count=sum(1 for p in load_predictions().values() if p.get("predicted_label") == "plastic"),
-        oil_count=sum(1 for p in load_predictions().values() if p.get("predicted_label") == "oil_spill"),
-        undetected_count=sum(1 for p in load_predictions().values() if p.get("predicted_label") == "undetected")
+        total_preds=total,
+        plastic_count=breakdown["plastic"],
+        oil_count=breakdown["oil_spill"],
+        undetected_count=breakdown["undetected"]
     )
 
 @app.route('/docs', methods=['GET'])
@@ -1108,4 +1975,8 @@ if __name__ == '__main__':
     logging.info("=" * 70)
     
     port = int(os.environ.get('PREDICT_PORT', 5001))
+    # With debug=True the reloader's parent process only watches files; resume
+    # batch jobs in the child that serves requests.
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        get_job_manager()
     app.run(debug=True, host='0.0.0.0', port=port, threaded=True)
\ No newline at end of file
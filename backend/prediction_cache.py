@@ -0,0 +1,209 @@
+"""
+Marine DB Prediction Cache
+LRU + on-disk cache of prediction results keyed by SHA-256 of the image bytes
+plus a model/threshold version
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class PredictionCache:
+    """
+    Two-level prediction result cache.
+
+    Every entry is written through to <cache_dir>/<key>.json; an index of all
+    entries (key -> size, created) is kept in LRU order and bounded by
+    max_entries and max_bytes. The most recently used memory_entries results
+    are also held in memory. Entries older than ttl_seconds (0 = never) are
+    treated as misses.
+
+    version_fn returns a short string identifying the models and thresholds.
+    It is part of every key and, when it changes, the whole cache is dropped.
+    """
+
+    def __init__(self, cache_dir, version_fn, max_entries=10000, max_bytes=50 * 1024 * 1024,
+                 ttl_seconds=7 * 24 * 3600, memory_entries=1024):
+        self.cache_dir = cache_dir
+        self.version_fn = version_fn
+        self.max_entries = max(1, int(max_entries))
+        self.max_bytes = max(1, int(max_bytes))
+        self.ttl_seconds = max(0, int(ttl_seconds))
+        self.memory_entries = max(0, int(memory_entries))
+
+        self._lock = threading.Lock()
+        self._index = OrderedDict()   # key -> (size, created)
+        self._memory = OrderedDict()  # key -> result
+        self._bytes = 0
+        self._version = None
+        self._counters = {"hits": 0, "memory_hits": 0, "disk_hits": 0, "misses": 0,
+                          "stores": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_index()
+
+    # ---------- keys / versioning ----------
+
+    def key_for(self, content: bytes):
+        """Cache key for image bytes under the current model/threshold version."""
+        with self._lock:
+            version = self._check_version()
+        return f"{hashlib.sha256(content).hexdigest()}_{version}"
+
+    def _check_version(self):
+        version = self.version_fn()
+        if version != self._version:
+            # drops everything on a change, and stale entries left on disk at startup
+            stale = [k for k in self._index if not k.endswith(f"_{version}")]
+            if stale:
+                logging.info("Prediction cache version is now %s, invalidating %d entries", version, len(stale))
+                for key in stale:
+                    self._remove(key)
+                self._counters["invalidations"] += 1
+            self._version = version
+        return version
+
+    # ---------- public API ----------
+
+    def get(self, key):
+        """Return the cached result for key, or None."""
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None:
+                self._counters["misses"] += 1
+                return None
+            if self._expired(entry[1]):
+                self._remove(key)
+                self._counters["expirations"] += 1
+                self._counters["misses"] += 1
+                return None
+
+            self._index.move_to_end(key)
+            result = self._memory.get(key)
+            if result is not None:
+                self._memory.move_to_end(key)
+                self._counters["memory_hits"] += 1
+            else:
+                result = self._read(key)
+                if result is None:
+                    self._remove(key)
+                    self._counters["misses"] += 1
+                    return None
+                self._remember(key, result)
+                self._counters["disk_hits"] += 1
+            self._counters["hits"] += 1
+            return result
+
+    def put(self, key, result):
+        """Store a JSON-serialisable result under key."""
+        data = json.dumps({"key": key, "created": time.time(), "result": result}).encode('utf-8')
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            if not key.endswith(f"_{self._version}"):
+                return  # computed under an older version
+            if key in self._index:
+                self._remove(key)
+            path = self._path(key)
+            tmp = f"{path}.{threading.get_ident()}.tmp"
+            try:
+                with open(tmp, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp, path)
+            except OSError:
+                logging.exception("Failed to write prediction cache entry %s", key)
+                return
+            self._index[key] = (len(data), time.time())
+            self._bytes += len(data)
+            self._remember(key, result)
+            self._counters["stores"] += 1
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters,
+                        entries=len(self._index),
+                        memory_entries=len(self._memory),
+                        bytes=self._bytes,
+                        max_entries=self.max_entries,
+                        max_bytes=self.max_bytes,
+                        ttl_seconds=self.ttl_seconds,
+                        version=self._version,
+                        hit_rate=round(self._counters["hits"] /
+                                       max(1, self._counters["hits"] + self._counters["misses"]), 4))
+
+    # ---------- internals (lock held) ----------
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _expired(self, created):
+        return self.ttl_seconds > 0 and (time.time() - created) > self.ttl_seconds
+
+    def _remember(self, key, result):
+        if self.memory_entries == 0:
+            return
+        self._memory[key] = result
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _read(self, key):
+        try:
+            with open(self._path(key), 'r', encoding='utf-8') as f:
+                return json.load(f)["result"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _remove(self, key):
+        size, _ = self._index.pop(key, (0, 0))
+        self._bytes -= size
+        self._memory.pop(key, None)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _evict(self):
+        while self._index and (len(self._index) > self.max_entries or self._bytes > self.max_bytes):
+            key = next(iter(self._index))
+            self._remove(key)
+            self._counters["evictions"] += 1
+
+    def _clear(self):
+        for key in list(self._index):
+            self._remove(key)
+        self._memory.clear()
+
+    def _load_index(self):
+        """Rebuild the index from disk, oldest access first."""
+        entries = []
+        for fname in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, fname)
+            if fname.endswith('.tmp'):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+            if not fname.endswith('.json'):
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, fname[:-len('.json')], st.st_size))
+        for mtime, key, size in sorted(entries):
+            self._index[key] = (size, mtime)
+            self._bytes += size
+        with self._lock:
+            self._evict()
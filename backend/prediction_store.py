@@ -0,0 +1,307 @@
+"""
+Marine DB Prediction Store
+Pluggable persistence for per-report predictions (SQLite/WAL or legacy JSON file)
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+
+
+class PredictionStore(ABC):
+    """Interface: O(1) get/upsert by report id plus full iteration."""
+
+    backend = None
+
+    @abstractmethod
+    def get(self, report_id):
+        """Entry dict for report_id, or None."""
+
+    @abstractmethod
+    def upsert(self, report_id, entry):
+        """Insert or replace the entry for report_id."""
+
+    @abstractmethod
+    def items(self):
+        """Iterate (report_id, entry) pairs."""
+
+    @abstractmethod
+    def count(self):
+        """Number of entries."""
+
+    def label_counts(self):
+        """{predicted_label: count} over all entries."""
+        counts = {}
+        for _, entry in self.items():
+            label = entry.get('predicted_label', 'unknown')
+            counts[label] = counts.get(label, 0) + 1
+        return counts
+
+    @abstractmethod
+    def signature(self):
+        """Cheap value that changes whenever the backing files are modified."""
+
+    def all(self):
+        return dict(self.items())
+
+    def close(self):
+        pass
+
+
+class JsonFileStore(PredictionStore):
+    """
+    The original predictions.json format: whole-file read/rewrite on every
+    write (O(N)). Kept for compatibility; writes are locked and atomic.
+    """
+
+    backend = 'json'
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception:
+            logging.exception("Failed to read predictions file")
+            return {}
+
+    def get(self, report_id):
+        return self._load().get(str(report_id))
+
+    def upsert(self, report_id, entry):
+        with self._lock:
+            preds = self._load()
+            preds[str(report_id)] = entry
+            tmp = self.path + '.tmp'
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(preds, f, indent=2)
+            os.replace(tmp, self.path)
+
+    def items(self):
+        return iter(self._load().items())
+
+    def count(self):
+        return len(self._load())
+
+    def signature(self):
+        return _file_signature(self.path)
+
+
+class SQLiteStore(PredictionStore):
+    """
+    SQLite in WAL mode: indexed upsert/get by report id, atomic commits,
+    concurrent readers. Each thread gets its own connection.
+    """
+
+    backend = 'sqlite'
+
+    def __init__(self, path, synchronous='NORMAL'):
+        self.path = path
+        self.synchronous = synchronous
+        self._local = threading.local()
+        self._connections = []
+        self._conn_lock = threading.Lock()
+        conn = self._conn()
+        with conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS predictions (
+                                report_id TEXT PRIMARY KEY,
+                                predicted_label TEXT,
+                                data TEXT NOT NULL,
+                                updated_at REAL NOT NULL)""")
+            conn.execute("CREATE TABLE IF NOT EXISTS store_meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(f"PRAGMA synchronous={self.synchronous}")
+            self._local.conn = conn
+            with self._conn_lock:
+                self._connections.append(conn)
+        return conn
+
+    def get(self, report_id):
+        row = self._conn().execute("SELECT data FROM predictions WHERE report_id = ?",
+                                   (str(report_id),)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def upsert(self, report_id, entry):
+        conn = self._conn()
+        with conn:
+            conn.execute("""INSERT INTO predictions (report_id, predicted_label, data, updated_at)
+                            VALUES (?, ?, ?, ?)
+                            ON CONFLICT(report_id) DO UPDATE SET
+                                predicted_label = excluded.predicted_label,
+                                data = excluded.data,
+                                updated_at = excluded.updated_at""",
+                         (str(report_id), entry.get('predicted_label'), json.dumps(entry), time.time()))
+
+    def upsert_many(self, pairs):
+        """Upsert an iterable of (report_id, entry) in one transaction."""
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            conn.executemany("""INSERT INTO predictions (report_id, predicted_label, data, updated_at)
+                                VALUES (?, ?, ?, ?)
+                                ON CONFLICT(report_id) DO UPDATE SET
+                                    predicted_label = excluded.predicted_label,
+                                    data = excluded.data,
+                                    updated_at = excluded.updated_at""",
+                             ((str(k), v.get('predicted_label'), json.dumps(v), now) for k, v in pairs))
+
+    def items(self):
+        for report_id, data in self._conn().execute("SELECT report_id, data FROM predictions"):
+            yield report_id, json.loads(data)
+
+    def count(self):
+        return self._conn().execute("SELECT COUNT(*) FROM predictions").fetchone()[0]
+
+    def label_counts(self):
+        return {label if label is not None else 'unknown': n for label, n in self._conn().execute(
+            "SELECT predicted_label, COUNT(*) FROM predictions GROUP BY predicted_label")}
+
+    def signature(self):
+        # commits land in the -wal file until a checkpoint folds them back in
+        return _file_signature(self.path) + _file_signature(self.path + '-wal')
+
+    def get_meta(self, key):
+        row = self._conn().execute("SELECT value FROM store_meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key, value):
+        conn = self._conn()
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO store_meta (key, value) VALUES (?, ?)", (key, value))
+
+    def migrate_from_json(self, json_path):
+        """
+        One-time import of a legacy predictions.json. Recorded in store_meta so
+        it never runs twice; the JSON file is left in place as a backup.
+        Returns the number of imported entries.
+        """
+        if self.get_meta('migrated_from_json') is not None:
+            return 0
+        imported = 0
+        if os.path.exists(json_path) and os.path.getsize(json_path) > 0:
+            with open(json_path, 'r', encoding='utf-8') as f:
+                legacy = json.load(f)
+            self.upsert_many(legacy.items())
+            imported = len(legacy)
+            logging.info("Migrated %d predictions from %s to %s", imported, json_path, self.path)
+        self.set_meta('migrated_from_json', json.dumps({"path": json_path, "entries": imported,
+                                                        "at": time.time()}))
+        return imported
+
+    def close(self):
+        with self._conn_lock:
+            for conn in self._connections:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+            self._connections.clear()
+        self._local = threading.local()
+
+
+class PredictionIndex:
+    """
+    Process-wide per-label counters over a PredictionStore.
+
+    Writes made through upsert() adjust the counters incrementally. Reads are
+    O(1): they only compare the store's file signature (mtime/size) with the
+    one recorded after the last load or write, and rebuild the counters when
+    another process has modified the store.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._lock = threading.Lock()
+        self._counts = {}
+        self._total = 0
+        self._signature = None
+        self._reloads = 0
+        with self._lock:
+            self._reload()
+
+    def get(self, report_id):
+        return self.store.get(report_id)
+
+    def upsert(self, report_id, entry):
+        """Write through to the store and update the counters."""
+        with self._lock:
+            stale = self.store.signature() != self._signature
+            previous = self.store.get(report_id)
+            self.store.upsert(report_id, entry)
+            if stale:
+                self._reload()
+                return
+            if previous is not None:
+                self._bump(previous.get('predicted_label', 'unknown'), -1)
+            else:
+                self._total += 1
+            self._bump(entry.get('predicted_label', 'unknown'), 1)
+            self._signature = self.store.signature()
+
+    def snapshot(self):
+        """(total, {label: count}), reloading first if the store changed on disk."""
+        with self._lock:
+            if self.store.signature() != self._signature:
+                self._reload()
+            return self._total, dict(self._counts)
+
+    def stats(self):
+        with self._lock:
+            return {"total": self._total, "labels": len(self._counts), "reloads": self._reloads}
+
+    # ---------- internals (lock held) ----------
+
+    def _bump(self, label, delta):
+        n = self._counts.get(label, 0) + delta
+        if n > 0:
+            self._counts[label] = n
+        else:
+            self._counts.pop(label, None)
+
+    def _reload(self):
+        signature = self.store.signature()
+        try:
+            counts = self.store.label_counts()
+        except Exception:
+            logging.exception("Failed to rebuild prediction index")
+            return
+        self._counts = counts
+        self._total = sum(counts.values())
+        self._signature = signature
+        self._reloads += 1
+
+
+def _file_signature(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return (None, None)
+    return (st.st_mtime_ns, st.st_size)
+
+
+def open_store(backend, json_path, sqlite_path):
+    """Open the configured store ('sqlite' or 'json'), migrating legacy JSON into SQLite once."""
+    if backend == 'json':
+        return JsonFileStore(json_path)
+    if backend != 'sqlite':
+        raise ValueError(f"Unknown prediction store backend: {backend}")
+    store = SQLiteStore(sqlite_path)
+    try:
+        store.migrate_from_json(json_path)
+    except Exception:
+        logging.exception("Failed to migrate %s into SQLite store", json_path)
+    return store
@@ -1,9 +1,9 @@
 from flask import Blueprint, request, jsonify, current_app
 import os
-from PIL import Image
-import io
 import numpy as np
 import logging
+from inference import wrap_model
+from image_pipeline import ImagePipeline
 
 # Exact AI prompt (for reference / copy-paste to your LLM):
 # "Given an uploaded image from the authority dashboard, use the two pre-trained models
@@ -26,9 +26,11 @@ TARGET_SIZE = tuple(int(x) for x in os.environ.get('CLASSIFY_TARGET_SIZE', '128,
 _tf = None
 _plastic_model = None
 _oil_model = None
+_plastic_runner = None
+_oil_runner = None
 
 def ensure_models_loaded():
-    global _tf, _plastic_model, _oil_model
+    global _tf, _plastic_model, _oil_model, _plastic_runner, _oil_runner
     if _tf is None:
         try:
             import tensorflow as tf
@@ -41,17 +43,17 @@ def ensure_models_loaded():
         if not os.path.exists(PLASTIC_MODEL_PATH):
             raise FileNotFoundError(f"Plastic model not found: {PLASTIC_MODEL_PATH}")
         _plastic_model = _tf.keras.models.load_model(PLASTIC_MODEL_PATH)
+        _plastic_runner = wrap_model(_plastic_model, name='plastic')
 
     if _oil_model is None:
         if not os.path.exists(OIL_MODEL_PATH):
             raise FileNotFoundError(f"Oil model not found: {OIL_MODEL_PATH}")
         _oil_model = _tf.keras.models.load_model(OIL_MODEL_PATH)
+        _oil_runner = wrap_model(_oil_model, name='oil')
 
 def preprocess_image_file(file_stream, target_size=TARGET_SIZE):
     # uses TARGET_SIZE env var; normalization /255 by default (adjust if models expect different)
-    img = Image.open(io.BytesIO(file_stream.read())).convert('RGB').resize(target_size)
-    arr = np.array(img, dtype=np.float32) / 255.0
-    return np.expand_dims(arr, axis=0)
+    return ImagePipeline.decode(file_stream.read(), min_size=target_size).model_input(target_size)
 
 def interpret_model_output(pred):
     arr = np.asarray(pred)
@@ -160,8 +162,8 @@ def classify_image():
         return jsonify({"error": "Invalid image", "details": str(e)}), 400
 
     try:
-        p_plastic_raw = _plastic_model.predict(x)
-        p_oil_raw = _oil_model.predict(x)
+        p_plastic_raw = _plastic_runner.infer(x)
+        p_oil_raw = _oil_runner.infer(x)
         plastic_conf = interpret_model_output(p_plastic_raw)
         oil_conf = interpret_model_output(p_oil_raw)
         # debug log raw shapes/values
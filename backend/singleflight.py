@@ -0,0 +1,84 @@
+"""
+Marine DB Single Flight
+Coalesces concurrent calls for the same key into one execution
+"""
+
+import threading
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    do(key, fn) runs fn() once per key at a time: callers that arrive while a
+    call for the same key is in progress wait for it and receive the same
+    result (or the same exception) instead of running fn themselves.
+    Nothing is cached once the call finishes.
+    """
+
+    def __init__(self, name='singleflight'):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._counters = {"calls": 0, "executions": 0, "deduplicated": 0, "errors": 0, "max_waiters": 0}
+
+    def do(self, key, fn):
+        """Return (result, shared); shared is True if another caller's execution was reused."""
+        call, leader = self.begin(key)
+        if not leader:
+            return self.wait(call), True
+        try:
+            result = fn()
+        except BaseException as e:
+            self.finish(key, call, error=e)
+            raise
+        self.finish(key, call, result=result)
+        return result, False
+
+    def begin(self, key):
+        """
+        Lower-level form of do() for work that outlives a function call (e.g. a
+        streamed response): returns (call, leader). The leader must call
+        finish(); everybody else calls wait(call).
+        """
+        with self._lock:
+            self._counters["calls"] += 1
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self._counters["deduplicated"] += 1
+                self._counters["max_waiters"] = max(self._counters["max_waiters"], call.waiters)
+                return call, False
+            call = self._calls[key] = _Call()
+            self._counters["executions"] += 1
+            return call, True
+
+    def finish(self, key, call, result=None, error=None):
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+            if error is not None:
+                self._counters["errors"] += 1
+        call.result = result
+        call.error = error
+        call.done.set()
+
+    def wait(self, call, timeout=None):
+        """Block until the leader finishes; returns its result or raises its error."""
+        if not call.done.wait(timeout):
+            raise TimeoutError("Timed out waiting for in-flight call")
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, name=self.name, in_flight=len(self._calls))
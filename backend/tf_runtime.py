@@ -0,0 +1,128 @@
+"""
+Marine DB TF Runtime
+TensorFlow thread pool, oneDNN and CPU affinity settings, applied before models load
+"""
+
+import logging
+import os
+
+ONEDNN_CHOICES = ('', 'on', 'off')
+
+
+def parse_cpu_list(value):
+    """'0-3,8' -> [0, 1, 2, 3, 8]; '' -> None (leave affinity alone)."""
+    value = (value or '').strip()
+    if not value:
+        return None
+    cpus = set()
+    for part in value.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            lo, hi = (int(v) for v in part.split('-', 1))
+            if hi < lo:
+                raise ValueError(f"Bad CPU range {part!r}")
+            cpus.update(range(lo, hi + 1))
+        else:
+            cpus.add(int(part))
+    return sorted(cpus)
+
+
+def current_affinity():
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return None
+
+
+class RuntimeConfig:
+    """
+    Requested TensorFlow runtime settings for this process.
+
+    intra_op_threads / inter_op_threads: TF thread pool sizes (None keeps TF's
+    default, one thread per core for intra-op). onednn: 'on' / 'off' sets
+    TF_ENABLE_ONEDNN_OPTS, '' keeps TF's default. cpu_affinity: CPU ids this
+    process (and the threads it starts afterwards) may run on, None to leave
+    it alone.
+
+    apply_process() must run before `import tensorflow` (oneDNN and the
+    OpenMP/TF pool sizes are read from the environment at import) and before
+    any threads that should inherit the affinity are started;
+    apply_tensorflow(tf) must run before the first op, i.e. before models load.
+    """
+
+    def __init__(self, intra_op_threads=None, inter_op_threads=None, onednn='', cpu_affinity=None):
+        self.intra_op_threads = int(intra_op_threads) if intra_op_threads else None
+        self.inter_op_threads = int(inter_op_threads) if inter_op_threads else None
+        onednn = (onednn or '').strip().lower()
+        if onednn not in ONEDNN_CHOICES:
+            raise ValueError(f"oneDNN setting must be on, off or empty, got {onednn!r}")
+        self.onednn = onednn
+        self.cpu_affinity = list(cpu_affinity) if cpu_affinity else None
+        self.errors = []
+
+    @classmethod
+    def from_env(cls, environ=None):
+        env = os.environ if environ is None else environ
+        return cls(intra_op_threads=int(env.get('PRED_TF_INTRA_OP_THREADS', 0) or 0),
+                   inter_op_threads=int(env.get('PRED_TF_INTER_OP_THREADS', 0) or 0),
+                   onednn=env.get('PRED_TF_ONEDNN', ''),
+                   cpu_affinity=parse_cpu_list(env.get('PRED_CPU_AFFINITY', '')))
+
+    def requested(self):
+        return {
+            "intra_op_threads": self.intra_op_threads,
+            "inter_op_threads": self.inter_op_threads,
+            "onednn": self.onednn or None,
+            "cpu_affinity": self.cpu_affinity,
+        }
+
+    def apply_process(self):
+        """CPU affinity and the environment TensorFlow reads at import."""
+        if self.cpu_affinity is not None:
+            if hasattr(os, 'sched_setaffinity'):
+                try:
+                    os.sched_setaffinity(0, self.cpu_affinity)
+                except OSError as e:
+                    self._error(f"CPU affinity {self.cpu_affinity} not applied: {e}")
+            else:
+                self._error("CPU affinity is not supported on this platform")
+        if self.onednn:
+            os.environ['TF_ENABLE_ONEDNN_OPTS'] = '1' if self.onednn == 'on' else '0'
+        if self.intra_op_threads:
+            os.environ['TF_NUM_INTRAOP_THREADS'] = str(self.intra_op_threads)
+            os.environ['OMP_NUM_THREADS'] = str(self.intra_op_threads)
+        if self.inter_op_threads:
+            os.environ['TF_NUM_INTEROP_THREADS'] = str(self.inter_op_threads)
+
+    def apply_tensorflow(self, tf):
+        """Thread pool sizes through tf.config; fails once TF has run an op."""
+        try:
+            if self.intra_op_threads:
+                tf.config.threading.set_intra_op_parallelism_threads(self.intra_op_threads)
+            if self.inter_op_threads:
+                tf.config.threading.set_inter_op_parallelism_threads(self.inter_op_threads)
+        except RuntimeError as e:
+            self._error(f"TensorFlow threading not applied (runtime already initialised): {e}")
+
+    def effective(self, tf=None):
+        """Settings actually in force (TF's 0 means it picks the pool size itself)."""
+        affinity = current_affinity()
+        out = {
+            "requested": self.requested(),
+            "cpu_affinity": affinity,
+            "cpu_count": len(affinity) if affinity is not None else os.cpu_count(),
+            "onednn": {'1': 'on', '0': 'off'}.get(os.environ.get('TF_ENABLE_ONEDNN_OPTS'), 'default'),
+            "omp_num_threads": os.environ.get('OMP_NUM_THREADS'),
+            "intra_op_threads": None,
+            "inter_op_threads": None,
+            "errors": list(self.errors),
+        }
+        if tf is not None:
+            out["intra_op_threads"] = tf.config.threading.get_intra_op_parallelism_threads()
+            out["inter_op_threads"] = tf.config.threading.get_inter_op_parallelism_threads()
+        return out
+
+    def _error(self, message):
+        logging.warning(message)
+        self.errors.append(message)